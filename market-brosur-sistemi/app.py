@@ -78,6 +78,23 @@ CORS(app)
 # Initialize SQLite database
 database.init_db()
 
+# Resim depolama arka ucu: IMAGE_STORAGE_BACKEND=s3 kullanılamıyorsa başlatma durur
+# (yerel diske sessizce dönmek resim bankasını node'lar arasında böler)
+from services.storage import get_storage
+get_storage()
+
+# Depo resim indeksi hiç kurulmadıysa mevcut klasörlerden oluştur (arka planda)
+from services.depot_index import ensure_depot_index
+ensure_depot_index()
+
+# Artımlı depo temizliği / tutarlılık denetimi (arka planda, bütçeli adımlar)
+from services.depot_gc import start_depot_gc
+start_depot_gc()
+
+# Silinen ürünlerin dosyalarını arka planda kaldır (mezar taşları)
+from services.tombstones import start_tombstone_reaper
+start_tombstone_reaper()
+
 # ============= CORE BLUEPRINTS =============
 from routes.main import main_bp
 from routes.auth import auth_bp
@@ -178,6 +178,12 @@ def init_db():
         c.execute("ALTER TABLE admin_products ADD COLUMN market_price_tax REAL DEFAULT 0")
     except:
         pass
+    # Katalog dökümü (CAMGOZ/tedarikçi) alanları (migration)
+    for column_sql in ("brand TEXT DEFAULT ''", "image_url TEXT", "source TEXT DEFAULT 'admin'"):
+        try:
+            c.execute(f"ALTER TABLE admin_products ADD COLUMN {column_sql}")
+        except:
+            pass
     
     # CustomerCustomProduct - Musteri ozellestirmeleri
     c.execute('''CREATE TABLE IF NOT EXISTS customer_custom_products (
@@ -235,6 +241,157 @@ def init_db():
         FOREIGN KEY (user_id) REFERENCES users(id)
     )''')
     
+    # Arka plan barkod sorgu işleri (batch lookup jobs)
+    c.execute('''CREATE TABLE IF NOT EXISTS lookup_jobs (
+        id TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        sector TEXT DEFAULT 'supermarket',
+        auto_download INTEGER DEFAULT 1,
+        status TEXT DEFAULT 'queued',
+        total INTEGER DEFAULT 0,
+        processed INTEGER DEFAULT 0,
+        found INTEGER DEFAULT 0,
+        error TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        finished_at TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    )''')
+    
+    c.execute('''CREATE TABLE IF NOT EXISTS lookup_job_items (
+        job_id TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        barcode TEXT NOT NULL,
+        status TEXT DEFAULT 'pending',
+        result TEXT,
+        updated_at TIMESTAMP,
+        PRIMARY KEY (job_id, seq),
+        FOREIGN KEY (job_id) REFERENCES lookup_jobs(id)
+    )''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_lookup_job_items_status ON lookup_job_items(job_id, status)")
+
+    # Depo resim indeksi (static/uploads/{admin,customers,pending} dosya sistemi yerine)
+    c.execute('''CREATE TABLE IF NOT EXISTS depot_images (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        barcode TEXT NOT NULL,
+        depot_type TEXT NOT NULL,
+        user_id INTEGER NOT NULL DEFAULT 0,
+        sector TEXT NOT NULL,
+        product_group TEXT,
+        rel_path TEXT UNIQUE NOT NULL,
+        file_size INTEGER DEFAULT 0,
+        width INTEGER DEFAULT 0,
+        height INTEGER DEFAULT 0,
+        content_hash TEXT,
+        status TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_depot_images_lookup ON depot_images(barcode, depot_type, sector, user_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_depot_images_listing ON depot_images(depot_type, sector, user_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_depot_images_hash ON depot_images(content_hash)")
+
+    # Kayıtlı depo resim adresleri: dosya taşınınca / değişince adres aralığıyla bulunur
+    # (services/depot_index.py IMAGE_URL_COLUMNS)
+    for table, column in (('products', 'image_url'), ('customer_images', 'image_url'),
+                          ('admin_images', 'image_url'), ('admin_products', 'image_url'),
+                          ('customer_custom_products', 'custom_image')):
+        c.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table}({column})")
+
+    # Algısal hash'ler (64 bit, hex) - benzer resim arama (services/image_similarity.py)
+    try:
+        c.execute("ALTER TABLE depot_images ADD COLUMN phash TEXT")
+    except:
+        pass
+    try:
+        c.execute("ALTER TABLE depot_images ADD COLUMN dhash TEXT")
+    except:
+        pass
+
+    # Klasör metadata'sı (eskiden barkod klasörü başına metadata.json): toplu okunur
+    for column in ('product_name TEXT', 'display_group TEXT', 'uploader_id INTEGER', 'uploaded_at TEXT',
+                   'approved_at TEXT', 'rejected_at TEXT', 'source_url TEXT', 'original_filename TEXT',
+                   'quality TEXT', 'metadata TEXT'):
+        try:
+            c.execute(f"ALTER TABLE depot_images ADD COLUMN {column}")
+        except:
+            pass
+    c.execute("CREATE INDEX IF NOT EXISTS idx_depot_images_uploaded ON depot_images(depot_type, uploaded_at)")
+
+    # pHash bantları (8 x 8 bit): hamming araması için çoklu indeks
+    c.execute('''CREATE TABLE IF NOT EXISTS image_hash_bands (
+        band INTEGER NOT NULL,
+        value INTEGER NOT NULL,
+        content_hash TEXT NOT NULL,
+        PRIMARY KEY (band, value, content_hash)
+    ) WITHOUT ROWID''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_image_hash_bands_hash ON image_hash_bands(content_hash)")
+
+    # İçerik adresli resim deposu (static/uploads/blobs/ab/cd/<sha256>.png)
+    c.execute('''CREATE TABLE IF NOT EXISTS image_blobs (
+        content_hash TEXT PRIMARY KEY,
+        ext TEXT NOT NULL DEFAULT '.png',
+        file_size INTEGER DEFAULT 0,
+        refcount INTEGER NOT NULL DEFAULT 0,
+        unreferenced_at TIMESTAMP,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_image_blobs_gc ON image_blobs(refcount, unreferenced_at)")
+
+    # Silinen ürünler (mezar taşı): okumalarda gizlenir, dosyalar arka planda silinir
+    # (services/tombstones.py); tamamlanan kayıtlar denetim izi olarak kalır
+    c.execute('''CREATE TABLE IF NOT EXISTS product_tombstones (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        barcode TEXT NOT NULL,
+        requested_by INTEGER,
+        source TEXT,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT,
+        next_attempt_at TEXT,
+        claimed_until REAL,
+        stats TEXT,
+        created_at TEXT NOT NULL,
+        completed_at TEXT
+    )''')
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_product_tombstones_active ON product_tombstones(barcode) WHERE status != 'done'")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_product_tombstones_due ON product_tombstones(status, next_attempt_at)")
+
+    # Müşteri deposu kullanımı (depot_images ile aynı transaction'da artımlı güncellenir)
+    c.execute('''CREATE TABLE IF NOT EXISTS depot_usage (
+        user_id INTEGER NOT NULL,
+        sector TEXT NOT NULL,
+        files INTEGER NOT NULL DEFAULT 0,
+        bytes INTEGER NOT NULL DEFAULT 0,
+        updated_at TEXT,
+        PRIMARY KEY (user_id, sector)
+    ) WITHOUT ROWID''')
+
+    # Müşteriye özel depo kotaları (boş alan = varsayılan DEPOT_QUOTA_* değeri)
+    c.execute('''CREATE TABLE IF NOT EXISTS depot_quotas (
+        user_id INTEGER PRIMARY KEY,
+        soft_bytes INTEGER,
+        hard_bytes INTEGER,
+        soft_files INTEGER,
+        hard_files INTEGER,
+        updated_at TEXT
+    )''')
+
+    # Genel anahtar/değer durumu (indeks kurulum zamanı, arka plan imleçleri vb.)
+    c.execute('''CREATE TABLE IF NOT EXISTS app_state (
+        key TEXT PRIMARY KEY,
+        value TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+    # Sağlayıcı günlük çağrı sayacı (tüm worker'lar ortak; Google CSE günlük kotası)
+    c.execute('''CREATE TABLE IF NOT EXISTS provider_daily_calls (
+        provider TEXT NOT NULL,
+        day TEXT NOT NULL,
+        calls INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (provider, day)
+    ) WITHOUT ROWID''')
+
     admin_exists = c.execute("SELECT 1 FROM users WHERE role='admin' LIMIT 1").fetchone()
     if not admin_exists:
         c.execute("INSERT INTO users (email, password, name, role) VALUES (?, ?, ?, ?)",
@@ -848,3 +1005,176 @@ def search_customer_products_by_barcode(user_id, barcode):
             'image_url': product['image_url'] or ''
         }
     return None
+
+
+# ============= BARKOD SORGU İŞLERİ (LOOKUP JOBS) =============
+
+def create_lookup_job(job_id, user_id, barcodes, sector='supermarket', auto_download=True):
+    """
+    Create a lookup job with one pending item per barcode.
+    
+    Args:
+        job_id: Unique job ID
+        user_id: Owner user ID
+        barcodes: List of barcode strings (already cleaned)
+        sector: Sector for depot lookups
+        auto_download: Download images for found products
+    
+    Returns:
+        dict: Created job row
+    """
+    from datetime import datetime
+    now = datetime.now().isoformat()
+    
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute('''INSERT INTO lookup_jobs (id, user_id, sector, auto_download, status, total, created_at, updated_at)
+                     VALUES (?, ?, ?, ?, 'queued', ?, ?, ?)''',
+                  (job_id, user_id, sector, 1 if auto_download else 0, len(barcodes), now, now))
+        c.executemany('''INSERT INTO lookup_job_items (job_id, seq, barcode, status)
+                         VALUES (?, ?, ?, 'pending')''',
+                      [(job_id, seq, barcode) for seq, barcode in enumerate(barcodes, start=1)])
+        conn.commit()
+    return get_lookup_job(job_id)
+
+
+def get_lookup_job(job_id):
+    """Get lookup job row as dict (None if missing)"""
+    with get_db() as conn:
+        row = conn.execute("SELECT * FROM lookup_jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+
+def get_lookup_job_items(job_id, since_seq=0, only_finished=True, limit=None):
+    """
+    Get job items after a sequence number (for polling / SSE resume).
+    
+    Args:
+        job_id: Job ID
+        since_seq: Return items with seq > since_seq
+        only_finished: Skip items still pending
+        limit: Optional max item count
+    
+    Returns:
+        List of item dicts with parsed result
+    """
+    query = "SELECT seq, barcode, status, result, updated_at FROM lookup_job_items WHERE job_id = ? AND seq > ?"
+    params = [job_id, since_seq]
+    if only_finished:
+        query += " AND status != 'pending'"
+    query += " ORDER BY seq"
+    if limit:
+        query += " LIMIT ?"
+        params.append(int(limit))
+    
+    with get_db() as conn:
+        items = []
+        for row in conn.execute(query, params).fetchall():
+            item = dict(row)
+            item['result'] = json.loads(item['result']) if item['result'] else None
+            items.append(item)
+        return items
+
+
+def get_pending_lookup_job_items(job_id):
+    """Get (seq, barcode) pairs not processed yet"""
+    with get_db() as conn:
+        rows = conn.execute('''SELECT seq, barcode FROM lookup_job_items
+                                WHERE job_id = ? AND status = 'pending' ORDER BY seq''', (job_id,)).fetchall()
+        return [(row['seq'], row['barcode']) for row in rows]
+
+
+def save_lookup_job_item(job_id, seq, status, result, found=False):
+    """
+    Persist one item result and bump job counters in a single transaction.
+    """
+    from datetime import datetime
+    now = datetime.now().isoformat()
+    
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("""UPDATE lookup_job_items SET status = ?, result = ?, updated_at = ?
+                     WHERE job_id = ? AND seq = ? AND status = 'pending'""",
+                  (status, json.dumps(result, ensure_ascii=False), now, job_id, seq))
+        if c.rowcount:
+            c.execute('''UPDATE lookup_jobs SET processed = processed + 1, found = found + ?, updated_at = ?
+                         WHERE id = ?''', (1 if found else 0, now, job_id))
+        conn.commit()
+
+
+def update_lookup_job_status(job_id, status, error=None, expected_status=None):
+    """
+    Update job status.
+    
+    Args:
+        job_id: Job ID
+        status: New status (queued, running, completed, cancelled, failed)
+        error: Optional error message
+        expected_status: Only update if current status is one of these
+    
+    Returns:
+        bool: True if a row was updated
+    """
+    from datetime import datetime
+    now = datetime.now().isoformat()
+    finished_at = now if status in ('completed', 'cancelled', 'failed') else None
+    
+    query = "UPDATE lookup_jobs SET status = ?, error = ?, updated_at = ?, finished_at = ? WHERE id = ?"
+    params = [status, error, now, finished_at, job_id]
+    if expected_status:
+        expected = [expected_status] if isinstance(expected_status, str) else list(expected_status)
+        query += f" AND status IN ({','.join('?' * len(expected))})"
+        params.extend(expected)
+    
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute(query, params)
+        conn.commit()
+        return c.rowcount > 0
+
+
+# ============= UYGULAMA DURUMU (APP STATE) =============
+
+def get_app_state(key, default=None):
+    """Read a value from the app_state key/value table"""
+    with get_db() as conn:
+        row = conn.execute("SELECT value FROM app_state WHERE key = ?", (key,)).fetchone()
+        return row['value'] if row else default
+
+
+def set_app_state(key, value):
+    """Insert or replace a value in the app_state key/value table"""
+    with get_db() as conn:
+        conn.execute('''INSERT INTO app_state (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+                        ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = CURRENT_TIMESTAMP''',
+                     (key, value))
+        conn.commit()
+
+
+def delete_app_state(key):
+    """Remove a key from app_state"""
+    with get_db() as conn:
+        conn.execute("DELETE FROM app_state WHERE key = ?", (key,))
+        conn.commit()
+
+
+# ============= SAĞLAYICI ÇAĞRI SAYACI =============
+
+def increment_provider_calls(provider, day=None):
+    """Count one upstream call of `provider` on `day` (default today), across all workers"""
+    from datetime import date
+    day = day or date.today().isoformat()
+    with get_db() as conn:
+        conn.execute('''INSERT INTO provider_daily_calls (provider, day, calls) VALUES (?, ?, 1)
+                        ON CONFLICT(provider, day) DO UPDATE SET calls = calls + 1''', (provider, day))
+        conn.commit()
+
+
+def get_provider_calls(provider, day=None):
+    """Upstream calls of `provider` on `day` (default today), all workers"""
+    from datetime import date
+    day = day or date.today().isoformat()
+    with get_db() as conn:
+        row = conn.execute("SELECT calls FROM provider_daily_calls WHERE provider = ? AND day = ?",
+                           (provider, day)).fetchone()
+        return row['calls'] if row else 0
@@ -2,3 +2,10 @@ bind = "0.0.0.0:10000"
 workers = 3
 threads = 3
 timeout = 120
+
+
+def post_fork(server, worker):
+    """REMBG_PRELOAD: load the background removal model in each worker"""
+    from services.image_processor import REMBG_PRELOAD, preload_rembg_session
+    if REMBG_PRELOAD:
+        preload_rembg_session()
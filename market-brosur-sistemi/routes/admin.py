@@ -3,10 +3,8 @@
 Admin routes - Admin panel, user management, product approval
 """
 
-from flask import Blueprint, render_template, request, jsonify, redirect, send_file, make_response
+from flask import Blueprint, render_template, request, jsonify, redirect, send_file, make_response, Response, stream_with_context
 from datetime import datetime
-from io import BytesIO
-from PIL import Image
 import sqlite3
 import logging
 import shutil
@@ -17,9 +15,26 @@ import re
 import database
 from utils.helpers import get_current_user, safe_join, ensure_sector_dirs
 from utils.constants import SECTORS, get_product_groups_for_sector
+from services.external_api import get_lookup_metrics_snapshot
+from services.lookup_metrics import render_prometheus, reset_lookup_metrics
+from services.barcode_prefetch import get_prefetch_stats
+from services.depot_index import (
+    find_depot_image,
+    list_depot_images,
+    set_folder_metadata
+)
+from services.image_derivatives import DERIVATIVE_SIZES, get_derivative
+from services.blob_store import local_image_path
+from services.depot_archive import export_archive, export_filename, import_archive
+from services.depot_gc import run_gc_step, get_gc_report
+from services.tombstones import tombstone_product, list_tombstones, retry_tombstone
+from services.depot_usage import QUOTA_FIELDS, get_usage, list_usage, set_quota
 
 admin_bp = Blueprint('admin', __name__)
 
+# Sürümlü (?v=<hash>) resim istekleri için önbellek süresi (1 yıl)
+DERIVATIVE_MAX_AGE = 365 * 24 * 3600
+
 def normalize_image_url(image_url):
     if not image_url:
         return None
@@ -524,20 +539,12 @@ def admin_products_by_sector():
             return jsonify({'success': False, 'error': 'Unauthorized'}), 403
         
         sector = request.args.get('sector', 'supermarket')
-        sector_path = os.path.join('static', 'uploads', 'admin', sector)
         
-        products = []
-        if os.path.exists(sector_path):
-            for barcode in os.listdir(sector_path):
-                barcode_path = os.path.join(sector_path, barcode)
-                if os.path.isdir(barcode_path):
-                    img_files = [f for f in os.listdir(barcode_path) if f.lower().endswith(('.jpg', '.png', '.jpeg'))]
-                    if img_files:
-                        products.append({
-                            'barcode': barcode,
-                            'sector': sector,
-                            'image_url': f'/static/uploads/admin/{sector}/{barcode}/{img_files[0]}'
-                        })
+        products = [{
+            'barcode': image['barcode'],
+            'sector': sector,
+            'image_url': image['image_url']
+        } for image in list_depot_images('admin', sector=sector)]
         
         return jsonify({'success': True, 'products': products})
     except Exception as e:
@@ -562,14 +569,11 @@ def admin_pending_approvals():
             sector = product.get('user_sector', 'supermarket')
             group = product.get('product_group', 'Genel')
             
-            # Pending klasöründe resim var mı kontrol et
-            pending_path = os.path.join('static', 'uploads', 'pending', sector, group, barcode)
+            # Pending deposunda resim var mı kontrol et (depo indeksi)
             image_url = product.get('image_url', '')
-            
-            if os.path.exists(pending_path):
-                img_files = [f for f in os.listdir(pending_path) if f.lower().endswith(('.jpg', '.png', '.jpeg'))]
-                if img_files:
-                    image_url = f'/static/uploads/pending/{sector}/{group}/{barcode}/{img_files[0]}'
+            pending_image = find_depot_image('pending', barcode, sector, group=group)
+            if pending_image:
+                image_url = pending_image['image_url']
             
             pending_items.append({
                 'id': product.get('id'),
@@ -596,67 +600,51 @@ def admin_pending_approvals():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
-def get_product_info(folder_path, barcode, sector, source, customer_id):
-    """Extract product info from a folder"""
+def _image_quality(width, height):
+    min_dim = min(width or 0, height or 0)
+    if not min_dim:
+        return 'unknown'
+    if min_dim >= 1024:
+        return 'high'
+    if min_dim >= 512:
+        return 'medium'
+    return 'low'
+
+
+def get_product_info(image, source, customer_id):
+    """Build a product listing entry from a depot index row"""
     try:
-        if not os.path.exists(folder_path):
-            return None
-        
-        # Önce metadata kontrolü yap - metadata varsa ürünü döndür (resim olmasa bile)
-        metadata_path = os.path.join(folder_path, 'metadata.json')
-        metadata = {}
-        if os.path.exists(metadata_path):
-            try:
-                with open(metadata_path, 'r', encoding='utf-8') as f:
-                    metadata = json.load(f)
-            except Exception as meta_error:
-                logging.warning(f"Pending metadata parse error for {barcode}: {meta_error}")
-        
-        # Resim dosyalarını kontrol et
-        img_files = [f for f in os.listdir(folder_path) 
-                    if f.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.webp'))]
-        
-        if not img_files:
-            return None
-        
-        stat = os.stat(folder_path)
-        last_modified = datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M')
-        
-        # Resim kalitesini kontrol et
-        image_quality = 'unknown'
-        if img_files:
-            try:
-                img_path = os.path.join(folder_path, img_files[0])
-                with Image.open(img_path) as img:
-                    width, height = img.size
-                    min_dim = min(width, height)
-                    if min_dim >= 1024:
-                        image_quality = 'high'
-                    elif min_dim >= 512:
-                        image_quality = 'medium'
-                    else:
-                        image_quality = 'low'
-            except:
-                pass
-        
-        product_name = metadata.get('product_name') or metadata.get('name') or barcode
-        product_group = metadata.get('product_group') or metadata.get('group') or 'Belirtilmedi'
-        image_file = img_files[0]
-        image_url = f'/static/uploads/pending/{sector}/{barcode}/{image_file}'
+        if image['sector'] == 'ai_generated':
+            return {
+                'barcode': image['barcode'],
+                'product_name': 'AI Generated',
+                'sector': 'ai_generated',
+                'sector_name': 'AI Uretim',
+                'product_group': 'AI',
+                'source': source,
+                'customer_id': customer_id,
+                'last_modified': str(image['updated_at'] or '')[:16],
+                'has_image': True,
+                'image_quality': _image_quality(image['width'], image['height'])
+            }
+        
+        product_name = image['product_name'] or image['barcode']
+        product_group = image['display_group'] or image['product_group'] or 'Belirtilmedi'
         
         return {
-            'barcode': barcode,
+            'barcode': image['barcode'],
             'product_name': product_name,
-            'sector': sector,
-            'sector_name': SECTORS.get(sector, sector.capitalize()),
+            'sector': image['sector'],
+            'sector_name': SECTORS.get(image['sector'], image['sector'].capitalize()),
             'product_group': product_group,
             'source': source,
             'customer_id': customer_id,
-            'last_modified': last_modified,
+            'last_modified': str(image['updated_at'] or '')[:16],
             'has_image': True,
-            'image_quality': image_quality,
+            'image_quality': _image_quality(image['width'], image['height']),
             'image_handler': 'fs',
-            'image_url': image_url,
+            'image_url': image['image_url'],
+            'image_version': (image['content_hash'] or '')[:12],
             'allow_edit': True
         }
     except Exception as e:
@@ -677,72 +665,19 @@ def admin_all_products():
         source_filter = request.args.get('source', '')
         
         products = []
-        base_path = os.path.join('static', 'uploads')
-        
-        # 1. Scan ADMIN folders
-        admin_base = os.path.join(base_path, 'admin')
-        if os.path.exists(admin_base):
-            for sector in os.listdir(admin_base):
-                sector_path = os.path.join(admin_base, sector)
-                if os.path.isdir(sector_path) and sector in SECTORS:
-                    for barcode in os.listdir(sector_path):
-                        barcode_path = os.path.join(sector_path, barcode)
-                        if os.path.isdir(barcode_path):
-                            product = get_product_info(barcode_path, barcode, sector, 'admin', None)
-                            if product:
-                                products.append(product)
-        
-        # 2. PENDING klasörü artık taranmıyor
-        # Pending ürünler /api/admin/pending-approvals endpoint'inden geliyor
-        # (approval_status='pending' olan DB kayıtları)
-        
-        # 3. Scan CUSTOMERS folders
-        customers_base = os.path.join(base_path, 'customers')
-        if os.path.exists(customers_base):
-            for customer_id in os.listdir(customers_base):
-                customer_path = os.path.join(customers_base, customer_id)
-                if os.path.isdir(customer_path):
-                    for sector in os.listdir(customer_path):
-                        sector_path = os.path.join(customer_path, sector)
-                        if os.path.isdir(sector_path):
-                            if sector in SECTORS:
-                                for barcode in os.listdir(sector_path):
-                                    barcode_path = os.path.join(sector_path, barcode)
-                                    if os.path.isdir(barcode_path):
-                                        product = get_product_info(barcode_path, barcode, sector, 'customer', customer_id)
-                                        if product:
-                                            products.append(product)
-                            elif sector == 'ai_generated':
-                                for img_file in os.listdir(sector_path):
-                                    if img_file.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.webp')):
-                                        img_path = os.path.join(sector_path, img_file)
-                                        barcode = os.path.splitext(img_file)[0]
-                                        stat = os.stat(img_path)
-                                        image_quality = 'unknown'
-                                        try:
-                                            with Image.open(img_path) as img:
-                                                width, height = img.size
-                                                min_dim = min(width, height)
-                                                if min_dim >= 1024:
-                                                    image_quality = 'high'
-                                                elif min_dim >= 512:
-                                                    image_quality = 'medium'
-                                                else:
-                                                    image_quality = 'low'
-                                        except:
-                                            pass
-                                        products.append({
-                                            'barcode': barcode,
-                                            'product_name': 'AI Generated',
-                                            'sector': 'ai_generated',
-                                            'sector_name': 'AI Uretim',
-                                            'product_group': 'AI',
-                                            'source': 'customer',
-                                            'customer_id': customer_id,
-                                            'last_modified': datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M'),
-                                            'has_image': True,
-                                            'image_quality': image_quality
-                                        })
+        
+        # 1-3. ADMIN ve CUSTOMERS depoları (depo indeksi, klasör taraması yok)
+        # PENDING deposu listelenmiyor; pending ürünler /api/admin/pending-approvals
+        # endpoint'inden geliyor (approval_status='pending' olan DB kayıtları)
+        for image in list_depot_images('admin'):
+            product = get_product_info(image, 'admin', None)
+            if product:
+                products.append(product)
+        
+        for image in list_depot_images('customer'):
+            product = get_product_info(image, 'customer', str(image['user_id']))
+            if product:
+                products.append(product)
         
         # 4. Fetch products from database (customer & admin depots)
         # NOT: Sadece onaylanmış ürünleri getir (pending olanlar ayrı listede)
@@ -867,36 +802,35 @@ def admin_get_image():
         if not resolved_path.startswith(base_path):
             return jsonify({'success': False, 'error': 'Invalid path'}), 400
         
-        if not os.path.exists(folder_path) or not os.path.isdir(folder_path):
-            return jsonify({'success': False, 'error': 'Folder not found'}), 404
-        
-        img_files = [f for f in os.listdir(folder_path) 
-                    if f.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.webp'))]
-        
-        if not img_files:
+        # Depo indeksinden bul (gruplu {sector}/{group}/{barcode} klasörleri dahil)
+        image = find_depot_image(path_type, barcode, sector, user_id=customer_id or 0)
+        if not image:
             return jsonify({'success': False, 'error': 'No image found'}), 404
         
-        image_path = safe_join(folder_path, img_files[0])
-        if image_path is None or not os.path.abspath(image_path).startswith(base_path):
+        image_path = image['image_path']
+        if not os.path.abspath(image_path).startswith(base_path):
             return jsonify({'success': False, 'error': 'Invalid image path'}), 400
+        # Bu düğümde yoksa uzak depodan (içerik hash'i ile) alınır
+        image_path = local_image_path(image)
+        if not image_path:
+            return jsonify({'success': False, 'error': 'No image found'}), 404
         
-        if size == 'thumb':
-            try:
-                img = Image.open(image_path)
-                img.thumbnail((150, 150), Image.Resampling.LANCZOS)
-                
-                img_io = BytesIO()
-                img.save(img_io, 'JPEG', quality=85)
-                img_io.seek(0)
-                
-                response = make_response(send_file(img_io, mimetype='image/jpeg'))
-                response.headers['Cache-Control'] = 'public, max-age=3600'
-                return response
-            except Exception as e:
-                logging.error(f"Thumbnail error: {str(e)}")
-                return send_file(image_path)
-        
-        return send_file(image_path)
+        # Türevler kaynak hash'ine göre bir kez üretilir; sonraki istekler dosyayı doğrudan sunar
+        content_hash = image.get('content_hash') or ''
+        serve_path, mimetype, etag = image_path, None, content_hash[:16] or True
+        if size in DERIVATIVE_SIZES:
+            derivative = get_derivative(content_hash, image_path, size)
+            if derivative:
+                serve_path, mimetype, etag = derivative, 'image/jpeg', f'{content_hash[:16]}-{size}'
+        
+        response = make_response(send_file(serve_path, mimetype=mimetype, conditional=True, etag=etag))
+        # ?v=<hash12> ile istenen adres içerikle birlikte değişir -> uzun süre önbelleklenebilir
+        version = request.args.get('v', '')
+        if version and content_hash.startswith(version):
+            response.headers['Cache-Control'] = f'public, max-age={DERIVATIVE_MAX_AGE}, immutable'
+        else:
+            response.headers['Cache-Control'] = 'public, max-age=300'
+        return response
         
     except Exception as e:
         logging.error(f"Get image error: {str(e)}")
@@ -1105,50 +1039,21 @@ def admin_update_product():
         else:
             return jsonify({'success': False, 'error': 'Invalid source'}), 400
         
-        if folder_path is None:
+        if folder_path is None or (source == 'customer' and not str(customer_id).isdigit()):
             return jsonify({'success': False, 'error': 'Invalid path'}), 400
         
-        if not os.path.exists(folder_path):
-            os.makedirs(folder_path, exist_ok=True)
-        
         # VALIDATION: Check if product_group is valid (not empty and not 'Genel')
         if not product_group or product_group.strip() == '' or product_group.strip() == 'Genel':
             return jsonify({'success': False, 'error': 'Ürün grubu seçilmelidir. Lütfen sektöre uygun bir ürün grubu seçin.'}), 400
         
-        # VALIDATION: Check if image exists in folder
-        img_files = [f for f in os.listdir(folder_path) 
-                    if f.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.webp'))] if os.path.exists(folder_path) else []
-        
-        if not img_files:
+        # VALIDATION: Check if image exists (any group; metadata indeksteki satırlara yazılır)
+        image = find_depot_image(source, barcode, sector, user_id=customer_id if source == 'customer' else 0)
+        if not image:
             return jsonify({'success': False, 'error': 'Ürün resmi zorunludur. Lütfen önce ürün resmini yükleyin.'}), 400
-        
-        metadata_path = os.path.join(folder_path, 'metadata.json')
-        
-        metadata = {}
-        if os.path.exists(metadata_path):
-            try:
-                with open(metadata_path, 'r', encoding='utf-8') as f:
-                    metadata = json.load(f)
-            except:
-                pass
-        
-        metadata['product_name'] = product_name
-        metadata['name'] = product_name
-        metadata['product_group'] = product_group
-        metadata['group'] = product_group
-        metadata['updated_at'] = datetime.now().isoformat()
-        
-        with open(metadata_path, 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, ensure_ascii=False, indent=2)
+        folder_path = image['folder']
+        set_folder_metadata(folder_path, {'product_name': product_name, 'group': product_group})
         
         logging.info(f"Product {barcode} updated: {product_name} in sector {sector} at {folder_path}")
-        logging.info(f"Metadata file created: {metadata_path}")
-        
-        # Klasörün ve metadata dosyasının oluşturulduğunu doğrula
-        if os.path.exists(metadata_path):
-            logging.info(f"✅ Metadata file verified: {metadata_path}")
-        else:
-            logging.error(f"❌ Metadata file NOT found: {metadata_path}")
         
         return jsonify({'success': True, 'message': 'Product updated', 'sector': sector, 'barcode': barcode})
         
@@ -1159,142 +1064,37 @@ def admin_update_product():
 
 @admin_bp.route('/api/admin/delete-product', methods=['POST'])
 def admin_delete_product():
-    """Delete a product"""
+    """
+    Delete a product (all depots, all sectors).
+    The barcode is tombstoned: DB rows are removed and its depot images are
+    hidden immediately; files are removed in the background
+    (services/tombstones.py).
+    """
     try:
         user = get_current_user()
         if not user or user.get('role') != 'admin':
             return jsonify({'success': False, 'error': 'Unauthorized'}), 403
         
-        data = request.get_json()
-        barcode = data.get('barcode')
-        sector = data.get('sector', 'supermarket')
+        data = request.get_json() or {}
+        barcode = str(data.get('barcode') or '').strip()
         source = data.get('source', 'admin_depot')
-        customer_id = data.get('customer_id', '')
         
-        logging.info(f"🗑️ Delete request: barcode={barcode}, sector={sector}, source={source}, customer_id={customer_id}")
+        logging.info(f"🗑️ Delete request: barcode={barcode}, source={source}, customer_id={data.get('customer_id', '')}")
         
         if not barcode:
             return jsonify({'success': False, 'error': 'Barcode required'}), 400
         
-        deleted = False
-        import shutil
-        import glob
-        
-        # TÜM SEKTÖRLERDE ve TÜM KAYNAKLARDA ara ve sil
-        base_path = os.path.abspath(os.path.join('static', 'uploads'))
-        data_path = os.path.abspath('data')
-        
-        # Tüm sektörler listesi
-        all_sectors = list(SECTORS.keys()) if 'SECTORS' in globals() else ['supermarket', 'giyim', 'teknoloji', 'kozmetik', 'evyasam', 'elsanatlari', 'restoran', 'diger']
-        
-        # 1. ADMIN klasörlerinden sil (tüm sektörlerde)
-        admin_base = os.path.join(base_path, 'admin')
-        if os.path.exists(admin_base):
-            for sec in all_sectors:
-                product_path = os.path.join(admin_base, sec, barcode)
-                if os.path.exists(product_path):
-                    try:
-                        shutil.rmtree(product_path)
-                        deleted = True
-                        logging.info(f"🗑️ Deleted from admin/{sec}: {barcode}")
-                    except Exception as e:
-                        logging.error(f"Error deleting {product_path}: {e}")
-        
-        # 2. PENDING klasörlerinden sil (tüm sektörlerde)
-        pending_base = os.path.join(base_path, 'pending')
-        if os.path.exists(pending_base):
-            for sec in all_sectors:
-                product_path = os.path.join(pending_base, sec, barcode)
-                if os.path.exists(product_path):
-                    try:
-                        shutil.rmtree(product_path)
-                        deleted = True
-                        logging.info(f"🗑️ Deleted from pending/{sec}: {barcode}")
-                    except Exception as e:
-                        logging.error(f"Error deleting {product_path}: {e}")
-        
-        # 3. CUSTOMERS klasörlerinden sil (tüm müşteriler, tüm sektörler)
-        customers_base = os.path.join(base_path, 'customers')
-        if os.path.exists(customers_base):
-            for customer_dir in os.listdir(customers_base):
-                customer_path = os.path.join(customers_base, customer_dir)
-                if os.path.isdir(customer_path):
-                    for sec in all_sectors:
-                        product_path = os.path.join(customer_path, sec, barcode)
-                        if os.path.exists(product_path):
-                            try:
-                                shutil.rmtree(product_path)
-                                deleted = True
-                                logging.info(f"🗑️ Deleted from customers/{customer_dir}/{sec}: {barcode}")
-                            except Exception as e:
-                                logging.error(f"Error deleting {product_path}: {e}")
-        
-        # 4. data/ klasöründen sil (eğer varsa)
-        if os.path.exists(data_path):
-            for root, dirs, files in os.walk(data_path):
-                if barcode in dirs:
-                    product_path = os.path.join(root, barcode)
-                    try:
-                        shutil.rmtree(product_path)
-                        deleted = True
-                        logging.info(f"🗑️ Deleted from data: {product_path}")
-                    except Exception as e:
-                        logging.error(f"Error deleting {product_path}: {e}")
-        
-        # 5. Cache dosyalarını sil
-        cache_dir = os.path.join(base_path, 'cache')
-        if os.path.exists(cache_dir):
-            cache_patterns = [
-                os.path.join(cache_dir, f'{barcode}*.json'),
-                os.path.join(cache_dir, f'{barcode}*.png'),
-                os.path.join(cache_dir, f'{barcode}*.jpg'),
-                os.path.join(cache_dir, f'{barcode}*.jpeg'),
-            ]
-            for pattern in cache_patterns:
-                for cache_file in glob.glob(pattern):
-                    try:
-                        os.remove(cache_file)
-                        deleted = True
-                        logging.info(f"🗑️ Deleted cache: {cache_file}")
-                    except Exception as ce:
-                        logging.warning(f"Cache delete warning: {ce}")
-        
-        # 6. VERİTABANINDAN TAMAMEN SİL (tüm tablolardan)
-        try:
-            conn = sqlite3.connect('brosur.db')
-            c = conn.cursor()
-            
-            # Tüm tablolardan sil
-            tables_to_clean = [
-                'products',
-                'customer_images',
-                'admin_images',
-                'admin_products',
-                'barcode_verifications'
-            ]
-            
-            for table in tables_to_clean:
-                try:
-                    c.execute(f"DELETE FROM {table} WHERE barcode = ?", (barcode,))
-                    if c.rowcount > 0:
-                        deleted = True
-                        logging.info(f"🗑️ Deleted from database table {table}: {barcode} ({c.rowcount} rows)")
-                except Exception as table_e:
-                    logging.warning(f"Could not delete from {table}: {table_e}")
-            
-            conn.commit()
-            conn.close()
-            logging.info(f"✅ Database cleanup completed for barcode: {barcode}")
-        except Exception as db_e:
-            logging.error(f"Database delete error: {db_e}")
-        
-        if deleted:
-            return jsonify({'success': True, 'message': 'Ürün silindi'})
-        else:
-            # Log what paths were checked
-            logging.warning(f"❌ Product not found in any path: {possible_paths}")
+        result = tombstone_product(barcode, requested_by=user['id'], source=source)
+        if not result['success']:
             return jsonify({'success': False, 'error': 'Ürün bulunamadı'}), 404
         
+        return jsonify({
+            'success': True,
+            'message': 'Ürün silindi',
+            'tombstone_id': result['tombstone_id'],
+            'rows_deleted': result['rows_deleted']
+        })
+        
     except Exception as e:
         logging.error(f"Delete product error: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -1494,3 +1294,239 @@ def api_generate_customer_link():
         logging.error(f"Generate customer link error: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+
+# ============= DEPOT EXPORT / IMPORT =============
+
+@admin_bp.route('/api/admin/depot/export')
+def api_admin_depot_export():
+    """
+    Stream a tar of depot images (admin only).
+    Query: depot=admin|customer|pending, customer_id, sector,
+    since=<ISO timestamp> (incremental)
+    """
+    user = get_current_user()
+    if not user or user.get('role') != 'admin':
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 403
+    
+    depot = request.args.get('depot') or None
+    customer_id = request.args.get('customer_id', '')
+    sector = request.args.get('sector') or None
+    since = request.args.get('since') or None
+    
+    if depot and depot not in ('admin', 'customer', 'pending'):
+        return jsonify({'success': False, 'error': 'Invalid depot'}), 400
+    if customer_id and not customer_id.isdigit():
+        return jsonify({'success': False, 'error': 'Invalid customer_id'}), 400
+    if sector and sector not in SECTORS:
+        return jsonify({'success': False, 'error': 'Invalid sector'}), 400
+    if since:
+        try:
+            datetime.fromisoformat(since)
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Invalid since timestamp'}), 400
+    
+    user_id = int(customer_id) if customer_id else None
+    filename = export_filename(depot, user_id, sector, since)
+    response = Response(stream_with_context(export_archive(depot, user_id, sector, since)),
+                        mimetype='application/x-tar')
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+@admin_bp.route('/api/admin/depot/import', methods=['POST'])
+def api_admin_depot_import():
+    """
+    Import a depot tar (admin only): multipart field 'archive' or the raw
+    request body (Content-Type: application/x-tar), read as a stream.
+    """
+    user = get_current_user()
+    if not user or user.get('role') != 'admin':
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 403
+    
+    try:
+        if request.files.get('archive'):
+            source = request.files['archive'].stream
+        else:
+            source = request.stream
+        
+        result = import_archive(source)
+        status = 200 if result['success'] else (400 if 'error' in result else 207)
+        return jsonify(result), status
+        
+    except Exception as e:
+        logging.error(f"Depot import error: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+# ============= DEPOT GC =============
+
+@admin_bp.route('/api/admin/depot/gc', methods=['GET', 'POST'])
+def api_admin_depot_gc():
+    """
+    Depot GC / consistency report (admin only). POST runs one budgeted
+    step; optional JSON: time_budget (seconds), io_budget (operations).
+    """
+    user = get_current_user()
+    if not user or user.get('role') != 'admin':
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 403
+    
+    try:
+        if request.method == 'GET':
+            return jsonify({'success': True, **get_gc_report()})
+        
+        data = request.get_json(silent=True) or {}
+        # İstek içinde kısa tutulur: tam tur arka planda / CLI ile
+        time_budget = min(float(data.get('time_budget', 2)), 10)
+        io_budget = min(int(data.get('io_budget', 1000)), 5000)
+        result = run_gc_step(time_budget, io_budget)
+        return jsonify(result), 200 if result['success'] else 500
+        
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'Invalid budget'}), 400
+    except Exception as e:
+        logging.error(f"Depot GC error: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+# ============= DEPOT USAGE =============
+
+@admin_bp.route('/api/admin/depot/usage')
+def api_admin_depot_usage():
+    """
+    Customer depot usage and quotas (admin only).
+    Query: user_id (one customer, per-sector breakdown) or
+           order=bytes|files, limit (largest customers first)
+    """
+    user = get_current_user()
+    if not user or user.get('role') != 'admin':
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 403
+    
+    try:
+        user_id = request.args.get('user_id', type=int)
+        if user_id:
+            return jsonify({'success': True, **get_usage(user_id)})
+        limit = min(request.args.get('limit', 100, type=int), 1000)
+        usage = list_usage(limit, request.args.get('order', 'bytes'))
+        return jsonify({'success': True, 'customers': usage, 'count': len(usage)})
+        
+    except Exception as e:
+        logging.error(f"Depot usage error: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@admin_bp.route('/api/admin/depot/usage/<int:user_id>/quota', methods=['POST'])
+def api_admin_depot_quota(user_id):
+    """
+    Set a customer's depot quota (admin only).
+    JSON: soft_bytes, hard_bytes, soft_files, hard_files (0 = unlimited,
+    null = back to the DEPOT_QUOTA_* default)
+    """
+    user = get_current_user()
+    if not user or user.get('role') != 'admin':
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 403
+    
+    try:
+        data = request.get_json(silent=True) or {}
+        limits = {field: data[field] for field in QUOTA_FIELDS if field in data}
+        if not limits:
+            return jsonify({'success': False, 'error': f'One of {", ".join(QUOTA_FIELDS)} required'}), 400
+        if any(value is not None and int(value) < 0 for value in limits.values()):
+            return jsonify({'success': False, 'error': 'Quota must be >= 0'}), 400
+        quota = set_quota(user_id, **limits)
+        logging.info(f"📊 Depot quota of user {user_id} set by admin {user['id']}: {limits}")
+        return jsonify({'success': True, 'user_id': user_id, 'quota': quota})
+        
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'Invalid quota'}), 400
+    except Exception as e:
+        logging.error(f"Set depot quota error: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+# ============= PRODUCT TOMBSTONES =============
+
+@admin_bp.route('/api/admin/tombstones')
+def api_admin_tombstones():
+    """
+    Product deletion audit log (admin only).
+    Query: status=pending|failed|done, barcode, limit
+    """
+    user = get_current_user()
+    if not user or user.get('role') != 'admin':
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 403
+    
+    try:
+        status = request.args.get('status') or None
+        if status and status not in ('pending', 'failed', 'done'):
+            return jsonify({'success': False, 'error': 'Invalid status'}), 400
+        limit = min(request.args.get('limit', 100, type=int), 1000)
+        tombstones = list_tombstones(status, request.args.get('barcode') or None, limit)
+        return jsonify({'success': True, 'tombstones': tombstones, 'count': len(tombstones)})
+        
+    except Exception as e:
+        logging.error(f"List tombstones error: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@admin_bp.route('/api/admin/tombstones/<int:tombstone_id>/retry', methods=['POST'])
+def api_admin_tombstone_retry(tombstone_id):
+    """Re-queue a failed product deletion (admin only)"""
+    user = get_current_user()
+    if not user or user.get('role') != 'admin':
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 403
+    
+    if not retry_tombstone(tombstone_id):
+        return jsonify({'success': False, 'error': 'Failed tombstone not found'}), 404
+    return jsonify({'success': True})
+
+
+# ============= LOOKUP METRICS =============
+
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+
+@admin_bp.route('/api/admin/lookup-metrics', methods=['GET', 'DELETE'])
+def api_admin_lookup_metrics():
+    """
+    Lookup tier hit ratios, latency histograms, provider error/timeout
+    rates and remaining quotas (admin only). DELETE resets counters.
+    Values belong to the worker process that served the request.
+    """
+    user = get_current_user()
+    if not user or user.get('role') != 'admin':
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 403
+    
+    try:
+        if request.method == 'DELETE':
+            reset_lookup_metrics()
+            return jsonify({'success': True, 'message': 'Metrikler sıfırlandı'})
+        
+        snapshot = get_lookup_metrics_snapshot()
+        snapshot['prefetch'] = get_prefetch_stats()
+        return jsonify({'success': True, 'metrics': snapshot})
+        
+    except Exception as e:
+        logging.error(f"Lookup metrics error: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@admin_bp.route('/metrics')
+def metrics_endpoint():
+    """
+    Prometheus scrape endpoint.
+    Auth: "Authorization: Bearer <METRICS_TOKEN>" or admin session.
+    """
+    auth_header = request.headers.get('Authorization', '')
+    token_ok = bool(METRICS_TOKEN) and auth_header == f'Bearer {METRICS_TOKEN}'
+    
+    if not token_ok:
+        user = get_current_user()
+        if not user or user.get('role') != 'admin':
+            return jsonify({'success': False, 'error': 'Unauthorized'}), 403
+    
+    body = render_prometheus(get_lookup_metrics_snapshot())
+    response = make_response(body)
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
@@ -3,7 +3,7 @@
 Image Bank routes - Image depot management, upload, approval workflow
 """
 
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify, send_file, send_from_directory, current_app, redirect, abort
 from werkzeug.utils import secure_filename
 import logging
 import os
@@ -12,6 +12,7 @@ from utils.helpers import get_current_user, safe_join
 from utils.constants import SECTORS, ALLOWED_IMAGE_EXTENSIONS
 from services.image_bank import (
     search_image_hierarchy,
+    resolve_images,
     save_to_customer_depot,
     save_to_admin_depot,
     approve_pending_image,
@@ -21,6 +22,18 @@ from services.image_bank import (
     get_customer_images,
     delete_image_from_depot
 )
+from services.depot_index import find_image_by_path
+from services.depot_usage import QuotaExceeded, get_usage
+from services.image_derivatives import VARIANT_FORMATS, supported_variant_formats, get_variant, variant_path
+from services.blob_store import blob_url, local_image_path
+from services.storage import get_storage
+from services.image_similarity import (
+    SIMILAR_DISTANCE,
+    MAX_SIMILAR_DISTANCE,
+    compute_hashes,
+    find_similar,
+    find_similar_to_path
+)
 
 image_bank_bp = Blueprint('image_bank', __name__)
 
@@ -95,11 +108,7 @@ def api_image_bank_batch_search():
         if sector not in SECTORS:
             sector = 'supermarket'
         
-        results = {}
-        for barcode in barcodes:
-            barcode = str(barcode).strip()
-            if barcode:
-                results[barcode] = search_image_hierarchy(barcode, user['id'], sector)
+        results = resolve_images(user['id'], sector, barcodes)
         
         return jsonify({
             'success': True,
@@ -129,6 +138,9 @@ def api_image_bank_upload():
     Returns:
         image_url: str - URL to the saved image
         pending: bool - Whether image is pending approval
+        quota_warning: list - Soft quota limits ('bytes' / 'files') exceeded, if any
+    
+    Rejected with 413 when the upload would exceed the customer's hard quota.
     """
     user = get_current_user()
     if not user:
@@ -159,22 +171,32 @@ def api_image_bank_upload():
         # Read file data
         image_data = file.read()
         
-        # Save to customer depot (also copies to pending)
-        result = save_to_customer_depot(
-            user_id=user['id'],
-            sector=sector,
-            barcode=barcode,
-            image_data=image_data,
-            filename='product.png'
-        )
+        # Save to customer depot (also copies to pending); kota orada kontrol edilir
+        try:
+            result = save_to_customer_depot(
+                user_id=user['id'],
+                sector=sector,
+                barcode=barcode,
+                image_data=image_data,
+                filename='product.png'
+            )
+        except QuotaExceeded as e:
+            logging.warning(f"⛔ Depot quota exceeded: user {user['id']} ({', '.join(e.quota['hard_exceeded'])})")
+            return jsonify({'success': False, 'error': 'Storage quota exceeded',
+                            'usage': e.quota['usage'], 'quota': e.quota['quota']}), 413
         
         if result['success']:
-            return jsonify({
+            response = {
                 'success': True,
                 'image_url': result['customer_url'],
-                'pending': result['pending'],
+                'pending': True,
+                'similar_admin': result.get('similar_admin', []),
                 'message': 'Image uploaded and sent for approval'
-            })
+            }
+            if result.get('quota_warning'):
+                logging.info(f"⚠️ Depot soft quota exceeded: user {user['id']} ({', '.join(result['quota_warning'])})")
+                response['quota_warning'] = result['quota_warning']
+            return jsonify(response)
         else:
             return jsonify({'success': False, 'error': result.get('error', 'Upload failed')}), 500
         
@@ -382,6 +404,69 @@ def api_image_bank_by_sector():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@image_bank_bp.route('/api/image-bank/admin/similar', methods=['GET', 'POST'])
+def api_image_bank_similar():
+    """
+    Find visually similar depot images (perceptual hash).
+    
+    GET query params:
+        image: str - Depot image URL or path (already indexed)
+    POST form:
+        image: file - Image to compare (not stored)
+    Common params:
+        depot: str - admin | customer | pending (optional)
+        sector: str - Product sector (optional)
+        max_distance: int - Hamming distance (0-7, default 6)
+    """
+    user = get_current_user()
+    if not user or user.get('role') != 'admin':
+        return jsonify({'success': False, 'error': 'Admin access required'}), 403
+    
+    try:
+        params = request.values
+        depot = params.get('depot') or None
+        sector = params.get('sector') or None
+        max_distance = int(params.get('max_distance', SIMILAR_DISTANCE))
+        
+        if depot and depot not in ('admin', 'customer', 'pending'):
+            return jsonify({'success': False, 'error': 'Invalid depot'}), 400
+        if sector and sector not in SECTORS:
+            return jsonify({'success': False, 'error': 'Invalid sector'}), 400
+        if not 0 <= max_distance <= MAX_SIMILAR_DISTANCE:
+            return jsonify({'success': False, 'error': f'max_distance must be 0-{MAX_SIMILAR_DISTANCE}'}), 400
+        
+        filters = {'depot_type': depot, 'sector': sector, 'max_distance': max_distance}
+        if request.method == 'POST':
+            if 'image' not in request.files:
+                return jsonify({'success': False, 'error': 'No image uploaded'}), 400
+            try:
+                hashes = compute_hashes(request.files['image'].read())
+            except Exception:
+                return jsonify({'success': False, 'error': 'Invalid image data'}), 400
+            matches = find_similar(hashes['phash'], hashes['dhash'], **filters)
+        else:
+            image = params.get('image', '').strip()
+            if not image:
+                return jsonify({'success': False, 'error': 'image required'}), 400
+            hashes = None
+            matches = find_similar_to_path(image, **filters)
+            if matches is None:
+                return jsonify({'success': False, 'error': 'Image not found in depot index'}), 404
+        
+        return jsonify({
+            'success': True,
+            'matches': matches,
+            'count': len(matches),
+            **({'phash': hashes['phash'], 'dhash': hashes['dhash']} if hashes else {})
+        })
+        
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid max_distance'}), 400
+    except Exception as e:
+        logging.error(f"Similar images error: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 # ============= CUSTOMER DEPOT =============
 
 @image_bank_bp.route('/api/image-bank/my-images')
@@ -415,6 +500,20 @@ def api_image_bank_my_images():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@image_bank_bp.route('/api/image-bank/my-usage')
+def api_image_bank_my_usage():
+    """Current user's depot usage (files / bytes per sector) and quota"""
+    user = get_current_user()
+    if not user:
+        return jsonify({'success': False, 'error': 'Not authenticated'}), 401
+    
+    try:
+        return jsonify({'success': True, **get_usage(user['id'])})
+    except Exception as e:
+        logging.error(f"Get my usage error: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @image_bank_bp.route('/api/image-bank/delete', methods=['POST'])
 def api_image_bank_delete():
     """
@@ -459,3 +558,82 @@ def api_image_bank_delete():
         logging.error(f"Delete image error: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+
+
+# ============= DEPOT IMAGE SERVING =============
+
+# Sürümlü (?v=<hash>) adresler içerikle birlikte değişir: 1 yıl, immutable
+IMMUTABLE_CACHE_CONTROL = f'public, max-age={365 * 24 * 3600}, immutable'
+# Sürümsüz / eski sürümlü adresler her seferinde ETag ile doğrulanır
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+# Uzak depolamada orijinaller nesne deposuna yönlendirilir (presigned / public URL)
+IMAGE_STORAGE_REDIRECT = os.environ.get('IMAGE_STORAGE_REDIRECT', 'true').lower() in ('1', 'true', 'yes')
+
+
+# Flask'ın /static kuralından daha özel olduğu için depo resimleri bu route'tan sunulur
+@image_bank_bp.route('/static/uploads/<any(admin, customers, pending):depot>/<path:filename>')
+def serve_depot_image(depot, filename):
+    """
+    Serve a depot image as AVIF/WebP when the browser accepts it
+    (Vary: Accept), otherwise the original PNG/JPEG. Variants keep alpha
+    and are encoded once per content hash (services/image_derivatives.py),
+    in the background: until the preferred format exists the next best
+    one is served and only cached for revalidation.
+
+    ETags are derived from the content hash (strong, per format);
+    If-None-Match / If-Modified-Since are answered with 304. Requests
+    whose ?v= matches the current hash are cached as immutable.
+
+    With a remote storage backend the original is served by redirecting to
+    the object store (IMAGE_STORAGE_REDIRECT), and files this node does
+    not have are fetched by content hash.
+    """
+    upload_root = os.path.join(current_app.root_path, 'static', 'uploads')
+    rel_path = f'{depot}/{filename}'
+    image = find_image_by_path(rel_path)
+    if image is None and find_image_by_path(rel_path, include_tombstoned=True):
+        # Silinmiş ürün: dosyası arka planda kaldırılana kadar da sunulmaz
+        abort(404)
+    content_hash = (image or {}).get('content_hash') or ''
+    version = request.args.get('v', '')
+    storage = get_storage()
+
+    response = None
+    warming = False
+    if content_hash:
+        accepted = {mimetype for mimetype, quality in request.accept_mimetypes if quality > 0}
+        formats = [fmt for fmt in supported_variant_formats() if VARIANT_FORMATS[fmt]['mimetype'] in accepted]
+        source = local_image_path(image) if formats else None
+        for fmt in formats if source else []:
+            variant = get_variant(content_hash, source, fmt, wait=False)
+            if variant:
+                response = send_file(os.path.abspath(variant), mimetype=VARIANT_FORMATS[fmt]['mimetype'],
+                                     conditional=True, etag=f'{content_hash[:16]}-{fmt}')
+                break
+            # Tercih edilen format arka planda kodlanıyor: yedek yanıt kalıcı önbelleğe alınmaz
+            warming = warming or not os.path.exists(variant_path(content_hash, fmt))
+
+        local_missing = not os.path.exists(os.path.join(upload_root, depot, filename))
+        if response is None and storage.remote and (IMAGE_STORAGE_REDIRECT or local_missing):
+            remote_url = blob_url(content_hash)
+            if remote_url:
+                # Baytlar Flask worker'larından geçmez
+                response = redirect(remote_url, 302)
+                response.headers['Cache-Control'] = REVALIDATE_CACHE_CONTROL
+                response.headers['Vary'] = 'Accept'
+                return response
+        if response is None and local_missing:
+            source = local_image_path(image)
+            if source:
+                response = send_file(os.path.abspath(source), conditional=True, etag=content_hash[:16])
+
+    if response is None:
+        response = send_from_directory(upload_root, rel_path, conditional=True,
+                                       etag=content_hash[:16] if content_hash else True)
+
+    if content_hash and version and content_hash.startswith(version) and not warming:
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    else:
+        response.headers['Cache-Control'] = REVALIDATE_CACHE_CONTROL
+    response.headers['Vary'] = 'Accept'
+    return response
@@ -6,6 +6,7 @@ Main routes - Core page routes (temizlenmiş)
 from flask import Blueprint, render_template, redirect, session, send_file, request, abort, make_response
 import requests
 from utils.helpers import get_current_user
+from services.image_fetch import rewrite_image_url
 
 main_bp = Blueprint('main', __name__)
 
@@ -139,7 +140,7 @@ def proxy_image():
         abort(400, description='Invalid image URL')
 
     try:
-        resp = requests.get(image_url, timeout=10)
+        resp = requests.get(rewrite_image_url(image_url), timeout=10)
         resp.raise_for_status()
     except requests.RequestException:
         abort(502, description='Failed to fetch image')
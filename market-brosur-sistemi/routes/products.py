@@ -3,7 +3,7 @@
 Product routes - Product CRUD, upload, image management
 """
 
-from flask import Blueprint, request, jsonify, render_template
+from flask import Blueprint, request, jsonify, render_template, Response, stream_with_context
 from werkzeug.utils import secure_filename
 from datetime import datetime
 import pandas as pd
@@ -24,9 +24,21 @@ from services.excel_io import parse_excel_file
 from services.external_api import (
     full_barcode_lookup,
     batch_barcode_lookup,
-    get_market_price_comparison
+    get_market_price_comparison,
+    batch_market_price_comparison
 )
-from services.image_bank import search_image_hierarchy
+from services.image_bank import search_image_hierarchy, resolve_images, find_depot_folder
+from services.depot_index import index_image, index_transaction, image_url_for, to_rel_path
+from services.blob_store import write_depot_file
+from services.image_derivatives import warm_derivatives
+from services.lookup_jobs import (
+    submit_lookup_job,
+    get_lookup_job_progress,
+    cancel_lookup_job,
+    resume_lookup_job
+)
+from services.barcode_prefetch import enqueue_prefetch
+from services.approval import bulk_approve_products
 
 products_bp = Blueprint('products', __name__)
 
@@ -34,6 +46,16 @@ STAGE_ONE_MAX_PRODUCTS = 500
 STAGE_ONE_PAGE_CAPACITY = 12
 PENDING_ROOT = Path('static') / 'uploads' / 'pending'
 DEPOT_SOURCES = {'customer_depot', 'admin_depot'}
+# SSE bağlantısı bu süreden sonra kapanır, EventSource Last-Event-ID ile yeniden bağlanır
+# (bağlantı bir gthread worker thread'ini tutar; toplam 9 thread var, kısa tutulur)
+LOOKUP_JOB_STREAM_SECONDS = 20
+LOOKUP_JOB_STREAM_POLL_SECONDS = 1.0
+
+
+def _prefetch_requested():
+    """Per-upload prefetch opt-in (form field or query param prefetch=1)"""
+    value = request.form.get('prefetch') or request.args.get('prefetch') or ''
+    return value.lower() in ('1', 'true', 'yes', 'on')
 
 
 def _parse_price(value):
@@ -239,6 +261,12 @@ def api_upload_products():
         df = pd.read_excel(file)
         products = []
         
+        # Tüm barkodların depo resimlerini tek seferde çöz (müşteri → admin deposu)
+        depot_images = resolve_images(
+            user['id'], user.get('sector', 'supermarket'),
+            [str(row.get('Barkod', row.get('barcode', ''))).strip() for _, row in df.iterrows()]
+        )
+        
         for idx, row in df.iterrows():
             barcode = str(row.get('Barkod', row.get('barcode', ''))).strip()
             name = str(row.get('Ürün Adı', row.get('name', row.get('Ürün', '')))).strip()
@@ -247,8 +275,13 @@ def api_upload_products():
             product_group = str(row.get('Grup', row.get('group', ''))).strip()
             
             if barcode and name:
-                # Find image for product
-                image_info = database.find_image(barcode, user['id'])
+                # Find image for product (depo indeksi, yoksa eski resim tabloları)
+                depot_image = depot_images.get(barcode)
+                if depot_image and depot_image['found']:
+                    image_info = {'source': depot_image['source'].replace('_depot', ''),
+                                  'url': depot_image['image_url']}
+                else:
+                    image_info = database.find_image(barcode, user['id'])
                 image_url = image_info['url'] if image_info else ''
                 image_source = image_info['source'] if image_info else 'none'
                 
@@ -347,14 +380,17 @@ def api_upload_product_image():
             sector = 'supermarket'
         
         # Save to pending folder
-        folder_path = os.path.join('static', 'uploads', 'pending', sector, barcode)
+        folder_path = find_depot_folder('pending', sector, None, barcode)
         os.makedirs(folder_path, exist_ok=True)
         
         filename = 'product.jpg'
         file_path = os.path.join(folder_path, filename)
-        file.save(file_path)
+        with index_transaction() as conn:
+            content_hash = write_depot_file(file_path, file.read())
+            index_image(file_path, status='pending', conn=conn, content_hash=content_hash)
+        warm_derivatives(content_hash, file_path)
         
-        image_url = f'/static/uploads/pending/{sector}/{barcode}/{filename}'
+        image_url = image_url_for(to_rel_path(file_path), content_hash)
         
         return jsonify({'success': True, 'image_url': image_url})
         
@@ -802,6 +838,14 @@ def api_pre_approval_upload_csv():
             with open(metadata_file, 'w', encoding='utf-8') as f:
                 json.dump(existing_products, f, ensure_ascii=False, indent=2)
         
+        # Opt-in: yeni barkodları arka planda CAMGOZ önbelleğine ısıt
+        prefetch_queued = enqueue_prefetch(
+            [p['barcode'] for p in products],
+            user_id,
+            user.get('sector', 'supermarket'),
+            force=_prefetch_requested()
+        )
+        
         message_parts = []
         if products:
             message_parts.append(f'{len(products)} products added')
@@ -814,6 +858,7 @@ def api_pre_approval_upload_csv():
             'success': len(products) > 0,
             'count': len(products),
             'duplicates': duplicates_skipped,
+            'prefetch_queued': prefetch_queued,
             'errors': validation_errors[:10],
             'message': ', '.join(message_parts) if message_parts else 'No products added'
         })
@@ -907,6 +952,14 @@ def api_pre_approval_upload_excel():
                 with open(metadata_file, 'w', encoding='utf-8') as f:
                     json.dump(existing_products, f, ensure_ascii=False, indent=2)
             
+            # Opt-in: yeni barkodları arka planda CAMGOZ önbelleğine ısıt
+            prefetch_queued = enqueue_prefetch(
+                [p['barcode'] for p in new_products],
+                user_id,
+                user.get('sector', 'supermarket'),
+                force=_prefetch_requested()
+            )
+            
             message_parts = []
             if new_products:
                 message_parts.append(f'{len(new_products)} yeni ürün')
@@ -922,6 +975,7 @@ def api_pre_approval_upload_excel():
                 'count': total_added,
                 'new_count': len(new_products),
                 'existing_count': len(existing_in_list),
+                'prefetch_queued': prefetch_queued,
                 'products': all_products_to_add,  # Ürün listesi döndür
                 'errors': validation_errors[:10],
                 'stats': stats,
@@ -1122,6 +1176,9 @@ def api_barkod_sorgula_batch():
     """
     Batch barcode lookup for multiple products.
     Used when uploading Excel with multiple barcodes.
+    
+    Synchronous, max 100 barcodes. Larger lists should use
+    /api/barkod-sorgula/jobs (background job).
     """
     user = get_current_user()
     if not user:
@@ -1161,6 +1218,150 @@ def api_barkod_sorgula_batch():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+def _get_owned_lookup_job(job_id, user, since=0):
+    """Load job progress and check ownership (admin sees all)"""
+    progress = get_lookup_job_progress(job_id, since=since)
+    if not progress:
+        return None
+    if progress['job']['user_id'] != user['id'] and user.get('role') != 'admin':
+        return None
+    return progress
+
+
+@products_bp.route('/api/barkod-sorgula/jobs', methods=['POST'])
+def api_lookup_job_submit():
+    """
+    Submit a background batch lookup job.
+    Returns immediately with job ID; results via polling or SSE.
+    """
+    user = get_current_user()
+    if not user:
+        return jsonify({'success': False, 'error': 'Not authenticated'}), 401
+    
+    try:
+        data = request.json or {}
+        result = submit_lookup_job(
+            barcodes=data.get('barcodes', []),
+            user_id=user['id'],
+            sector=data.get('sector', user.get('sector', 'supermarket')),
+            auto_download=data.get('auto_download', True)
+        )
+        if not result['success']:
+            return jsonify(result), 400
+        
+        return jsonify(result), 202
+        
+    except Exception as e:
+        logging.error(f"Lookup job submit error: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@products_bp.route('/api/barkod-sorgula/jobs/<job_id>', methods=['GET'])
+def api_lookup_job_status(job_id):
+    """
+    Poll job status. ?since=<seq> returns only items finished after seq.
+    """
+    user = get_current_user()
+    if not user:
+        return jsonify({'success': False, 'error': 'Not authenticated'}), 401
+    
+    try:
+        since = request.args.get('since', 0, type=int)
+        progress = _get_owned_lookup_job(job_id, user, since=since)
+        if not progress:
+            return jsonify({'success': False, 'error': 'Job not found'}), 404
+        
+        return jsonify({'success': True, **progress})
+        
+    except Exception as e:
+        logging.error(f"Lookup job status error: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@products_bp.route('/api/barkod-sorgula/jobs/<job_id>/events', methods=['GET'])
+def api_lookup_job_events(job_id):
+    """
+    Server-Sent Events stream of per-barcode progress.
+    Resumes from Last-Event-ID header (or ?since=) after reconnect.
+    """
+    user = get_current_user()
+    if not user:
+        return jsonify({'success': False, 'error': 'Not authenticated'}), 401
+    
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', 0, type=int)
+    
+    if not _get_owned_lookup_job(job_id, user, since=since):
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    
+    def generate(since):
+        import time
+        started = time.monotonic()
+        yield 'retry: 2000\n\n'
+        
+        while time.monotonic() - started < LOOKUP_JOB_STREAM_SECONDS:
+            progress = get_lookup_job_progress(job_id, since=since)
+            if not progress:
+                break
+            
+            for item in progress['items']:
+                yield f"id: {item['seq']}\nevent: item\ndata: {json.dumps(item, ensure_ascii=False)}\n\n"
+            since = progress['next_since']
+            
+            job = progress['job']
+            yield f"event: progress\ndata: {json.dumps(job, ensure_ascii=False)}\n\n"
+            
+            if progress['done']:
+                yield f"event: done\ndata: {json.dumps({'status': job['status']})}\n\n"
+                return
+            
+            time.sleep(LOOKUP_JOB_STREAM_POLL_SECONDS)
+    
+    response = Response(stream_with_context(generate(since)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@products_bp.route('/api/barkod-sorgula/jobs/<job_id>/cancel', methods=['POST'])
+def api_lookup_job_cancel(job_id):
+    """Cancel a running lookup job (finished items are kept)"""
+    user = get_current_user()
+    if not user:
+        return jsonify({'success': False, 'error': 'Not authenticated'}), 401
+    
+    try:
+        if not _get_owned_lookup_job(job_id, user):
+            return jsonify({'success': False, 'error': 'Job not found'}), 404
+        
+        cancelled = cancel_lookup_job(job_id)
+        return jsonify({'success': cancelled, 'message': 'İş iptal edildi' if cancelled else 'İş zaten bitmiş'})
+        
+    except Exception as e:
+        logging.error(f"Lookup job cancel error: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@products_bp.route('/api/barkod-sorgula/jobs/<job_id>/resume', methods=['POST'])
+def api_lookup_job_resume(job_id):
+    """Resume a cancelled / interrupted lookup job from its pending barcodes"""
+    user = get_current_user()
+    if not user:
+        return jsonify({'success': False, 'error': 'Not authenticated'}), 401
+    
+    try:
+        if not _get_owned_lookup_job(job_id, user):
+            return jsonify({'success': False, 'error': 'Job not found'}), 404
+        
+        result = resume_lookup_job(job_id)
+        return jsonify(result), (200 if result['success'] else 409)
+        
+    except Exception as e:
+        logging.error(f"Lookup job resume error: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @products_bp.route('/api/price-comparison', methods=['POST'])
 def api_price_comparison():
     """
@@ -1194,6 +1395,38 @@ def api_price_comparison():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@products_bp.route('/api/price-comparison/batch', methods=['POST'])
+def api_price_comparison_batch():
+    """
+    Compare prices for a whole brochure in one call.
+    Body: {"items": [{"barcode": "...", "price": 12.5}, ...], "allow_upstream": true}
+    """
+    user = get_current_user()
+    if not user:
+        return jsonify({'success': False, 'error': 'Not authenticated'}), 401
+    
+    try:
+        data = request.json or {}
+        items = data.get('items') or []
+        
+        if not isinstance(items, list) or not items:
+            return jsonify({'success': False, 'error': 'Items required'}), 400
+        
+        result = batch_market_price_comparison(
+            [item for item in items if isinstance(item, dict)],
+            allow_upstream=bool(data.get('allow_upstream', True))
+        )
+        
+        return jsonify({
+            'success': True,
+            **result
+        })
+        
+    except Exception as e:
+        logging.error(f"Batch price comparison error: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 # ============= CUSTOMER FORM =============
 
 @products_bp.route('/musteri-form/<token>')
@@ -1650,6 +1883,12 @@ def api_reject_product(product_id):
 def api_bulk_approve_products():
     """
     Admin: Toplu onay
+    Tek sorguda doğrulama + tek işlemde durum güncelleme, depo taşımaları paralel.
+    Taşıması başarısız olan ürünler tekrar 'pending' olur.
+    
+    Request JSON:
+        product_ids: list - Onaylanacak ürün ID'leri
+        sector: str - Depo sektörü (opsiyonel, varsayılan ürün sahibinin sektörü)
     """
     user = get_current_user()
     if not user or user.get('role') != 'admin':
@@ -1657,26 +1896,25 @@ def api_bulk_approve_products():
     
     data = request.json or {}
     product_ids = data.get('product_ids', [])
+    sector = data.get('sector') or None
     
-    if not product_ids:
+    if not product_ids or not isinstance(product_ids, list):
         return jsonify({'success': False, 'error': 'Ürün ID listesi boş'}), 400
+    if sector and sector not in SECTORS:
+        return jsonify({'success': False, 'error': 'Geçersiz sektör'}), 400
     
-    admin_id = user['id']
-    approved_count = 0
-    errors = []
+    try:
+        result = bulk_approve_products(product_ids, user['id'], sector=sector)
+    except Exception as e:
+        logging.error(f"Bulk approve error: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
     
-    for pid in product_ids:
-        try:
-            if database.approve_product(pid, admin_id):
-                approved_count += 1
-            else:
-                errors.append({'id': pid, 'error': 'Onay başarısız'})
-        except Exception as e:
-            errors.append({'id': pid, 'error': str(e)})
+    if 'error' in result:
+        return jsonify(result), 400
     
+    errors = [{'id': r['id'], 'error': r['error']} for r in result['results'] if r['status'] != 'approved']
     return jsonify({
-        'success': len(errors) == 0,
-        'approved_count': approved_count,
+        **result,
         'errors': errors,
-        'message': f'{approved_count} ürün onaylandı' + (f', {len(errors)} hata' if errors else '')
+        'message': f"{result['approved_count']} ürün onaylandı" + (f', {len(errors)} hata' if errors else '')
     })
@@ -6,6 +6,7 @@ Services package - Core business logic services
 from services.excel_io import parse_excel_file, export_to_excel
 from services.image_bank import (
     search_image_hierarchy,
+    resolve_images,
     save_to_customer_depot,
     save_to_admin_depot,
     approve_pending_image,
@@ -22,9 +23,25 @@ from services.external_api import (
     full_barcode_lookup,
     batch_barcode_lookup,
     get_market_price_comparison,
+    get_market_price,
+    batch_market_price_comparison,
     clear_cache,
-    get_cache_stats
+    get_cache_stats,
+    get_lookup_metrics_snapshot
 )
+from services.lookup_jobs import (
+    submit_lookup_job,
+    get_lookup_job_progress,
+    cancel_lookup_job,
+    resume_lookup_job
+)
+from services.admin_catalog import ingest_catalog, get_admin_catalog_product
+from services.barcode_prefetch import enqueue_prefetch, get_prefetch_stats
+from services.depot_index import rebuild_depot_index, get_depot_index_stats
+from services.blob_store import gc_blobs, get_blob_stats
+from services.approval import bulk_approve_products
+from services.tombstones import tombstone_product, reap_tombstones
+from services.depot_usage import get_usage, check_quota
 
 __all__ = [
     # Excel
@@ -32,6 +49,7 @@ __all__ = [
     'export_to_excel',
     # Image Bank
     'search_image_hierarchy',
+    'resolve_images',
     'save_to_customer_depot',
     'save_to_admin_depot',
     'approve_pending_image',
@@ -47,6 +65,34 @@ __all__ = [
     'full_barcode_lookup',
     'batch_barcode_lookup',
     'get_market_price_comparison',
+    'get_market_price',
+    'batch_market_price_comparison',
     'clear_cache',
     'get_cache_stats',
+    'get_lookup_metrics_snapshot',
+    # Lookup Jobs (arka plan toplu sorgu)
+    'submit_lookup_job',
+    'get_lookup_job_progress',
+    'cancel_lookup_job',
+    'resume_lookup_job',
+    # Admin Catalog (admin_products)
+    'ingest_catalog',
+    'get_admin_catalog_product',
+    # Prefetch (ön onay listeleri)
+    'enqueue_prefetch',
+    'get_prefetch_stats',
+    # Depot Index (depot_images)
+    'rebuild_depot_index',
+    'get_depot_index_stats',
+    # Blob Store (içerik adresli depolama)
+    'gc_blobs',
+    'get_blob_stats',
+    # Approval (toplu onay)
+    'bulk_approve_products',
+    # Tombstones (asenkron ürün silme)
+    'tombstone_product',
+    'reap_tombstones',
+    # Depot Usage (müşteri depo kotaları)
+    'get_usage',
+    'check_quota',
 ]
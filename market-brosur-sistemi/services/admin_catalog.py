@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+"""
+Admin Catalog Service - admin_products (golden record) katalog katmanı
+
+Features:
+- Streaming, batched ingest of CAMGOZ/supplier catalog dumps (CSV / JSONL)
+- Compact in-memory barcode → row-id index for O(1) existence checks
+- Local lookup tier used by full_barcode_lookup before any network call
+
+CLI:
+    python -m services.admin_catalog dump.jsonl
+    python -m services.admin_catalog dump.csv --batch-size 2000 --sector supermarket
+"""
+
+import os
+import csv
+import json
+import time
+import logging
+import argparse
+import threading
+
+import database
+from utils.helpers import parse_turkish_float
+from utils.constants import validate_and_fix_product_group
+
+# ============= CONFIGURATION =============
+
+CATALOG_INGEST_BATCH_SIZE = int(os.environ.get('CATALOG_INGEST_BATCH_SIZE', 1000))
+# İndeksin değişip değişmediği bu aralıkla kontrol edilir (başka süreç ingest yapmış olabilir)
+ADMIN_CATALOG_INDEX_CHECK_SECONDS = int(os.environ.get('ADMIN_CATALOG_INDEX_CHECK_SECONDS', 60))
+
+# Döküm alan adı eşlemeleri (CAMGOZ JSON + Türkçe CSV başlıkları)
+FIELD_ALIASES = {
+    'barcode': ('barcode', 'Barkod', 'barkod', 'ean', 'gtin'),
+    'full_name': ('full_name', 'name', 'Ürün Adı', 'Urun Adi', 'title'),
+    'product_group': ('product_group', 'category', 'Kategori', 'Ürün Grubu', 'Urun Grubu'),
+    'brand': ('brand', 'Marka'),
+    'market_price': ('market_price', 'price', 'Fiyat'),
+    'market_price_tax': ('market_price_tax', 'price_with_tax', 'total', 'KDV Dahil Fiyat'),
+    'image_url': ('image_url', 'imageUrl', 'Resim', 'Görsel'),
+    'sector': ('sector', 'Sektör', 'Sektor'),
+}
+
+
+# ============= BARCODE INDEX =============
+
+class BarcodeIndex:
+    """
+    barcode → admin_products.id index.
+
+    Numeric barcodes (EAN/UPC) are stored as ints with their length folded
+    in (leading zeros stay distinct), which is far smaller than str keys.
+    """
+
+    def __init__(self):
+        self._rows = {}
+        self._signature = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(barcode):
+        barcode = str(barcode).strip()
+        if barcode.isdigit() and len(barcode) <= 18:
+            return int(barcode) * 32 + len(barcode)
+        return barcode
+
+    @staticmethod
+    def _load_signature(conn):
+        row = conn.execute("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM admin_products").fetchone()
+        return (row[0], row[1])
+
+    def _refresh(self, force=False):
+        now = time.monotonic()
+        if not force and self._signature is not None and now - self._checked_at < ADMIN_CATALOG_INDEX_CHECK_SECONDS:
+            return
+
+        with self._lock:
+            if not force and self._signature is not None and now - self._checked_at < ADMIN_CATALOG_INDEX_CHECK_SECONDS:
+                return
+            try:
+                with database.get_db() as conn:
+                    signature = self._load_signature(conn)
+                    if force or signature != self._signature:
+                        rows = {}
+                        for row_id, barcode in conn.execute("SELECT id, barcode FROM admin_products"):
+                            rows[self._key(barcode)] = row_id
+                        self._rows = rows
+                        self._signature = signature
+                        logging.info(f"📦 Admin catalog index: {len(rows)} barkod")
+            except Exception as e:
+                logging.error(f"Admin catalog index error: {e}")
+            self._checked_at = now
+
+    def get(self, barcode):
+        """Row id for barcode or None"""
+        self._refresh()
+        return self._rows.get(self._key(barcode))
+
+    def __contains__(self, barcode):
+        return self.get(barcode) is not None
+
+    def __len__(self):
+        self._refresh()
+        return len(self._rows)
+
+    def invalidate(self):
+        """Force reload on next access"""
+        with self._lock:
+            self._signature = None
+
+
+barcode_index = BarcodeIndex()
+
+
+# ============= LOOKUP =============
+
+def get_admin_catalog_product(barcode):
+    """
+    Local catalog lookup (no network).
+
+    Returns:
+        dict: Product in CAMGOZ-normalized shape plus 'image_path', or None
+    """
+    row_id = barcode_index.get(barcode)
+    if row_id is None:
+        return None
+
+    with database.get_db() as conn:
+        row = conn.execute("SELECT * FROM admin_products WHERE id = ?", (row_id,)).fetchone()
+
+    if not row or row['barcode'] != str(barcode).strip():
+        # Satır silinmiş / değişmiş - bir sonraki kontrolde indeks yenilenir
+        barcode_index.invalidate()
+        return None
+
+    return _row_to_product(dict(row))
+
+
+def get_admin_catalog_products(barcodes, chunk_size=500):
+    """
+    Batch catalog lookup: index filter + one query per chunk.
+
+    Returns:
+        dict: {barcode: product} for barcodes present in admin_products
+    """
+    row_ids = {}
+    for barcode in barcodes:
+        row_id = barcode_index.get(barcode)
+        if row_id is not None:
+            row_ids[row_id] = str(barcode).strip()
+
+    products = {}
+    ids = list(row_ids)
+    with database.get_db() as conn:
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            rows = conn.execute(
+                f"SELECT * FROM admin_products WHERE id IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            for row in rows:
+                row = dict(row)
+                if row_ids.get(row['id']) == row['barcode']:
+                    products[row['barcode']] = _row_to_product(row)
+    return products
+
+
+def _row_to_product(row):
+    """admin_products row → CAMGOZ-normalized product dict"""
+    return {
+        'barcode': row['barcode'],
+        'name': row['full_name'],
+        'category': row.get('product_group') or '',
+        'brand': row.get('brand') or '',
+        'price': row.get('market_price') or 0,
+        'price_with_tax': row.get('market_price_tax') or 0,
+        'image_url': row.get('image_url') or '',
+        'image_path': row.get('image_path') or '',
+        'image_width': row.get('image_width') or 0,
+        'image_height': row.get('image_height') or 0,
+        'sector': row.get('sector') or 'supermarket',
+        'source': 'admin_catalog',
+        'last_modified': row.get('updated_at')
+    }
+
+
+# ============= INGEST =============
+
+def _pick(record, field):
+    for alias in FIELD_ALIASES[field]:
+        value = record.get(alias)
+        if value not in (None, ''):
+            return value
+    return None
+
+
+def _to_price(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return parse_turkish_float(value)
+    except ValueError:
+        return 0.0
+
+
+def _normalize_record(record, default_sector):
+    """Map a dump record to admin_products columns (None if unusable)"""
+    barcode = str(_pick(record, 'barcode') or '').strip()
+    name = str(_pick(record, 'full_name') or '').strip()
+    if not barcode or not name:
+        return None
+
+    sector = str(_pick(record, 'sector') or default_sector).strip() or default_sector
+    group = str(_pick(record, 'product_group') or '').strip()
+
+    return (
+        barcode,
+        name,
+        validate_and_fix_product_group(group, sector) if group else 'Genel',
+        sector,
+        str(_pick(record, 'brand') or '').strip(),
+        _to_price(_pick(record, 'market_price')),
+        _to_price(_pick(record, 'market_price_tax')),
+        str(_pick(record, 'image_url') or '').strip() or None,
+    )
+
+
+def _iter_records(path, file_format=None):
+    """Stream records from CSV or JSONL without loading the file"""
+    file_format = file_format or ('jsonl' if path.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv')
+
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        if file_format == 'csv':
+            sample = f.read(4096)
+            f.seek(0)
+            try:
+                dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+            except csv.Error:
+                dialect = csv.excel
+            for record in csv.DictReader(f, dialect=dialect):
+                yield record
+        else:
+            for line_no, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    logging.warning(f"⚠️ JSONL satır {line_no} okunamadı, atlandı")
+                    yield {}
+
+
+UPSERT_SQL = '''
+    INSERT INTO admin_products (barcode, full_name, product_group, sector, brand,
+                                market_price, market_price_tax, image_url, source,
+                                created_at, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'catalog', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+    ON CONFLICT(barcode) DO UPDATE SET
+        full_name = CASE WHEN admin_products.source = 'catalog' THEN excluded.full_name ELSE admin_products.full_name END,
+        product_group = CASE WHEN admin_products.source = 'catalog' THEN excluded.product_group ELSE admin_products.product_group END,
+        brand = excluded.brand,
+        market_price = excluded.market_price,
+        market_price_tax = excluded.market_price_tax,
+        image_url = COALESCE(excluded.image_url, admin_products.image_url),
+        updated_at = CURRENT_TIMESTAMP
+'''
+
+
+def ingest_catalog(path, file_format=None, batch_size=None, default_sector='supermarket'):
+    """
+    Load a catalog dump into admin_products in batched transactions.
+    Existing rows get fresh prices/brand; admin-curated name, group,
+    sector and image_path are kept.
+
+    Args:
+        path: CSV or JSONL file path
+        file_format: 'csv' or 'jsonl' (auto-detected from extension)
+        batch_size: Rows per transaction
+        default_sector: Sector for records without one
+
+    Returns:
+        dict: {'success', 'processed', 'upserted', 'skipped', 'batches'}
+    """
+    batch_size = batch_size or CATALOG_INGEST_BATCH_SIZE
+    stats = {'processed': 0, 'upserted': 0, 'skipped': 0, 'batches': 0}
+
+    if not os.path.exists(path):
+        return {'success': False, 'error': f'File not found: {path}', **stats}
+
+    def flush(conn, batch):
+        conn.executemany(UPSERT_SQL, batch)
+        conn.commit()
+        stats['upserted'] += len(batch)
+        stats['batches'] += 1
+
+    try:
+        with database.get_db() as conn:
+            batch = {}
+            for record in _iter_records(path, file_format):
+                stats['processed'] += 1
+                row = _normalize_record(record, default_sector) if isinstance(record, dict) else None
+                if not row:
+                    stats['skipped'] += 1
+                    continue
+
+                # Aynı batch içinde tekrar eden barkodda son kayıt geçerli
+                batch[row[0]] = row
+                if len(batch) >= batch_size:
+                    flush(conn, list(batch.values()))
+                    batch = {}
+                    logging.info(f"📦 Catalog ingest: {stats['upserted']} kayıt yazıldı")
+
+            if batch:
+                flush(conn, list(batch.values()))
+
+        barcode_index.invalidate()
+        logging.info(f"✅ Catalog ingest tamamlandı: {stats}")
+        return {'success': True, **stats}
+
+    except Exception as e:
+        logging.error(f"❌ Catalog ingest error: {e}")
+        return {'success': False, 'error': str(e), **stats}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load a CAMGOZ/supplier catalog dump into admin_products')
+    parser.add_argument('path', help='CSV or JSONL file')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], default=None)
+    parser.add_argument('--batch-size', type=int, default=CATALOG_INGEST_BATCH_SIZE)
+    parser.add_argument('--sector', default='supermarket')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    database.init_db()
+    result = ingest_catalog(args.path, args.format, args.batch_size, args.sector)
+    print(json.dumps(result, ensure_ascii=False))
+    return 0 if result['success'] else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
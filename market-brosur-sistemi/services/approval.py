@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Approval Service - Toplu ürün onayı (ürün durumu + depo taşıma)
+
+bulk_approve_products approves many pending products in one request:
+1. Validate + claim: one IMMEDIATE transaction reads all requested ids
+   (with the owner's sector) and flips the still-pending ones to
+   'approved' - concurrent approvals of the same ids cannot both win
+2. Move: customer depot images are moved to the admin depot on a bounded
+   worker pool (move_to_admin_depot), one move per barcode folder
+3. Settle: one transaction stores the admin image URLs and puts products
+   whose move failed back to 'pending' so they can be approved again
+
+A product without a customer depot image is approved without a move, as
+in the single approval route (admin_approve_product).
+"""
+
+import os
+import logging
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+from services.image_bank import move_to_admin_depot
+
+# ============= CONFIGURATION =============
+
+APPROVAL_MOVE_WORKERS = int(os.environ.get('APPROVAL_MOVE_WORKERS', 8))
+BULK_APPROVE_MAX_ITEMS = int(os.environ.get('BULK_APPROVE_MAX_ITEMS', 1000))
+
+
+def _claim(product_ids, admin_id):
+    """Validate ids and mark the pending ones approved (one transaction)"""
+    placeholders = ','.join('?' * len(product_ids))
+    with database.get_db() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(f'''SELECT p.id, p.user_id, p.barcode, p.product_group, p.approval_status,
+                                           u.sector AS user_sector
+                                    FROM products p LEFT JOIN users u ON u.id = p.user_id
+                                    WHERE p.id IN ({placeholders})''', product_ids).fetchall()
+            pending = [row['id'] for row in rows if row['approval_status'] == 'pending']
+            if pending:
+                conn.execute(f'''UPDATE products SET approval_status = 'approved', approved_at = ?, approved_by = ?
+                                 WHERE id IN ({','.join('?' * len(pending))}) AND approval_status = 'pending' ''',
+                             [datetime.now().isoformat(), admin_id] + pending)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return {row['id']: dict(row) for row in rows}
+
+
+def _settle(moved, reverted, admin_id):
+    """Store moved image URLs and revert failed items (one transaction)"""
+    if not moved and not reverted:
+        return
+    with database.get_db() as conn:
+        if moved:
+            conn.executemany("UPDATE products SET image_url = ? WHERE id = ?",
+                             [(url, pid) for pid, url in moved.items()])
+        if reverted:
+            conn.execute(f'''UPDATE products SET approval_status = 'pending', approved_at = NULL, approved_by = NULL
+                             WHERE id IN ({','.join('?' * len(reverted))})
+                               AND approval_status = 'approved' AND approved_by = ?''',
+                         list(reverted) + [admin_id])
+        conn.commit()
+
+
+def bulk_approve_products(product_ids, admin_id, sector=None, workers=None):
+    """
+    Approve pending products and move their images to the admin depot.
+
+    Args:
+        product_ids: Product ids to approve
+        admin_id: Approving admin's user id
+        sector: Depot sector; defaults to each product owner's sector
+        workers: Parallel depot moves (default APPROVAL_MOVE_WORKERS)
+
+    Returns:
+        dict: {'success', 'approved_count', 'moved_count', 'results': [{'id', 'status',
+               'barcode', 'admin_url'?, 'error'?}]}; status is 'approved', 'failed'
+              or 'skipped' (unknown / not pending)
+    """
+    ids, seen = [], set()
+    for pid in product_ids:
+        try:
+            pid = int(pid)
+        except (TypeError, ValueError):
+            continue
+        if pid not in seen:
+            seen.add(pid)
+            ids.append(pid)
+    if not ids:
+        return {'success': False, 'error': 'No valid product ids'}
+    if len(ids) > BULK_APPROVE_MAX_ITEMS:
+        return {'success': False, 'error': f'Too many products (max {BULK_APPROVE_MAX_ITEMS})'}
+
+    claimed = _claim(ids, admin_id)
+
+    results = {}
+    # Aynı barkod klasörü bir kez taşınır (aynı müşteriye ait tekrar eden ürünler)
+    moves = {}
+    for pid in ids:
+        row = claimed.get(pid)
+        if not row:
+            results[pid] = {'id': pid, 'status': 'skipped', 'error': 'Product not found'}
+            continue
+        if row['approval_status'] != 'pending':
+            results[pid] = {'id': pid, 'status': 'skipped', 'barcode': row['barcode'],
+                            'error': f"Not pending ({row['approval_status']})"}
+            continue
+        key = (row['user_id'], sector or row['user_sector'] or 'supermarket',
+               row['product_group'] or 'Genel', row['barcode'])
+        moves.setdefault(key, []).append(pid)
+
+    def run(key):
+        user_id, move_sector, group, barcode = key
+        try:
+            return move_to_admin_depot(user_id=user_id, sector=move_sector, barcode=barcode, group=group)
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+
+    moved, reverted = {}, []
+    if moves:
+        with ThreadPoolExecutor(max_workers=min(workers or APPROVAL_MOVE_WORKERS, len(moves)),
+                                thread_name_prefix='approval') as executor:
+            outcomes = dict(zip(moves, executor.map(run, moves)))
+
+        for key, pids in moves.items():
+            outcome = outcomes[key]
+            for pid in pids:
+                item = {'id': pid, 'barcode': key[3]}
+                if outcome.get('success'):
+                    moved[pid] = outcome['admin_url']
+                    results[pid] = {**item, 'status': 'approved', 'admin_url': outcome['admin_url']}
+                elif outcome.get('missing'):
+                    # Müşteri deposunda resim yok: taşınacak bir şey yok, onay geçerli
+                    results[pid] = {**item, 'status': 'approved', 'admin_url': None}
+                else:
+                    reverted.append(pid)
+                    results[pid] = {**item, 'status': 'failed', 'error': outcome.get('error', 'Move failed')}
+
+    _settle(moved, reverted, admin_id)
+
+    approved = sum(1 for r in results.values() if r['status'] == 'approved')
+    logging.info(f"✅ Bulk approve by admin {admin_id}: {approved} onaylandı, {len(moved)} resim taşındı, "
+                 f"{len(reverted)} geri alındı")
+    return {
+        'success': len(reverted) == 0 and approved == len(ids),
+        'approved_count': approved,
+        'moved_count': len(moved),
+        'results': [results[pid] for pid in ids]
+    }
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Barcode Prefetch Service - Ön onaya düşen listeler için CAMGOZ ön yüklemesi
+
+Excel/CSV pre-approval yüklemesinden sonra yeni barkodlar düşük öncelikli
+bir arka plan kuyruğuna alınır. Depoda resmi olan veya önbellekte bilgisi
+bulunan barkodlar atlanır; kalanlar CAMGOZ'dan sorgulanıp lookup
+önbelleğine yazılır. Böylece müşteri ön onay ekranını açtığında satırların
+çoğu anında çözülür.
+
+Opt-in: BARCODE_PREFETCH_ENABLED=1 (veya upload isteğinde prefetch=1).
+"""
+
+import os
+import time
+import queue
+import logging
+import threading
+from itertools import count
+
+from services.external_api import (
+    _get_from_cache,
+    warm_barcode_cache,
+    get_rate_limit_remaining
+)
+from services.image_bank import search_image_hierarchy
+from services.admin_catalog import barcode_index
+
+# ============= CONFIGURATION =============
+
+BARCODE_PREFETCH_ENABLED = os.environ.get('BARCODE_PREFETCH_ENABLED', '0').lower() in ('1', 'true', 'yes')
+BARCODE_PREFETCH_MAX_QUEUE = int(os.environ.get('BARCODE_PREFETCH_MAX_QUEUE', 20000))
+BARCODE_PREFETCH_DELAY_SECONDS = float(os.environ.get('BARCODE_PREFETCH_DELAY_SECONDS', 1.0))
+# Dakikalık CAMGOZ kotasının bu kadarı etkileşimli istekler için ayrılır
+BARCODE_PREFETCH_RESERVED_CALLS = int(os.environ.get('BARCODE_PREFETCH_RESERVED_CALLS', 20))
+
+PRIORITY_LOW = 10
+
+_prefetch_queue = queue.PriorityQueue(maxsize=BARCODE_PREFETCH_MAX_QUEUE)
+_queued_barcodes = set()
+_queued_lock = threading.Lock()
+_sequence = count()
+_worker = None
+_worker_lock = threading.Lock()
+
+_stats = {'queued': 0, 'skipped': 0, 'fetched': 0, 'not_found': 0, 'errors': 0, 'dropped': 0}
+
+
+# ============= WORKER =============
+
+def _should_skip(barcode, user_id, sector):
+    """Depot image, local catalog or cached product info already resolves the row"""
+    if _get_from_cache(barcode, 'camgoz') or barcode in barcode_index:
+        return True
+    return search_image_hierarchy(barcode, user_id, sector).get('found', False)
+
+
+def _worker_loop():
+    """Consume prefetch queue; yield to interactive traffic on rate limit"""
+    while True:
+        priority, seq, barcode, user_id, sector = _prefetch_queue.get()
+        requeue = False
+        try:
+            if _should_skip(barcode, user_id, sector):
+                _stats['skipped'] += 1
+                continue
+
+            # Etkileşimli sorgular için kota bırak
+            while get_rate_limit_remaining() <= BARCODE_PREFETCH_RESERVED_CALLS:
+                time.sleep(5)
+
+            status = warm_barcode_cache(barcode)
+            if status == 'rate_limited':
+                requeue = True
+                time.sleep(10)
+            elif status in ('fetched', 'cached'):
+                _stats['fetched'] += 1
+            elif status == 'not_found':
+                _stats['not_found'] += 1
+            else:
+                _stats['errors'] += 1
+
+        except Exception as e:
+            _stats['errors'] += 1
+            logging.error(f"Prefetch error for {barcode}: {e}")
+        finally:
+            if requeue:
+                try:
+                    _prefetch_queue.put_nowait((priority, next(_sequence), barcode, user_id, sector))
+                except queue.Full:
+                    requeue = False
+            if not requeue:
+                with _queued_lock:
+                    _queued_barcodes.discard(barcode)
+            _prefetch_queue.task_done()
+
+        if BARCODE_PREFETCH_DELAY_SECONDS > 0:
+            time.sleep(BARCODE_PREFETCH_DELAY_SECONDS)
+
+
+def _ensure_worker():
+    """Start the prefetch thread once per process"""
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_worker_loop, name='barcode-prefetch', daemon=True)
+            _worker.start()
+
+
+# ============= PUBLIC API =============
+
+def enqueue_prefetch(barcodes, user_id, sector='supermarket', force=False):
+    """
+    Queue barcodes for low-priority background lookup.
+
+    Args:
+        barcodes: Iterable of barcodes
+        user_id: Uploading user (for customer depot check)
+        sector: Sector for depot check
+        force: Queue even if BARCODE_PREFETCH_ENABLED is off (per-request opt-in)
+
+    Returns:
+        int: Number of barcodes queued
+    """
+    if not (BARCODE_PREFETCH_ENABLED or force):
+        return 0
+
+    queued = 0
+    with _queued_lock:
+        for barcode in barcodes:
+            barcode = str(barcode or '').strip()
+            if not barcode or barcode in _queued_barcodes:
+                continue
+            try:
+                _prefetch_queue.put_nowait((PRIORITY_LOW, next(_sequence), barcode, user_id, sector))
+            except queue.Full:
+                _stats['dropped'] += 1
+                continue
+            _queued_barcodes.add(barcode)
+            queued += 1
+
+    if queued:
+        _stats['queued'] += queued
+        _ensure_worker()
+        logging.info(f"📦 Prefetch: {queued} barkod kuyruğa alındı (user {user_id})")
+    return queued
+
+
+def get_prefetch_stats():
+    """Queue size and counters of this process"""
+    return {
+        'enabled': BARCODE_PREFETCH_ENABLED,
+        'queue_size': _prefetch_queue.qsize(),
+        **_stats
+    }
@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+"""
+Blob Store Service - İçerik adresli (sha256) resim deposu
+
+Depot files (admin/customers/pending) are hardlinks to one blob per unique
+content under static/uploads/blobs/ab/cd/<sha256>.<ext>:
+- Identical images (national brands uploaded by many customers, approvals
+  into the admin depot) are stored once
+- Moving a depot entry only renames a link; no bytes are copied
+- image_blobs.refcount counts depot_images rows per hash (maintained by
+  services/depot_index.py in the same transaction); blobs whose refcount
+  dropped to 0 are removed by gc_blobs() after a grace period (together
+  with their thumbnails, services/image_derivatives.py)
+
+Depot files must never be rewritten in place (that would change every
+reference); write_depot_file() replaces the link atomically instead.
+If the filesystem refuses hardlinks the blob is a copy (no dedup, still correct).
+
+With a remote storage backend (services/storage.py, IMAGE_STORAGE_BACKEND=s3)
+every blob is also uploaded under the same key (blobs/ab/cd/<sha256><ext>);
+nodes that do not have a file locally fetch or redirect to it by hash.
+
+CLI:
+    python -m services.blob_store gc [--grace-seconds 3600] [--dry-run]
+    python -m services.blob_store sync      (upload blobs missing remotely)
+    python -m services.blob_store stats
+"""
+
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import logging
+import argparse
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+from services.image_derivatives import remove_derivatives
+from services.storage import get_storage
+
+# ============= CONFIGURATION =============
+
+BLOB_ROOT = os.path.join('static', 'uploads', 'blobs')
+# Referansı kalmayan blob bu süre sonunda silinir (yarış durumlarına karşı)
+BLOB_GC_GRACE_SECONDS = int(os.environ.get('BLOB_GC_GRACE_SECONDS', 3600))
+
+# Uzak depoya arka planda yükleme (indeks yeniden kurulumu vb.)
+_mirror_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='blob-mirror')
+
+
+def blob_path(content_hash, ext='.png'):
+    """Filesystem path of a blob: blobs/ab/cd/<hash><ext>"""
+    return os.path.join(BLOB_ROOT, content_hash[:2], content_hash[2:4], f'{content_hash}{ext}')
+
+
+def blob_key(content_hash, ext='.png'):
+    """Storage key of a blob (same layout locally and remotely)"""
+    return f'blobs/{content_hash[:2]}/{content_hash[2:4]}/{content_hash}{ext}'
+
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _same_file(a, b):
+    try:
+        return os.path.samefile(a, b)
+    except OSError:
+        return False
+
+
+def _link_or_copy(src, dest):
+    """Atomically make `dest` a hardlink of `src` (copy if links are unsupported)"""
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    tmp = f'{dest}.{uuid.uuid4().hex[:8]}.tmp'
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dest)
+
+
+def _register(conn, content_hash, ext, file_size):
+    """Create the image_blobs row (refcount 0) if missing"""
+    conn.execute('''INSERT OR IGNORE INTO image_blobs (content_hash, ext, file_size, refcount, unreferenced_at)
+                    VALUES (?, ?, ?, 0, ?)''', (content_hash, ext, file_size, _now()))
+    row = conn.execute("SELECT ext FROM image_blobs WHERE content_hash = ?", (content_hash,)).fetchone()
+    return row['ext']
+
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+# ============= WRITE =============
+
+def link_to_blob(fs_path, content_hash, conn):
+    """
+    Make an existing depot file a reference to its blob: adopt the file as
+    the blob if none exists yet, otherwise replace the file by a link to the
+    existing blob (dedup). Runs inside the caller's transaction.
+    """
+    ext = _register(conn, content_hash, os.path.splitext(fs_path)[1].lower() or '.png',
+                    os.path.getsize(fs_path))
+    target = blob_path(content_hash, ext)
+
+    if not os.path.exists(target):
+        _link_or_copy(fs_path, target)
+        if get_storage().remote:
+            # DB kilidi tutulurken ağ beklenmez; yükleme arka planda
+            _mirror_executor.submit(_mirror, content_hash, ext, target)
+    elif not _same_file(fs_path, target):
+        _link_or_copy(target, fs_path)
+    return target
+
+
+def write_depot_file(dest_path, data):
+    """
+    Write image bytes to a depot path through the blob store: bytes are
+    written once per unique content and `dest_path` becomes a link to the
+    blob. Call services.depot_index.index_image() afterwards (same
+    transaction) to record the reference.
+
+    Returns:
+        str: sha256 of data
+    """
+    content_hash = hash_bytes(data)
+    ext = os.path.splitext(dest_path)[1].lower() or '.png'
+    target = blob_path(content_hash, ext)
+
+    if not os.path.exists(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp = f'{target}.{uuid.uuid4().hex[:8]}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, target)
+        _mirror(content_hash, ext, target)
+
+    _link_or_copy(target, dest_path)
+    # Bağlantı blob'un eski mtime'ını taşır; yeni yazılan dosya şimdi değişmiş sayılır
+    # (depot_images.updated_at mezar taşlarıyla karşılaştırılır)
+    os.utime(dest_path)
+    return content_hash
+
+
+# ============= REMOTE STORAGE =============
+
+def _mirror(content_hash, ext, path):
+    """Upload a blob to the remote storage backend (no-op for local storage)"""
+    storage = get_storage()
+    if not storage.remote:
+        return
+    try:
+        storage.put_file(blob_key(content_hash, ext), path)
+    except Exception as e:
+        logging.error(f"❌ Blob upload error ({content_hash[:12]}): {e}")
+
+
+def _blob_ext(content_hash):
+    with database.get_db() as conn:
+        row = conn.execute("SELECT ext FROM image_blobs WHERE content_hash = ?", (content_hash,)).fetchone()
+    return row['ext'] if row else None
+
+
+def blob_url(content_hash, expires=None):
+    """Presigned / public URL of a blob on the remote backend, or None (local storage)"""
+    storage = get_storage()
+    ext = _blob_ext(content_hash) if storage.remote else None
+    return storage.url(blob_key(content_hash, ext), expires) if ext else None
+
+
+def ensure_local_blob(content_hash):
+    """
+    Local path of a blob, streaming it from the remote backend first if this
+    node does not have it. Returns None if it is unavailable.
+    """
+    ext = _blob_ext(content_hash)
+    if not ext:
+        return None
+    target = blob_path(content_hash, ext)
+    if os.path.exists(target):
+        return target
+    storage = get_storage()
+    if not storage.remote:
+        return None
+    try:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp = f'{target}.{uuid.uuid4().hex[:8]}.tmp'
+        with open(tmp, 'wb') as f:
+            for chunk in storage.open(blob_key(content_hash, ext)):
+                f.write(chunk)
+        os.replace(tmp, target)
+        return target
+    except Exception as e:
+        logging.error(f"❌ Blob download error ({content_hash[:12]}): {e}")
+        return None
+
+
+def local_image_path(image):
+    """Readable local file of a depot index row (its own path or the blob)"""
+    if os.path.exists(image['image_path']):
+        return image['image_path']
+    return ensure_local_blob(image['content_hash']) if image.get('content_hash') else None
+
+
+def sync_blobs(limit=None):
+    """Upload every local blob missing on the remote backend"""
+    storage = get_storage()
+    if not storage.remote:
+        return {'success': True, 'uploaded': 0, 'skipped': 'local storage'}
+    stats = {'uploaded': 0, 'present': 0, 'missing_locally': 0}
+    with database.get_db() as conn:
+        rows = conn.execute("SELECT content_hash, ext FROM image_blobs ORDER BY content_hash").fetchall()
+    for row in rows[:limit]:
+        key = blob_key(row['content_hash'], row['ext'])
+        if storage.stat(key):
+            stats['present'] += 1
+            continue
+        path = blob_path(row['content_hash'], row['ext'])
+        if not os.path.exists(path):
+            stats['missing_locally'] += 1
+            continue
+        storage.put_file(key, path)
+        stats['uploaded'] += 1
+    return {'success': True, **stats}
+
+
+def link_from_blob(content_hash, dest_path):
+    """
+    Make `dest_path` a link to an existing blob without touching the bytes
+    (imports / copies of known content). Returns False if the blob is not
+    available on this node.
+    """
+    source = ensure_local_blob(content_hash)
+    if not source:
+        return False
+    _link_or_copy(source, dest_path)
+    return True
+
+
+def incref(conn, content_hash):
+    conn.execute('''UPDATE image_blobs SET refcount = refcount + 1, unreferenced_at = NULL
+                    WHERE content_hash = ?''', (content_hash,))
+
+
+def decref(conn, content_hash):
+    if content_hash:
+        conn.execute('''UPDATE image_blobs SET refcount = MAX(refcount - 1, 0),
+                               unreferenced_at = CASE WHEN refcount - 1 <= 0 THEN ? ELSE NULL END
+                        WHERE content_hash = ?''', (_now(), content_hash))
+
+
+def reconcile_refcounts(conn):
+    """Recompute every refcount from depot_images (after a full index rebuild)"""
+    conn.execute('''UPDATE image_blobs SET refcount = (
+                        SELECT COUNT(*) FROM depot_images d WHERE d.content_hash = image_blobs.content_hash)''')
+    conn.execute("UPDATE image_blobs SET unreferenced_at = COALESCE(unreferenced_at, ?) WHERE refcount = 0",
+                 (_now(),))
+    conn.execute("UPDATE image_blobs SET unreferenced_at = NULL WHERE refcount > 0")
+
+
+# ============= GC / STATS =============
+
+def gc_blobs(grace_seconds=None, dry_run=False, limit=1000):
+    """
+    Delete blobs that have had no reference for `grace_seconds`.
+
+    Returns:
+        dict: {'success', 'deleted', 'freed_bytes', 'candidates'}
+    """
+    grace_seconds = BLOB_GC_GRACE_SECONDS if grace_seconds is None else grace_seconds
+    cutoff = (datetime.now() - timedelta(seconds=grace_seconds)).strftime('%Y-%m-%d %H:%M:%S')
+    stats = {'deleted': 0, 'freed_bytes': 0, 'candidates': 0}
+
+    try:
+        with database.get_db() as conn:
+            candidates = conn.execute('''SELECT content_hash, ext, file_size FROM image_blobs
+                                         WHERE refcount <= 0 AND unreferenced_at <= ? LIMIT ?''',
+                                      (cutoff, limit)).fetchall()
+            stats['candidates'] = len(candidates)
+            if dry_run:
+                stats['freed_bytes'] = sum(row['file_size'] or 0 for row in candidates)
+                return {'success': True, 'dry_run': True, **stats}
+
+            for row in candidates:
+                # Yazma kilidi: eşzamanlı link_to_blob bu satırı yeniden oluşturana kadar bekler
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    referenced = conn.execute("SELECT 1 FROM depot_images WHERE content_hash = ? LIMIT 1",
+                                              (row['content_hash'],)).fetchone()
+                    deleted = 0 if referenced else conn.execute(
+                        "DELETE FROM image_blobs WHERE content_hash = ? AND refcount <= 0",
+                        (row['content_hash'],)).rowcount
+                    if deleted:
+                        path = blob_path(row['content_hash'], row['ext'])
+                        if os.path.exists(path):
+                            os.remove(path)
+                        remove_derivatives(row['content_hash'])
+                        conn.execute("DELETE FROM image_hash_bands WHERE content_hash = ?", (row['content_hash'],))
+                        if get_storage().remote:
+                            get_storage().delete(blob_key(row['content_hash'], row['ext']))
+                        stats['deleted'] += 1
+                        stats['freed_bytes'] += row['file_size'] or 0
+                    elif referenced:
+                        # Sayaç kaymış; gerçek referans sayısına düzelt
+                        conn.execute('''UPDATE image_blobs SET unreferenced_at = NULL, refcount = (
+                                            SELECT COUNT(*) FROM depot_images WHERE content_hash = ?)
+                                        WHERE content_hash = ?''', (row['content_hash'], row['content_hash']))
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+
+        if stats['deleted']:
+            logging.info(f"🧹 Blob GC: {stats['deleted']} blob silindi ({stats['freed_bytes']} bayt)")
+        return {'success': True, **stats}
+
+    except Exception as e:
+        logging.error(f"❌ Blob GC error: {e}")
+        return {'success': False, 'error': str(e), **stats}
+
+
+def get_blob_stats():
+    """Blob count/bytes vs. depot references (dedup ratio)"""
+    with database.get_db() as conn:
+        blobs = conn.execute('''SELECT COUNT(*) AS blobs, COALESCE(SUM(file_size), 0) AS bytes,
+                                       COALESCE(SUM(CASE WHEN refcount = 0 THEN 1 ELSE 0 END), 0) AS unreferenced
+                                FROM image_blobs''').fetchone()
+        refs = conn.execute('''SELECT COUNT(*) AS refs, COALESCE(SUM(file_size), 0) AS logical_bytes
+                               FROM depot_images''').fetchone()
+    return {
+        'blobs': blobs['blobs'],
+        'stored_bytes': blobs['bytes'],
+        'unreferenced': blobs['unreferenced'],
+        'references': refs['refs'],
+        'logical_bytes': refs['logical_bytes'],
+        'saved_bytes': max(refs['logical_bytes'] - blobs['bytes'], 0)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Content-addressed image blob store maintenance')
+    parser.add_argument('command', choices=['gc', 'sync', 'stats'])
+    parser.add_argument('--grace-seconds', type=int, default=BLOB_GC_GRACE_SECONDS)
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    database.init_db()
+    if args.command == 'gc':
+        result = gc_blobs(args.grace_seconds, args.dry_run)
+        print(json.dumps(result, ensure_ascii=False))
+        return 0 if result['success'] else 1
+    if args.command == 'sync':
+        print(json.dumps(sync_blobs(), ensure_ascii=False))
+        return 0
+
+    print(json.dumps(get_blob_stats(), ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
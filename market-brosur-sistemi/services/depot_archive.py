@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""
+Depot Archive Service - Resim deposunun toplu dışa / içe aktarımı (tar akışı)
+
+Export streams a tar of selected depots (admin, one customer, one sector,
+optionally only entries changed since a timestamp) chunk by chunk - no
+temp files, suitable for a Flask streaming response or stdout. Entries
+keep their depot path (admin/..., customers/<id>/..., pending/...) and
+carry their sha256 / status as PAX headers; each barcode folder gets a
+metadata.json generated from the index (no metadata files are read).
+
+Import reads such a tar as a stream:
+- entries whose hash is already stored are linked to the existing blob
+  without writing bytes (dedup); unchanged entries are skipped
+- new content is written through the blob store on a bounded worker pool
+  (parallel extraction) and indexed in the same transaction
+- paths are validated against the depot layout (no traversal)
+- metadata.json entries are applied to the index (set_folder_metadata)
+  once the folder's images are stored
+
+Incremental sync: export --since <ISO timestamp> on the source, import on
+the target.
+
+CLI:
+    python -m services.depot_archive export [--depot admin] [--customer-id 5]
+        [--sector supermarket] [--since 2026-01-01T00:00:00] -o depot.tar
+    python -m services.depot_archive import depot.tar [--workers 4]
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import tarfile
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+from services.blob_store import write_depot_file, link_from_blob, local_image_path
+from services.depot_index import (
+    DEPOT_DIRS,
+    parse_depot_path,
+    to_fs_path,
+    index_transaction,
+    index_image,
+    find_image_by_path,
+    iter_depot_images,
+    row_metadata,
+    set_folder_metadata,
+    METADATA_FILENAME
+)
+
+# ============= CONFIGURATION =============
+
+DEPOT_ARCHIVE_WORKERS = int(os.environ.get('DEPOT_ARCHIVE_WORKERS', 4))
+PAX_HASH = 'depot.sha256'
+PAX_STATUS = 'depot.status'
+
+
+class _ChunkBuffer(io.RawIOBase):
+    """Write-only sink; the exporter drains it after every entry"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+# ============= EXPORT =============
+
+def export_archive(depot_type=None, user_id=None, sector=None, since=None):
+    """
+    Stream a tar archive of the selected depot entries.
+
+    Yields:
+        bytes: Archive chunks (roughly one per entry)
+    """
+    rows = iter_depot_images(depot_type, user_id, sector, since)
+    buffer = _ChunkBuffer()
+    # dereference: depo dosyaları blob'a hardlink; arşivde her giriş tam dosya olmalı
+    archive = tarfile.open(fileobj=buffer, mode='w|', format=tarfile.PAX_FORMAT, dereference=True)
+    folders = set()
+    exported = 0
+
+    for image in rows:
+        source = local_image_path(image)
+        if not source:
+            logging.warning(f"⚠️ Depot export: {image['rel_path']} bulunamadı, atlandı")
+            continue
+
+        folder_rel = image['rel_path'].rsplit('/', 1)[0]
+        if folder_rel not in folders and image['metadata'] is not None:
+            folders.add(folder_rel)
+            data = json.dumps(row_metadata(image), ensure_ascii=False, indent=2).encode('utf-8')
+            info = tarfile.TarInfo(f'{folder_rel}/{METADATA_FILENAME}')
+            info.size = len(data)
+            info.mtime = time.time()
+            archive.addfile(info, io.BytesIO(data))
+
+        info = archive.gettarinfo(source, arcname=image['rel_path'])
+        info.pax_headers = {PAX_HASH: image['content_hash'] or '', PAX_STATUS: image['status'] or ''}
+        with open(source, 'rb') as f:
+            archive.addfile(info, f)
+        exported += 1
+        yield buffer.drain()
+
+    archive.close()
+    yield buffer.drain()
+    logging.info(f"📦 Depot export: {exported} resim")
+
+
+def export_filename(depot_type=None, user_id=None, sector=None, since=None):
+    parts = ['depot', depot_type or 'all']
+    if user_id is not None:
+        parts.append(str(user_id))
+    if sector:
+        parts.append(sector)
+    if since:
+        parts.append('since-' + str(since)[:10])
+    return '-'.join(parts) + '.tar'
+
+
+# ============= IMPORT =============
+
+def _safe_rel_path(name):
+    """Validated depot-relative path of an archive entry, or None"""
+    name = name.replace('\\', '/')
+    while name.startswith('./'):
+        name = name[2:]
+    parts = name.split('/')
+    if not name or name.startswith('/') or any(p in ('', '.', '..') for p in parts):
+        return None
+    if parts[0] not in DEPOT_DIRS.values():
+        return None
+    return name
+
+
+def _store_entry(rel_path, data, status):
+    fs_path = to_fs_path(rel_path)
+    os.makedirs(os.path.dirname(fs_path), exist_ok=True)
+    with index_transaction() as conn:
+        content_hash = write_depot_file(fs_path, data)
+        index_image(fs_path, status=status or None, conn=conn, content_hash=content_hash)
+
+
+def _link_entry(rel_path, content_hash, status):
+    fs_path = to_fs_path(rel_path)
+    os.makedirs(os.path.dirname(fs_path), exist_ok=True)
+    with index_transaction() as conn:
+        if not link_from_blob(content_hash, fs_path):
+            return False
+        index_image(fs_path, status=status or None, conn=conn, content_hash=content_hash)
+    return True
+
+
+def import_archive(fileobj, workers=None):
+    """
+    Stream a depot tar into the image bank.
+
+    Returns:
+        dict: {'success', 'imported', 'linked', 'unchanged', 'metadata',
+               'rejected', 'failed', 'seconds'}
+    """
+    workers = workers or DEPOT_ARCHIVE_WORKERS
+    started = time.monotonic()
+    stats = {'imported': 0, 'linked': 0, 'unchanged': 0, 'metadata': 0, 'rejected': 0, 'failed': 0}
+    lock = threading.Lock()
+    # Bellekte en fazla workers*2 resim bekler
+    slots = threading.BoundedSemaphore(workers * 2)
+    # Klasör metadata'sı resimler indekslendikten sonra uygulanır (tar'da resimlerden önce gelir)
+    folder_metadata = {}
+
+    def count(key):
+        with lock:
+            stats[key] += 1
+
+    def run(rel_path, data, status):
+        try:
+            _store_entry(rel_path, data, status)
+            count('imported')
+        except Exception as e:
+            logging.error(f"❌ Depot import: {rel_path} - {e}")
+            count('failed')
+        finally:
+            slots.release()
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='depot-import') as executor, \
+                tarfile.open(fileobj=fileobj, mode='r|*') as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                rel_path = _safe_rel_path(member.name)
+                if not rel_path:
+                    stats['rejected'] += 1
+                    continue
+
+                if rel_path.endswith('/' + METADATA_FILENAME):
+                    # Sadece barkod klasörlerindeki metadata.json kabul edilir
+                    if not parse_depot_path(rel_path.rsplit('/', 1)[0] + '/product.png'):
+                        stats['rejected'] += 1
+                        continue
+                    try:
+                        metadata = json.loads(archive.extractfile(member).read().decode('utf-8'))
+                    except ValueError:
+                        metadata = None
+                    if not isinstance(metadata, dict):
+                        stats['rejected'] += 1
+                        continue
+                    folder_metadata[rel_path.rsplit('/', 1)[0]] = metadata
+                    continue
+                if not parse_depot_path(rel_path):
+                    stats['rejected'] += 1
+                    continue
+
+                content_hash = member.pax_headers.get(PAX_HASH, '')
+                status = member.pax_headers.get(PAX_STATUS, '')
+                if content_hash:
+                    current = find_image_by_path(rel_path)
+                    if current and current['content_hash'] == content_hash and os.path.exists(current['image_path']):
+                        stats['unchanged'] += 1
+                        continue
+                    # Aynı içerik zaten depolanmış: baytlar yazılmadan bağlanır
+                    if _link_entry(rel_path, content_hash, status):
+                        stats['linked'] += 1
+                        continue
+
+                data = archive.extractfile(member).read()
+                slots.acquire()
+                executor.submit(run, rel_path, data, status)
+
+        for folder_rel, metadata in folder_metadata.items():
+            if set_folder_metadata(folder_rel, metadata) is not None:
+                stats['metadata'] += 1
+
+        stats['seconds'] = round(time.monotonic() - started, 2)
+        logging.info(f"📦 Depot import tamamlandı: {stats}")
+        return {'success': stats['failed'] == 0, **stats}
+
+    except (tarfile.TarError, EOFError) as e:
+        logging.error(f"❌ Depot import: geçersiz arşiv - {e}")
+        return {'success': False, 'error': f'Invalid archive: {e}', **stats}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Stream depot images to / from a tar archive')
+    sub = parser.add_subparsers(dest='command', required=True)
+    export_parser = sub.add_parser('export')
+    export_parser.add_argument('--depot', choices=list(DEPOT_DIRS.keys()))
+    export_parser.add_argument('--customer-id', type=int)
+    export_parser.add_argument('--sector')
+    export_parser.add_argument('--since', help='ISO timestamp; only entries changed since then')
+    export_parser.add_argument('-o', '--output', default='-')
+    import_parser = sub.add_parser('import')
+    import_parser.add_argument('archive', help="tar file or '-' for stdin")
+    import_parser.add_argument('--workers', type=int, default=DEPOT_ARCHIVE_WORKERS)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    database.init_db()
+    if args.command == 'export':
+        out = sys.stdout.buffer if args.output == '-' else open(args.output, 'wb')
+        try:
+            for chunk in export_archive(args.depot, args.customer_id, args.sector, args.since):
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+        return 0
+
+    source = sys.stdin.buffer if args.archive == '-' else open(args.archive, 'rb')
+    try:
+        result = import_archive(source, args.workers)
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+    print(json.dumps(result, ensure_ascii=False))
+    return 0 if result['success'] else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,456 @@
+# -*- coding: utf-8 -*-
+"""
+Depot GC Service - Artımlı çöp toplama ve tutarlılık denetimi
+
+One GC pass runs these phases in order, a few seconds at a time:
+    dirs              walk admin/customers/pending in sorted order: remove empty
+                      folders (left behind by moves / approvals), index image
+                      files missing from depot_images
+    index             drop depot_images rows whose file is gone
+    urls              report stored image URLs (products, admin/customer images)
+                      that point at missing files
+    cache             delete expired lookup cache files (cache/*.json)
+    pending_products  delete pending/<user_id>/pending_products.json of removed
+                      users or whose products were all imported
+    hashes            compute missing perceptual hashes (image_similarity.backfill_hashes)
+    blobs             delete unreferenced blobs (blob_store.gc_blobs)
+
+Every step has a time and I/O budget (filesystem / DB operations) and
+stores its phase + cursor in app_state, so the next step resumes exactly
+where the previous one stopped; nothing ever walks the whole tree inside a
+request. Findings of the running and the last completed pass are kept in
+app_state too (admin API / CLI).
+
+A background thread runs one step every DEPOT_GC_INTERVAL_SECONDS; a lease
+in app_state makes sure only one gunicorn worker runs it at a time.
+
+CLI:
+    python -m services.depot_gc step [--time-budget 5] [--io-budget 2000]
+    python -m services.depot_gc pass     (run steps until a pass completes)
+    python -m services.depot_gc report
+"""
+
+import os
+import json
+import time
+import logging
+import argparse
+import threading
+from datetime import datetime
+
+import database
+from utils.constants import ALLOWED_IMAGE_EXTENSIONS
+from services.blob_store import gc_blobs
+from services.storage import get_storage
+from services.image_similarity import backfill_hashes
+from services.depot_index import (
+    UPLOAD_ROOT,
+    DEPOT_DIRS,
+    IMAGE_URL_COLUMNS,
+    to_rel_path,
+    to_fs_path,
+    parse_depot_path,
+    index_transaction,
+    index_image,
+    remove_image
+)
+
+# ============= CONFIGURATION =============
+
+DEPOT_GC_ENABLED = os.environ.get('DEPOT_GC_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+DEPOT_GC_INTERVAL_SECONDS = int(os.environ.get('DEPOT_GC_INTERVAL_SECONDS', 600))
+DEPOT_GC_TIME_BUDGET_SECONDS = float(os.environ.get('DEPOT_GC_TIME_BUDGET_SECONDS', 5))
+DEPOT_GC_IO_BUDGET = int(os.environ.get('DEPOT_GC_IO_BUDGET', 2000))
+# Yeni oluşturulmuş boş klasörlere dokunma (eşzamanlı yükleme yarışı)
+DEPOT_GC_DIR_GRACE_SECONDS = int(os.environ.get('DEPOT_GC_DIR_GRACE_SECONDS', 3600))
+DEPOT_GC_CACHE_MAX_AGE_HOURS = int(os.environ.get('DEPOT_GC_CACHE_MAX_AGE_HOURS', 24))
+DEPOT_GC_BATCH = 200
+# Raporda tutulacak örnek sayısı (tür başına)
+DEPOT_GC_SAMPLE_LIMIT = 20
+
+CACHE_PATH = os.path.join(UPLOAD_ROOT, 'cache')
+PENDING_PRODUCTS_FILENAME = 'pending_products.json'
+
+# Bu derinliğin altındaki boş klasörler silinmez (depo / sektör / müşteri kökleri)
+MIN_REMOVABLE_DEPTH = {'admin': 3, 'customers': 4, 'pending': 3}
+
+PHASES = ['dirs', 'index', 'urls', 'cache', 'pending_products', 'hashes', 'blobs']
+
+STATE_KEY = 'depot_gc_state'
+STATE_LAST_REPORT = 'depot_gc_last_report'
+STATE_LEASE = 'depot_gc_lease'
+
+_gc_thread = None
+
+
+class Budget:
+    """Time + I/O operation budget of one GC step"""
+
+    def __init__(self, seconds, io_ops):
+        self.deadline = time.monotonic() + seconds
+        self.io_left = io_ops
+        self.io_used = 0
+
+    def spend(self, ops=1):
+        self.io_left -= ops
+        self.io_used += ops
+
+    @property
+    def exhausted(self):
+        return self.io_left <= 0 or time.monotonic() >= self.deadline
+
+
+def _new_state():
+    return {'phase': PHASES[0], 'cursor': None, 'pass_started': datetime.now().isoformat(),
+            'counts': {}, 'samples': {}}
+
+
+def _load_state():
+    try:
+        state = json.loads(database.get_app_state(STATE_KEY) or 'null')
+    except ValueError:
+        state = None
+    return state if state and state.get('phase') in PHASES else _new_state()
+
+
+def _note(state, key, sample=None, amount=1):
+    state['counts'][key] = state['counts'].get(key, 0) + amount
+    if sample is not None:
+        samples = state['samples'].setdefault(key, [])
+        if len(samples) < DEPOT_GC_SAMPLE_LIMIT:
+            samples.append(sample)
+
+
+# ============= PHASES =============
+# Her faz: (state, cursor, budget) -> (yeni cursor, faz bitti mi)
+
+def _iter_dirs(cursor):
+    """
+    Depot folders in sorted pre-order as rel-path tuples, skipping every
+    subtree that lies entirely before `cursor`.
+    """
+    cursor = tuple(cursor or ())
+    stack = [(folder,) for folder in sorted(DEPOT_DIRS.values(), reverse=True)]
+    while stack:
+        parts = stack.pop()
+        if parts < cursor and cursor[:len(parts)] != parts:
+            continue
+        fs_path = os.path.join(UPLOAD_ROOT, *parts)
+        try:
+            entries = sorted(os.scandir(fs_path), key=lambda e: e.name)
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        yield parts, entries, parts <= cursor
+        for entry in reversed(entries):
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(parts + (entry.name,))
+
+
+def _phase_dirs(state, cursor, budget):
+    now = time.time()
+    for parts, entries, already_done in _iter_dirs(cursor):
+        budget.spend()
+        if already_done:
+            continue
+
+        rel_folder = '/'.join(parts)
+        if not entries and len(parts) >= MIN_REMOVABLE_DEPTH.get(parts[0], 3):
+            # Boş klasör: taşıma / onay sonrası kalıntı
+            try:
+                fs_path = os.path.join(UPLOAD_ROOT, *parts)
+                if now - os.stat(fs_path).st_mtime >= DEPOT_GC_DIR_GRACE_SECONDS:
+                    os.rmdir(fs_path)
+                    _note(state, 'empty_dirs_removed', rel_folder)
+                budget.spend()
+            except OSError:
+                pass
+        else:
+            images = [e for e in entries if e.is_file(follow_symlinks=False)
+                      and os.path.splitext(e.name)[1].lower() in ALLOWED_IMAGE_EXTENSIONS]
+            if images:
+                with database.get_db() as conn:
+                    indexed = {row['rel_path'] for row in conn.execute(
+                        f"SELECT rel_path FROM depot_images WHERE rel_path IN ({','.join('?' * len(images))})",
+                        [f'{rel_folder}/{e.name}' for e in images])}
+                budget.spend()
+                for entry in images:
+                    rel_path = f'{rel_folder}/{entry.name}'
+                    if rel_path in indexed or not parse_depot_path(rel_path):
+                        continue
+                    with index_transaction() as conn:
+                        index_image(to_fs_path(rel_path), conn=conn)
+                    _note(state, 'unindexed_files_indexed', rel_path)
+                    budget.spend(2)
+
+        cursor = list(parts)
+        if budget.exhausted:
+            return cursor, False
+    return None, True
+
+
+def _phase_index(state, cursor, budget):
+    # Uzak depolamada dosyanın bu düğümde olmaması normaldir: sadece raporla
+    remote = get_storage().remote
+    while not budget.exhausted:
+        with database.get_db() as conn:
+            rows = conn.execute("SELECT rel_path FROM depot_images WHERE rel_path > ? ORDER BY rel_path LIMIT ?",
+                                (cursor or '', DEPOT_GC_BATCH)).fetchall()
+        budget.spend()
+        if not rows:
+            return None, True
+        for row in rows:
+            cursor = row['rel_path']
+            budget.spend()
+            if os.path.exists(to_fs_path(row['rel_path'])):
+                continue
+            if remote:
+                _note(state, 'index_rows_without_local_file', row['rel_path'])
+            else:
+                with index_transaction() as conn:
+                    remove_image(row['rel_path'], conn=conn)
+                _note(state, 'index_rows_removed', row['rel_path'])
+            if budget.exhausted:
+                break
+    return cursor, False
+
+
+def _phase_urls(state, cursor, budget):
+    table_idx, last_rowid = cursor or [0, 0]
+    root = f"/{UPLOAD_ROOT.replace(os.sep, '/')}/"
+    while table_idx < len(IMAGE_URL_COLUMNS):
+        table, column = IMAGE_URL_COLUMNS[table_idx]
+        with database.get_db() as conn:
+            rows = conn.execute(f'''SELECT rowid AS row_id, {column} AS url FROM {table}
+                                    WHERE rowid > ? AND substr({column}, 1, ?) = ?
+                                    ORDER BY rowid LIMIT ?''',
+                                (last_rowid, len(root), root, DEPOT_GC_BATCH)).fetchall()
+            budget.spend()
+            if not rows:
+                table_idx, last_rowid = table_idx + 1, 0
+                continue
+            rels = {row['row_id']: to_rel_path(row['url']) for row in rows}
+            unique = list(set(rels.values()))
+            indexed = set()
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                indexed.update(r['rel_path'] for r in conn.execute(
+                    f"SELECT rel_path FROM depot_images WHERE rel_path IN ({','.join('?' * len(chunk))})", chunk))
+            budget.spend()
+
+        for row in rows:
+            last_rowid = row['row_id']
+            rel_path = rels[row['row_id']]
+            if rel_path in indexed:
+                continue
+            budget.spend()
+            if not os.path.exists(to_fs_path(rel_path)):
+                _note(state, 'broken_image_urls', {'table': table, 'rowid': row['row_id'], 'url': row['url']})
+        if budget.exhausted:
+            return [table_idx, last_rowid], False
+    return None, True
+
+
+def _phase_cache(state, cursor, budget):
+    try:
+        names = sorted(e.name for e in os.scandir(CACHE_PATH) if e.name > (cursor or ''))
+    except FileNotFoundError:
+        return None, True
+    budget.spend()
+    max_age = DEPOT_GC_CACHE_MAX_AGE_HOURS * 3600
+    now = time.time()
+    for name in names:
+        cursor = name
+        path = os.path.join(CACHE_PATH, name)
+        try:
+            budget.spend()
+            if name.endswith('.json') and now - os.path.getmtime(path) > max_age:
+                size = os.path.getsize(path)
+                os.remove(path)
+                _note(state, 'cache_files_removed')
+                _note(state, 'cache_bytes_freed', amount=size)
+        except OSError:
+            pass
+        if budget.exhausted:
+            return cursor, False
+    return None, True
+
+
+def _phase_pending_products(state, cursor, budget):
+    pending_root = os.path.join(UPLOAD_ROOT, DEPOT_DIRS['pending'])
+    try:
+        user_dirs = sorted(e.name for e in os.scandir(pending_root) if e.name.isdigit() and e.name > (cursor or ''))
+    except FileNotFoundError:
+        return None, True
+    budget.spend()
+    for name in user_dirs:
+        cursor = name
+        path = os.path.join(pending_root, name, PENDING_PRODUCTS_FILENAME)
+        budget.spend()
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                barcodes = {str(p.get('barcode')) for p in json.load(f) if p.get('barcode')}
+            with database.get_db() as conn:
+                user_exists = conn.execute("SELECT 1 FROM users WHERE id = ?", (int(name),)).fetchone()
+                imported = {row['barcode'] for row in conn.execute(
+                    "SELECT barcode FROM products WHERE user_id = ?", (int(name),))} if user_exists else set()
+            budget.spend(2)
+            if not user_exists or barcodes <= imported:
+                os.remove(path)
+                _note(state, 'pending_products_removed', f'{DEPOT_DIRS["pending"]}/{name}/{PENDING_PRODUCTS_FILENAME}')
+        except (OSError, ValueError) as e:
+            _note(state, 'pending_products_unreadable', f'{name}: {e}')
+        if budget.exhausted:
+            return cursor, False
+    return None, True
+
+
+def _phase_hashes(state, cursor, budget):
+    # Her resim çözümü birkaç I/O işlemi sayılır
+    limit = max(1, min(64, budget.io_left // 4))
+    result = backfill_hashes(limit)
+    hashed = result.get('hashed', 0) + result.get('failed', 0)
+    budget.spend(hashed * 4 + 1)
+    if hashed:
+        _note(state, 'perceptual_hashes_added', amount=result.get('hashed', 0))
+    if result.get('failed'):
+        _note(state, 'unhashable_images', amount=result['failed'])
+    return None, hashed < limit or not result['success']
+
+
+def _phase_blobs(state, cursor, budget):
+    limit = max(1, min(DEPOT_GC_BATCH, budget.io_left))
+    result = gc_blobs(limit=limit)
+    budget.spend(result.get('candidates', 0) + 1)
+    if result.get('deleted'):
+        _note(state, 'blobs_removed', amount=result['deleted'])
+        _note(state, 'blob_bytes_freed', amount=result['freed_bytes'])
+    if not result['success']:
+        _note(state, 'blob_gc_errors', result.get('error'))
+    # Limitten az aday döndüyse silinecek blob kalmadı
+    return None, result.get('candidates', 0) < limit or not result['success']
+
+
+PHASE_HANDLERS = {
+    'dirs': _phase_dirs,
+    'index': _phase_index,
+    'urls': _phase_urls,
+    'cache': _phase_cache,
+    'pending_products': _phase_pending_products,
+    'hashes': _phase_hashes,
+    'blobs': _phase_blobs,
+}
+
+
+# ============= RUN =============
+
+def run_gc_step(time_budget=None, io_budget=None):
+    """
+    Run GC phases until the budget is spent, resuming from the stored cursor.
+
+    Returns:
+        dict: {'success', 'phase', 'cursor', 'pass_completed', 'io_used', 'seconds', 'counts'}
+    """
+    started = time.monotonic()
+    budget = Budget(DEPOT_GC_TIME_BUDGET_SECONDS if time_budget is None else time_budget,
+                    DEPOT_GC_IO_BUDGET if io_budget is None else io_budget)
+    state = _load_state()
+    pass_completed = False
+
+    try:
+        while not budget.exhausted:
+            handler = PHASE_HANDLERS[state['phase']]
+            state['cursor'], done = handler(state, state['cursor'], budget)
+            if not done:
+                break
+            next_index = PHASES.index(state['phase']) + 1
+            if next_index < len(PHASES):
+                state['phase'], state['cursor'] = PHASES[next_index], None
+                continue
+            # Tur tamamlandı: raporu sakla, yeni tura başla
+            state['pass_completed'] = datetime.now().isoformat()
+            database.set_app_state(STATE_LAST_REPORT, json.dumps(state, ensure_ascii=False))
+            logging.info(f"🧹 Depot GC turu tamamlandı: {state['counts']}")
+            state = _new_state()
+            pass_completed = True
+            break
+
+        database.set_app_state(STATE_KEY, json.dumps(state, ensure_ascii=False))
+        return {'success': True, 'phase': state['phase'], 'cursor': state['cursor'],
+                'pass_completed': pass_completed, 'io_used': budget.io_used,
+                'seconds': round(time.monotonic() - started, 2), 'counts': state['counts']}
+
+    except Exception as e:
+        logging.error(f"❌ Depot GC error ({state['phase']}): {e}")
+        database.set_app_state(STATE_KEY, json.dumps(state, ensure_ascii=False))
+        return {'success': False, 'error': str(e), 'phase': state['phase']}
+
+
+def get_gc_report():
+    """Progress of the running pass and findings of the last completed one"""
+    try:
+        last = json.loads(database.get_app_state(STATE_LAST_REPORT) or 'null')
+    except ValueError:
+        last = None
+    return {'current': _load_state(), 'last_pass': last}
+
+
+def _claim_lease(seconds):
+    """Only one worker runs a GC step at a time"""
+    now = time.time()
+    with database.get_db() as conn:
+        claimed = conn.execute("INSERT OR IGNORE INTO app_state (key, value) VALUES (?, ?)",
+                               (STATE_LEASE, str(now + seconds))).rowcount
+        if not claimed:
+            claimed = conn.execute("UPDATE app_state SET value = ?, updated_at = CURRENT_TIMESTAMP "
+                                   "WHERE key = ? AND CAST(value AS REAL) < ?",
+                                   (str(now + seconds), STATE_LEASE, now)).rowcount
+        conn.commit()
+    return bool(claimed)
+
+
+def start_depot_gc():
+    """Start the background GC thread (once per process)"""
+    global _gc_thread
+    if not DEPOT_GC_ENABLED or (_gc_thread and _gc_thread.is_alive()):
+        return False
+
+    def loop():
+        while True:
+            time.sleep(DEPOT_GC_INTERVAL_SECONDS)
+            try:
+                # Kira aralık boyunca tutulur: diğer worker'lar bu turu atlar
+                if _claim_lease(DEPOT_GC_INTERVAL_SECONDS * 0.9):
+                    run_gc_step()
+            except Exception as e:
+                logging.error(f"❌ Depot GC loop error: {e}")
+
+    _gc_thread = threading.Thread(target=loop, name='depot-gc', daemon=True)
+    _gc_thread.start()
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Incremental depot GC and consistency checker')
+    parser.add_argument('command', choices=['step', 'pass', 'report'])
+    parser.add_argument('--time-budget', type=float, default=DEPOT_GC_TIME_BUDGET_SECONDS)
+    parser.add_argument('--io-budget', type=int, default=DEPOT_GC_IO_BUDGET)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    database.init_db()
+    if args.command == 'report':
+        print(json.dumps(get_gc_report(), ensure_ascii=False, indent=2))
+        return 0
+
+    while True:
+        result = run_gc_step(args.time_budget, args.io_budget)
+        if args.command == 'step' or result.get('pass_completed') or not result['success']:
+            break
+    print(json.dumps(result, ensure_ascii=False))
+    return 0 if result['success'] else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,919 @@
+# -*- coding: utf-8 -*-
+"""
+Depot Index Service - static/uploads depoları için kalıcı resim indeksi
+
+Features:
+- depot_images table: barcode, depot type, user, sector, group, relative
+  path, size, dimensions, content hash, status and timestamps
+- Index updates share one DB transaction with the filesystem change made by
+  services/image_bank.py (write / move / delete), rolled back if it fails
+- Lookups and admin listings query the index instead of os.listdir walks
+- Every indexed file is a reference into the content-addressed blob store
+  (services/blob_store.py); image_blobs.refcount is kept in sync here
+- Customer depot usage counters (services/depot_usage.py) are adjusted in
+  the same transaction as every index write / move / delete
+- Full rebuild from the existing tree (supports the flat
+  {sector}/{barcode}/, grouped {sector}/{group}/{barcode}/ and sharded
+  {sector}/{group}/ab/cd/{barcode}/ layouts)
+- Folder metadata (name, group, uploader, timestamps, status, source,
+  quality) lives in depot_images columns and is read in bulk with the rows;
+  metadata.json is only written as an optional export (DEPOT_METADATA_JSON)
+- Public URLs are versioned with the content hash (?v=<hash12>) so they can
+  be cached as immutable; stored URLs (products, admin/customer images) are
+  re-pointed whenever the file behind them changes or moves
+
+CLI:
+    python -m services.depot_index rebuild
+    python -m services.depot_index rewrite-urls
+    python -m services.depot_index import-metadata
+    python -m services.depot_index stats
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from PIL import Image
+
+import database
+from utils.constants import SECTORS, ALLOWED_IMAGE_EXTENSIONS
+from services.blob_store import link_to_blob, incref, decref, reconcile_refcounts
+from services.depot_usage import STATE_USAGE_COUNTED_AT, track_file, reconcile_usage, ensure_usage_counted
+
+# ============= CONFIGURATION =============
+
+UPLOAD_ROOT = os.path.join('static', 'uploads')
+# depot_type → klasör adı
+DEPOT_DIRS = {'admin': 'admin', 'customer': 'customers', 'pending': 'pending'}
+DEPOT_TYPES = {folder: depot_type for depot_type, folder in DEPOT_DIRS.items()}
+AI_GENERATED_SECTOR = 'ai_generated'
+
+# Büyük depolar için barkod klasörlerini hash'e göre iki seviyeli alt klasörlere dağıt:
+#   {sector}/{group}/ab/cd/{barcode}/  (mevcut düz klasörler: python -m services.depot_migrate)
+DEPOT_SHARDING = os.environ.get('DEPOT_SHARDING', 'false').lower() in ('1', 'true', 'yes')
+
+# Rebuild yazma işlemleri kısa tutulur (canlı sistemde kilit 5 sn busy timeout'u aşmasın):
+# en fazla BATCH dosya veya BATCH_SECONDS saniyede bir commit
+DEPOT_INDEX_REBUILD_BATCH = int(os.environ.get('DEPOT_INDEX_REBUILD_BATCH', 50))
+DEPOT_INDEX_REBUILD_BATCH_SECONDS = float(os.environ.get('DEPOT_INDEX_REBUILD_BATCH_SECONDS', 1.0))
+# Başka bir worker kurulumu üstlendiyse bu süreden sonra sahipsiz sayılır
+DEPOT_INDEX_BUILD_CLAIM_TTL = int(os.environ.get('DEPOT_INDEX_BUILD_CLAIM_TTL', 3600))
+
+STATE_BUILT_AT = 'depot_index_built_at'
+STATE_URLS_VERSIONED_AT = 'depot_urls_versioned_at'
+STATE_BUILD_CLAIM = 'depot_index_build_claim'
+STATE_METADATA_IMPORTED_AT = 'depot_metadata_imported_at'
+
+# Klasör metadata'sı depot_images kolonlarında tutulur; metadata.json sadece isteğe bağlı dışa aktarım
+DEPOT_METADATA_JSON = os.environ.get('DEPOT_METADATA_JSON', 'false').lower() in ('1', 'true', 'yes')
+METADATA_FILENAME = 'metadata.json'
+# depot_images kolonu → metadata.json anahtarları (ilki dışa aktarımda kullanılır)
+METADATA_COLUMNS = {
+    'product_name': ('product_name', 'name'),
+    'display_group': ('group', 'product_group'),
+    'uploader_id': ('user_id', 'original_user_id'),
+    'uploaded_at': ('uploaded_at', 'downloaded_at'),
+    'approved_at': ('approved_at',),
+    'rejected_at': ('rejected_at',),
+    'source_url': ('original_url', 'source_url'),
+    'original_filename': ('original_filename',),
+    'quality': ('quality',),
+    'status': ('status',),
+}
+METADATA_KEY_COLUMNS = {key: column for column, keys in METADATA_COLUMNS.items() for key in keys}
+# Yoldan türetilen anahtarlar ayrıca saklanmaz
+PATH_METADATA_KEYS = ('barcode', 'sector')
+
+# ?v= parametresindeki hash uzunluğu
+URL_VERSION_LENGTH = 12
+# Depo resim adresi saklayan (tablo, kolon) çiftleri
+IMAGE_URL_COLUMNS = [
+    ('products', 'image_url'),
+    ('customer_images', 'image_url'),
+    ('admin_images', 'image_url'),
+    ('admin_products', 'image_url'),
+    ('customer_custom_products', 'custom_image'),
+]
+
+# depot_images / product_tombstones zaman damgaları (mikrosaniye: silmeyle aynı saniyede
+# yüklenen resim silinenlerle karışmaz)
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+# Aktif bir silme kaydından (mezar taşı) önce indekslenmiş resimler okumalarda gizlenir;
+# dosyaları services/tombstones.py arka planda siler
+NOT_TOMBSTONED = '''NOT EXISTS (SELECT 1 FROM product_tombstones t
+                                WHERE t.barcode = depot_images.barcode AND t.status != 'done'
+                                  AND depot_images.updated_at <= t.created_at)'''
+
+UPSERT_SQL = '''
+    INSERT INTO depot_images (barcode, depot_type, user_id, sector, product_group, rel_path,
+                              file_size, width, height, content_hash, status,
+                              created_at, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(rel_path) DO UPDATE SET
+        barcode = excluded.barcode,
+        depot_type = excluded.depot_type,
+        user_id = excluded.user_id,
+        sector = excluded.sector,
+        product_group = excluded.product_group,
+        file_size = excluded.file_size,
+        width = excluded.width,
+        height = excluded.height,
+        content_hash = excluded.content_hash,
+        status = COALESCE(excluded.status, depot_images.status),
+        phash = CASE WHEN depot_images.content_hash IS excluded.content_hash
+                     THEN depot_images.phash ELSE NULL END,
+        dhash = CASE WHEN depot_images.content_hash IS excluded.content_hash
+                     THEN depot_images.dhash ELSE NULL END,
+        updated_at = CASE WHEN depot_images.content_hash IS excluded.content_hash
+                          THEN depot_images.updated_at ELSE excluded.updated_at END
+'''
+
+
+# ============= PATH HELPERS =============
+
+def to_rel_path(path):
+    """
+    Filesystem path or /static/uploads/... URL → path relative to UPLOAD_ROOT
+    with '/' separators (the depot_images.rel_path format).
+    """
+    path = str(path).split('?', 1)[0].replace('\\', '/')
+    root = UPLOAD_ROOT.replace('\\', '/')
+    if path.startswith(f'/{root}/'):
+        path = path[len(root) + 2:]
+    elif os.path.isabs(path):
+        path = os.path.relpath(path, os.path.abspath(UPLOAD_ROOT)).replace('\\', '/')
+    elif path.startswith(root + '/'):
+        path = path[len(root) + 1:]
+    return path.rstrip('/')
+
+
+def to_fs_path(rel_path):
+    """depot_images.rel_path → filesystem path"""
+    return os.path.join(UPLOAD_ROOT, *rel_path.split('/'))
+
+
+def image_url_for(rel_path, content_hash=None):
+    """depot_images.rel_path → public URL (versioned when the hash is known)"""
+    url = f"/{UPLOAD_ROOT.replace(os.sep, '/')}/{rel_path}"
+    return f'{url}?v={content_hash[:URL_VERSION_LENGTH]}' if content_hash else url
+
+
+def _prefix_range(folder_rel):
+    """[low, high) bounds matching every rel_path below a folder (uses the UNIQUE index)"""
+    return folder_rel + '/', folder_rel + '0'  # '0' = '/' + 1
+
+
+def shard_dirs(barcode):
+    """Two-level shard directories of a barcode folder: ('ab', 'cd') from md5(barcode)"""
+    digest = hashlib.md5(str(barcode).encode('utf-8')).hexdigest()
+    return digest[:2], digest[2:4]
+
+
+def parse_depot_path(rel_path):
+    """
+    Derive index fields from an image path.
+
+    Layouts ([ab/cd/] = optional shard directories, see shard_dirs):
+        admin/{sector}/[{group}/][ab/cd/]{barcode}/{file}
+        pending/{sector}/[{group}/][ab/cd/]{barcode}/{file}
+        customers/{user_id}/{sector}/[{group}/][ab/cd/]{barcode}/{file}
+        customers/{user_id}/ai_generated/{file}
+
+    Returns:
+        dict or None if the path is not a depot image
+    """
+    parts = rel_path.split('/')
+    if len(parts) < 3 or os.path.splitext(parts[-1])[1].lower() not in ALLOWED_IMAGE_EXTENSIONS:
+        return None
+
+    depot_type = DEPOT_TYPES.get(parts[0])
+    user_id = 0
+    rest = parts[1:]
+    if depot_type == 'customer':
+        if not rest[0].isdigit():
+            return None
+        user_id = int(rest[0])
+        rest = rest[1:]
+        if len(rest) == 2 and rest[0] == AI_GENERATED_SECTOR:
+            return {'depot_type': depot_type, 'user_id': user_id, 'sector': AI_GENERATED_SECTOR,
+                    'product_group': 'AI', 'barcode': os.path.splitext(rest[1])[0]}
+    elif depot_type is None:
+        return None
+
+    # rest: sector, [group], [ab, cd], barcode, file
+    if len(rest) < 3 or rest[0] not in SECTORS:
+        return None
+    sharded = len(rest) >= 5 and tuple(rest[-4:-2]) == shard_dirs(rest[-2])
+    if sharded:
+        rest = rest[:-4] + rest[-2:]
+    if len(rest) not in (3, 4):
+        return None
+    return {
+        'depot_type': depot_type,
+        'user_id': user_id,
+        'sector': rest[0],
+        'product_group': rest[1] if len(rest) == 4 else None,
+        'barcode': rest[-2],
+        'sharded': sharded
+    }
+
+
+def _now():
+    return datetime.now().strftime(TIMESTAMP_FORMAT)
+
+
+def _read_image_info(fs_path, content_hash=None):
+    """File size, dimensions (header only), sha256 and mtime of an image file"""
+    if not content_hash:
+        sha = hashlib.sha256()
+        with open(fs_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(chunk)
+        content_hash = sha.hexdigest()
+    width = height = 0
+    try:
+        with Image.open(fs_path) as img:
+            width, height = img.size
+    except Exception:
+        pass
+    stat = os.stat(fs_path)
+    modified = datetime.fromtimestamp(stat.st_mtime).strftime(TIMESTAMP_FORMAT)
+    return stat.st_size, width, height, content_hash, modified
+
+
+# ============= WRITE =============
+
+@contextmanager
+def index_transaction():
+    """
+    DB transaction around a filesystem change + index update. Commits when
+    the block succeeds, rolls the index back if the block raises.
+
+        with index_transaction() as conn:
+            shutil.move(src, dst)
+            move_image(src, dst, conn=conn)
+    """
+    with database.get_db() as conn:
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
+@contextmanager
+def _connection(conn):
+    """Reuse the caller's transaction or open (and commit) a new one"""
+    if conn is not None:
+        yield conn
+    else:
+        with index_transaction() as own:
+            yield own
+
+
+def index_image(path, status=None, conn=None, content_hash=None, retarget=True, info=None):
+    """
+    Add or refresh one image file in the index and link it to its blob.
+
+    Args:
+        content_hash: Known sha256 (e.g. from blob_store.write_depot_file) to skip re-hashing
+        retarget: Re-point stored URLs of a changed file (off during a full
+                  rebuild, which rewrites all URLs once at the end)
+        info: _read_image_info() result read before the transaction (rebuild)
+
+    Returns:
+        dict: Indexed fields or None if the path is not a depot image
+    """
+    rel_path = to_rel_path(path)
+    fields = parse_depot_path(rel_path)
+    if not fields:
+        return None
+
+    fs_path = to_fs_path(rel_path)
+    file_size, width, height, content_hash, modified = info or _read_image_info(fs_path, content_hash)
+    with _connection(conn) as c:
+        old = c.execute('''SELECT content_hash, file_size, depot_type, user_id, sector
+                           FROM depot_images WHERE rel_path = ?''', (rel_path,)).fetchone()
+        c.execute(UPSERT_SQL, (fields['barcode'], fields['depot_type'], fields['user_id'], fields['sector'],
+                               fields['product_group'], rel_path, file_size, width, height, content_hash,
+                               status, modified, modified))
+        link_to_blob(fs_path, content_hash, c)
+        if not old or old['file_size'] != file_size:
+            track_file(c, old, -1)
+            track_file(c, {**fields, 'file_size': file_size}, 1)
+        if not old or old['content_hash'] != content_hash:
+            decref(c, old['content_hash'] if old else None)
+            incref(c, content_hash)
+            if retarget:
+                _retarget_urls(c, rel_path, rel_path, content_hash)
+            # Aynı içerik başka yerde hash'lendiyse algısal hash'leri kopyala
+            c.execute('''UPDATE depot_images SET (phash, dhash) = (
+                                SELECT phash, dhash FROM depot_images
+                                WHERE content_hash = ? AND phash IS NOT NULL LIMIT 1)
+                         WHERE rel_path = ? AND phash IS NULL''', (content_hash, rel_path))
+    return {**fields, 'rel_path': rel_path, 'file_size': file_size, 'width': width,
+            'height': height, 'content_hash': content_hash}
+
+
+def index_folder(folder, status=None, conn=None):
+    """Index every image file directly inside a barcode folder"""
+    indexed = 0
+    if not os.path.isdir(folder):
+        return indexed
+    with _connection(conn) as c:
+        for filename in os.listdir(folder):
+            if os.path.splitext(filename)[1].lower() in ALLOWED_IMAGE_EXTENSIONS:
+                if index_image(os.path.join(folder, filename), status=status, conn=c):
+                    indexed += 1
+    return indexed
+
+
+def move_image(old_path, new_path, status=None, conn=None):
+    """Re-point an indexed file after a move (re-indexes if it was unknown)"""
+    old_rel, new_rel = to_rel_path(old_path), to_rel_path(new_path)
+    if old_rel == new_rel:
+        return 1 if index_image(new_rel, status=status, conn=conn) else 0
+
+    fields = parse_depot_path(new_rel)
+    with _connection(conn) as c:
+        _delete_rows(c, "rel_path = ?", (new_rel,))
+        if not fields:
+            _delete_rows(c, "rel_path = ?", (old_rel,))
+            return 0
+        old = c.execute('''SELECT file_size, depot_type, user_id, sector
+                           FROM depot_images WHERE rel_path = ?''', (old_rel,)).fetchone()
+        cur = c.execute('''UPDATE depot_images SET rel_path = ?, barcode = ?, depot_type = ?, user_id = ?,
+                                  sector = ?, product_group = ?, status = COALESCE(?, status),
+                                  updated_at = ?
+                           WHERE rel_path = ?''',
+                        (new_rel, fields['barcode'], fields['depot_type'], fields['user_id'],
+                         fields['sector'], fields['product_group'], status, _now(), old_rel))
+        if cur.rowcount:
+            track_file(c, old, -1)
+            track_file(c, {**fields, 'file_size': old['file_size']}, 1)
+        else:
+            index_image(new_rel, status=status, conn=c)
+        row = c.execute("SELECT content_hash FROM depot_images WHERE rel_path = ?", (new_rel,)).fetchone()
+        if row:
+            _retarget_urls(c, old_rel, new_rel, row['content_hash'])
+    return 1
+
+
+def move_folder(old_folder, new_folder, status=None, conn=None):
+    """Re-point every indexed file of a moved folder"""
+    old_rel = to_rel_path(old_folder)
+    low, high = _prefix_range(old_rel)
+    with _connection(conn) as c:
+        rows = c.execute("SELECT rel_path FROM depot_images WHERE rel_path >= ? AND rel_path < ?",
+                         (low, high)).fetchall()
+        for row in rows:
+            new_path = os.path.join(new_folder, row['rel_path'][len(low):])
+            move_image(row['rel_path'], new_path, status=status, conn=c)
+        if not rows:
+            return index_folder(new_folder, status=status, conn=c)
+    return len(rows)
+
+
+def _url_range(prefix):
+    """[low, high) bounds matching every string starting with prefix (uses the column index)"""
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _retarget_urls(conn, old_rel, new_rel, content_hash):
+    """Point stored URLs of old_rel (versioned or not) to the current versioned URL of new_rel"""
+    old_url = image_url_for(old_rel)
+    new_url = image_url_for(new_rel, content_hash)
+    low, high = _url_range(f'{old_url}?v=')
+    for table, column in IMAGE_URL_COLUMNS:
+        conn.execute(f'''UPDATE {table} SET {column} = ?
+                         WHERE ({column} = ? OR ({column} >= ? AND {column} < ?)) AND {column} != ?''',
+                     (new_url, old_url, low, high, new_url))
+
+
+def rewrite_image_urls(conn=None):
+    """
+    Rewrite every stored depot URL to its versioned form using the index
+    (one-time migration; also run after a full rebuild).
+
+    Returns:
+        int: Number of updated rows
+    """
+    low, high = _url_range(f"/{UPLOAD_ROOT.replace(os.sep, '/')}/")
+    updated = 0
+    with _connection(conn) as c:
+        hashes = {row['rel_path']: row['content_hash'] for row in
+                  c.execute("SELECT rel_path, content_hash FROM depot_images WHERE content_hash IS NOT NULL")}
+        for table, column in IMAGE_URL_COLUMNS:
+            rows = c.execute(f"SELECT DISTINCT {column} AS url FROM {table} WHERE {column} >= ? AND {column} < ?",
+                             (low, high)).fetchall()
+            for row in rows:
+                content_hash = hashes.get(to_rel_path(row['url']))
+                if not content_hash:
+                    continue
+                new_url = image_url_for(to_rel_path(row['url']), content_hash)
+                if new_url != row['url']:
+                    updated += c.execute(f"UPDATE {table} SET {column} = ? WHERE {column} = ?",
+                                         (new_url, row['url'])).rowcount
+    return updated
+
+
+def _delete_rows(conn, where, params):
+    """Delete index rows, release their blob references and usage"""
+    for row in conn.execute(f'''SELECT content_hash, file_size, depot_type, user_id, sector
+                                 FROM depot_images WHERE {where}''', params).fetchall():
+        decref(conn, row['content_hash'])
+        track_file(conn, row, -1)
+    return conn.execute(f"DELETE FROM depot_images WHERE {where}", params).rowcount
+
+
+def remove_image(path, conn=None):
+    """Drop one file from the index"""
+    with _connection(conn) as c:
+        return _delete_rows(c, "rel_path = ?", (to_rel_path(path),))
+
+
+def remove_folder(folder, conn=None):
+    """Drop every indexed file below a folder"""
+    low, high = _prefix_range(to_rel_path(folder))
+    with _connection(conn) as c:
+        return _delete_rows(c, "rel_path >= ? AND rel_path < ?", (low, high))
+
+
+def set_folder_status(folder, status, conn=None):
+    """Update status of every indexed file below a folder"""
+    low, high = _prefix_range(to_rel_path(folder))
+    with _connection(conn) as c:
+        return c.execute('''UPDATE depot_images SET status = ?, updated_at = ?
+                            WHERE rel_path >= ? AND rel_path < ?''', (status, _now(), low, high)).rowcount
+
+
+# ============= FOLDER METADATA =============
+
+def _split_metadata(metadata):
+    """metadata.json-style dict → ({column: value}, {extra key: value})"""
+    columns, extra = {}, {}
+    for key, value in metadata.items():
+        column = METADATA_KEY_COLUMNS.get(key)
+        if column == 'uploader_id' and value is not None:
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                column = None
+        if column:
+            # Aynı kolona iki anahtar gelirse birincil anahtar kazanır
+            if column not in columns or key == METADATA_COLUMNS[column][0]:
+                columns[column] = value
+        elif key not in PATH_METADATA_KEYS:
+            extra[key] = value
+    return columns, extra
+
+
+def row_metadata(row):
+    """metadata.json-style dict of an index row (no file access)"""
+    try:
+        metadata = json.loads(row['metadata']) if row['metadata'] else {}
+    except ValueError:
+        metadata = {}
+    metadata['barcode'] = row['barcode']
+    metadata['sector'] = row['sector']
+    for column, keys in METADATA_COLUMNS.items():
+        if row[column] is not None:
+            metadata[keys[0]] = row[column]
+    if metadata.get('group') is None and row['product_group']:
+        metadata['group'] = row['product_group']
+    return metadata
+
+
+def _write_metadata_json(folder_rel, metadata):
+    """Export a folder's metadata as metadata.json (DEPOT_METADATA_JSON)"""
+    folder = to_fs_path(folder_rel)
+    if not os.path.isdir(folder):
+        return
+    target = os.path.join(folder, METADATA_FILENAME)
+    tmp_path = f'{target}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, target)
+
+
+def set_folder_metadata(folder, updates, conn=None, only_missing=False):
+    """
+    Merge metadata into every indexed file of a barcode folder. Keys use the
+    metadata.json names (see METADATA_COLUMNS); unknown keys are kept in the
+    `metadata` JSON column, a None value clears a field.
+
+    Args:
+        only_missing: Skip rows that already have metadata (legacy import)
+
+    Returns:
+        dict: Merged metadata, or None if the folder has no indexed file
+    """
+    folder_rel = to_rel_path(folder)
+    low, high = _prefix_range(folder_rel)
+    columns, extra = _split_metadata(updates)
+    with _connection(conn) as c:
+        row = c.execute('''SELECT * FROM depot_images WHERE rel_path >= ? AND rel_path < ?
+                           ORDER BY metadata IS NULL, updated_at DESC, id DESC LIMIT 1''',
+                        (low, high)).fetchone()
+        if not row or (only_missing and row['metadata'] is not None):
+            return None
+        try:
+            merged = json.loads(row['metadata']) if row['metadata'] else {}
+        except ValueError:
+            merged = {}
+        merged.update(extra)
+        merged = {key: value for key, value in merged.items() if value is not None}
+
+        # Eski dosyadan içe aktarım değişiklik sayılmaz (updated_at korunur)
+        columns['metadata'] = json.dumps(merged, ensure_ascii=False)
+        if not only_missing:
+            columns['updated_at'] = _now()
+        c.execute(f'''UPDATE depot_images SET {', '.join(f'{column} = ?' for column in columns)}
+                      WHERE rel_path >= ? AND rel_path < ?''', [*columns.values(), low, high])
+        row = c.execute("SELECT * FROM depot_images WHERE rel_path >= ? AND rel_path < ? ORDER BY id LIMIT 1",
+                        (low, high)).fetchone()
+    metadata = row_metadata(row)
+    if DEPOT_METADATA_JSON:
+        try:
+            _write_metadata_json(folder_rel, metadata)
+        except OSError as e:
+            logging.warning(f"⚠️ {folder_rel}/{METADATA_FILENAME} yazılamadı - {e}")
+    return metadata
+
+
+def read_metadata_file(folder):
+    """Legacy metadata.json of a folder ({} if missing/unreadable)"""
+    metadata_file = os.path.join(folder, METADATA_FILENAME)
+    if not os.path.exists(metadata_file):
+        return {}
+    try:
+        with open(metadata_file, 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+        return metadata if isinstance(metadata, dict) else {}
+    except Exception:
+        return {}
+
+
+def import_metadata_files(conn=None):
+    """
+    Copy legacy metadata.json files into the index for folders that have no
+    metadata yet (one-time migration; the files are left in place).
+
+    Returns:
+        int: Number of imported folders
+    """
+    imported = 0
+    with _connection(conn) as c:
+        rows = c.execute("SELECT DISTINCT rel_path FROM depot_images WHERE metadata IS NULL").fetchall()
+        folders = sorted({row['rel_path'].rsplit('/', 1)[0] for row in rows})
+        for folder_rel in folders:
+            metadata = read_metadata_file(to_fs_path(folder_rel))
+            if metadata and set_folder_metadata(folder_rel, metadata, conn=c, only_missing=True) is not None:
+                imported += 1
+    return imported
+
+
+# ============= READ =============
+
+def _row(row):
+    row = dict(row)
+    row['image_path'] = to_fs_path(row['rel_path'])
+    row['image_url'] = image_url_for(row['rel_path'], row['content_hash'])
+    row['folder'] = os.path.dirname(row['image_path'])
+    return row
+
+
+def find_depot_image(depot_type, barcode, sector, user_id=0, group=None):
+    """
+    Latest indexed image of a barcode in one depot (any group unless given).
+
+    Returns:
+        dict: depot_images row + image_path / image_url / folder, or None
+    """
+    query = f'''SELECT * FROM depot_images
+                WHERE barcode = ? AND depot_type = ? AND sector = ? AND user_id = ? AND {NOT_TOMBSTONED}'''
+    params = [str(barcode), depot_type, sector, int(user_id or 0)]
+    if group:
+        query += " AND product_group = ?"
+        params.append(group)
+    query += " ORDER BY updated_at DESC, id DESC LIMIT 1"
+
+    with database.get_db() as conn:
+        row = conn.execute(query, params).fetchone()
+    return _row(row) if row else None
+
+
+def find_depot_images_bulk(barcodes, sector, user_id=0, chunk_size=500):
+    """
+    Best depot image for many barcodes: customer depot of `user_id` first,
+    then admin depot, any group. One indexed query per chunk.
+
+    Returns:
+        dict: {barcode: depot_images row + image_path / image_url / folder}
+    """
+    barcodes = list(dict.fromkeys(str(b).strip() for b in barcodes if str(b or '').strip()))
+    best = {}
+    with database.get_db() as conn:
+        for start in range(0, len(barcodes), chunk_size):
+            chunk = barcodes[start:start + chunk_size]
+            rows = conn.execute(f'''
+                SELECT * FROM depot_images
+                WHERE barcode IN ({','.join('?' * len(chunk))}) AND sector = ?
+                  AND ((depot_type = 'customer' AND user_id = ?) OR depot_type = 'admin')
+                  AND {NOT_TOMBSTONED}
+                ORDER BY CASE depot_type WHEN 'customer' THEN 0 ELSE 1 END, updated_at DESC, id DESC
+            ''', [*chunk, sector, int(user_id or 0)]).fetchall()
+            for row in rows:
+                if row['barcode'] not in best:
+                    best[row['barcode']] = _row(row)
+    return best
+
+
+def find_image_by_path(path, include_tombstoned=False):
+    """Index row of one depot file (URL, absolute or relative path), or None"""
+    query = "SELECT * FROM depot_images WHERE rel_path = ?"
+    if not include_tombstoned:
+        query += f" AND {NOT_TOMBSTONED}"
+    with database.get_db() as conn:
+        row = conn.execute(query, (to_rel_path(path),)).fetchone()
+    return _row(row) if row else None
+
+
+def depot_url(path):
+    """Versioned public URL of a depot file (unversioned if it is not indexed)"""
+    image = find_image_by_path(path)
+    return image['image_url'] if image else image_url_for(to_rel_path(path))
+
+
+def find_images_in_folder(folder):
+    """Indexed images directly inside a barcode folder"""
+    low, high = _prefix_range(to_rel_path(folder))
+    with database.get_db() as conn:
+        rows = conn.execute('''SELECT * FROM depot_images WHERE rel_path >= ? AND rel_path < ?
+                               ORDER BY updated_at DESC, id DESC''', (low, high)).fetchall()
+    return [_row(row) for row in rows if '/' not in row['rel_path'][len(low):]]
+
+
+def iter_depot_images(depot_type=None, user_id=None, sector=None, since=None):
+    """Every indexed image matching the filters (since: updated_at >= ISO timestamp), by path"""
+    query = f"SELECT * FROM depot_images WHERE {NOT_TOMBSTONED}"
+    params = []
+    if depot_type:
+        query += " AND depot_type = ?"
+        params.append(depot_type)
+    if user_id is not None:
+        query += " AND user_id = ?"
+        params.append(int(user_id))
+    if sector:
+        query += " AND sector = ?"
+        params.append(sector)
+    if since:
+        query += " AND updated_at >= ?"
+        params.append(str(since).replace('T', ' ')[:19])
+    query += " ORDER BY rel_path"
+    with database.get_db() as conn:
+        rows = conn.execute(query, params).fetchall()
+    return [_row(row) for row in rows]
+
+
+def list_depot_images(depot_type=None, sector=None, user_id=None, barcode=None, one_per_folder=True):
+    """
+    Indexed images filtered by depot, sector, user and/or barcode.
+
+    Args:
+        one_per_folder: Return only the latest file of each barcode folder
+
+    Returns:
+        list: depot_images rows + image_path / image_url / folder
+    """
+    conditions, params = [NOT_TOMBSTONED], []
+    for column, value in (('depot_type', depot_type), ('sector', sector), ('barcode', barcode)):
+        if value is not None:
+            conditions.append(f"{column} = ?")
+            params.append(value)
+    if user_id is not None:
+        conditions.append("user_id = ?")
+        params.append(int(user_id))
+
+    query = "SELECT * FROM depot_images WHERE " + " AND ".join(conditions)
+    query += " ORDER BY updated_at DESC, id DESC"
+
+    with database.get_db() as conn:
+        rows = [_row(row) for row in conn.execute(query, params).fetchall()]
+
+    if not one_per_folder:
+        return rows
+    seen, unique = set(), []
+    for row in rows:
+        if row['folder'] not in seen:
+            seen.add(row['folder'])
+            unique.append(row)
+    return unique
+
+
+def get_depot_index_stats():
+    """Row counts per depot type and last build time"""
+    with database.get_db() as conn:
+        rows = conn.execute('''SELECT depot_type, COUNT(*) AS files, COALESCE(SUM(file_size), 0) AS bytes
+                               FROM depot_images GROUP BY depot_type''').fetchall()
+    return {
+        'depots': {row['depot_type']: {'files': row['files'], 'bytes': row['bytes']} for row in rows},
+        'built_at': database.get_app_state(STATE_BUILT_AT)
+    }
+
+
+# ============= REBUILD =============
+
+def _write_rebuild_batch(conn, batch, seen, stats):
+    """
+    Index pre-read files, committing at least every
+    DEPOT_INDEX_REBUILD_BATCH_SECONDS so the write lock is held briefly.
+    """
+    started = time.monotonic()
+    for fs_path, status, info in batch:
+        try:
+            result = index_image(fs_path, status=status, conn=conn, retarget=False, info=info)
+        except Exception as e:
+            logging.warning(f"⚠️ Depot index: {fs_path} indekslenemedi - {e}")
+            result = None
+        if not result:
+            stats['skipped'] += 1
+            continue
+        seen.add(result['rel_path'])
+        stats['indexed'] += 1
+        if time.monotonic() - started >= DEPOT_INDEX_REBUILD_BATCH_SECONDS:
+            conn.commit()
+            started = time.monotonic()
+    conn.commit()
+
+
+def rebuild_depot_index(batch_size=None):
+    """
+    Walk static/uploads/{admin,customers,pending} once, upsert every image
+    (linking it into the blob store, which dedups existing copies), drop
+    index rows whose files are gone and recompute blob refcounts and
+    customer usage counters.
+
+    Files are hashed and their headers read outside any transaction; the
+    index is written in short batches (batch_size files, at most
+    DEPOT_INDEX_REBUILD_BATCH_SECONDS each), so uploads and moves on a
+    live system only wait for one batch.
+
+    Returns:
+        dict: {'success', 'indexed', 'removed', 'skipped', 'urls_rewritten',
+               'metadata_imported', 'seconds'}
+    """
+    batch_size = batch_size or DEPOT_INDEX_REBUILD_BATCH
+    started = time.monotonic()
+    stats = {'indexed': 0, 'removed': 0, 'skipped': 0}
+    seen = set()
+    metadata_cache = {}
+
+    try:
+        with database.get_db() as conn:
+            batch = []
+            for folder_name in DEPOT_DIRS.values():
+                depot_root = os.path.join(UPLOAD_ROOT, folder_name)
+                for root, dirs, files in os.walk(depot_root):
+                    dirs.sort()
+                    for filename in sorted(files):
+                        if os.path.splitext(filename)[1].lower() not in ALLOWED_IMAGE_EXTENSIONS:
+                            continue
+                        fs_path = os.path.join(root, filename)
+                        if root not in metadata_cache:
+                            metadata_cache = {root: read_metadata_file(root)}
+                        try:
+                            info = _read_image_info(fs_path)
+                        except OSError as e:
+                            logging.warning(f"⚠️ Depot index: {fs_path} okunamadı - {e}")
+                            stats['skipped'] += 1
+                            continue
+                        batch.append((fs_path, metadata_cache[root].get('status'), info))
+                        if len(batch) >= batch_size:
+                            _write_rebuild_batch(conn, batch, seen, stats)
+                            batch = []
+                            if stats['indexed'] % 1000 < batch_size:
+                                logging.info(f"📇 Depot index: {stats['indexed']} resim indekslendi")
+            _write_rebuild_batch(conn, batch, seen, stats)
+
+            # Dosyası kalmayan satırları sil (tarama sırasında yüklenenler kalır)
+            stale = [row['rel_path'] for row in conn.execute("SELECT rel_path FROM depot_images")
+                     if row['rel_path'] not in seen and not os.path.exists(to_fs_path(row['rel_path']))]
+            for start in range(0, len(stale), batch_size):
+                chunk = stale[start:start + batch_size]
+                conn.execute(f"DELETE FROM depot_images WHERE rel_path IN ({','.join('?' * len(chunk))})", chunk)
+                conn.commit()
+            stats['removed'] = len(stale)
+
+            reconcile_refcounts(conn)
+            reconcile_usage(conn)
+            stats['urls_rewritten'] = rewrite_image_urls(conn)
+            conn.commit()
+            # Eski metadata.json dosyaları (sadece metadata'sı olmayan klasörler için)
+            stats['metadata_imported'] = import_metadata_files(conn)
+            conn.commit()
+
+        database.set_app_state(STATE_BUILT_AT, datetime.now().isoformat())
+        database.set_app_state(STATE_URLS_VERSIONED_AT, datetime.now().isoformat())
+        database.set_app_state(STATE_METADATA_IMPORTED_AT, datetime.now().isoformat())
+        database.set_app_state(STATE_USAGE_COUNTED_AT, datetime.now().isoformat())
+        stats['seconds'] = round(time.monotonic() - started, 2)
+        logging.info(f"✅ Depot index rebuild tamamlandı: {stats}")
+        return {'success': True, **stats}
+
+    except Exception as e:
+        logging.error(f"❌ Depot index rebuild error: {e}")
+        return {'success': False, 'error': str(e), **stats}
+
+
+def _claim_build():
+    """Only one worker builds the initial index"""
+    now = time.time()
+    with database.get_db() as conn:
+        claimed = conn.execute("INSERT OR IGNORE INTO app_state (key, value) VALUES (?, ?)",
+                               (STATE_BUILD_CLAIM, str(now))).rowcount
+        if not claimed:
+            claimed = conn.execute("UPDATE app_state SET value = ?, updated_at = CURRENT_TIMESTAMP "
+                                   "WHERE key = ? AND CAST(value AS REAL) < ?",
+                                   (str(now), STATE_BUILD_CLAIM, now - DEPOT_INDEX_BUILD_CLAIM_TTL)).rowcount
+        conn.commit()
+    return bool(claimed)
+
+
+def ensure_depot_index(background=True):
+    """
+    Build the index once if it has never been built (first start after
+    upgrade). Runs in a background thread by default.
+    """
+    if database.get_app_state(STATE_BUILT_AT):
+        if not database.get_app_state(STATE_URLS_VERSIONED_AT):
+            # İndeks sürümlü adreslerden önce kurulmuş: kayıtlı adresleri bir kez dönüştür
+            with index_transaction() as conn:
+                updated = rewrite_image_urls(conn)
+            database.set_app_state(STATE_URLS_VERSIONED_AT, datetime.now().isoformat())
+            logging.info(f"🔗 {updated} resim adresi sürümlü hale getirildi")
+        if not database.get_app_state(STATE_METADATA_IMPORTED_AT):
+            # İndeks metadata kolonlarından önce kurulmuş: metadata.json dosyalarını bir kez içe aktar
+            with index_transaction() as conn:
+                imported = import_metadata_files(conn)
+            database.set_app_state(STATE_METADATA_IMPORTED_AT, datetime.now().isoformat())
+            logging.info(f"🗂️ {imported} klasörün metadata.json içeriği indekse aktarıldı")
+        ensure_usage_counted()
+        return False
+    if not _claim_build():
+        return False
+
+    def build():
+        try:
+            rebuild_depot_index()
+        finally:
+            database.delete_app_state(STATE_BUILD_CLAIM)
+
+    logging.info("📇 Depot index bulunamadı, mevcut depolardan oluşturuluyor...")
+    if background:
+        threading.Thread(target=build, name='depot-index-build', daemon=True).start()
+    else:
+        build()
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Depot image index maintenance')
+    parser.add_argument('command', choices=['rebuild', 'rewrite-urls', 'import-metadata', 'stats'])
+    parser.add_argument('--batch-size', type=int, default=DEPOT_INDEX_REBUILD_BATCH)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    database.init_db()
+    if args.command == 'rebuild':
+        result = rebuild_depot_index(args.batch_size)
+        print(json.dumps(result, ensure_ascii=False))
+        return 0 if result['success'] else 1
+    if args.command == 'rewrite-urls':
+        with index_transaction() as conn:
+            updated = rewrite_image_urls(conn)
+        database.set_app_state(STATE_URLS_VERSIONED_AT, datetime.now().isoformat())
+        print(json.dumps({'success': True, 'updated': updated}, ensure_ascii=False))
+        return 0
+
+    if args.command == 'import-metadata':
+        with index_transaction() as conn:
+            imported = import_metadata_files(conn)
+        database.set_app_state(STATE_METADATA_IMPORTED_AT, datetime.now().isoformat())
+        print(json.dumps({'success': True, 'imported': imported}, ensure_ascii=False))
+        return 0
+
+    print(json.dumps(get_depot_index_stats(), ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
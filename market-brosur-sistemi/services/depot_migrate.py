@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Depot Migrate Service - Depo klasör düzeni geçişi (parçalı / düz)
+
+Moves barcode folders between the plain layout
+    {sector}/{group}/{barcode}/
+and the sharded layout (DEPOT_SHARDING, see depot_index.shard_dirs)
+    {sector}/{group}/ab/cd/{barcode}/
+
+- Online: one folder per transaction; the folder rename, the depot index
+  rows and every stored image_url pointing into it change together
+- Resumable: progress is kept in app_state (cursor over depot_images.rel_path);
+  an interrupted run continues where it stopped, already moved folders are skipped
+- Batched: --batch-size folders per step, --max-folders per run
+
+CLI:
+    python -m services.depot_migrate shard [--batch-size 200] [--max-folders N]
+    python -m services.depot_migrate unshard
+    python -m services.depot_migrate status
+"""
+
+import os
+import json
+import time
+import logging
+import argparse
+
+import database
+from services.depot_index import (
+    DEPOT_SHARDING,
+    STATE_BUILT_AT,
+    parse_depot_path,
+    shard_dirs,
+    to_fs_path,
+    index_transaction,
+    move_folder,
+    rebuild_depot_index
+)
+
+# ============= CONFIGURATION =============
+
+DEPOT_MIGRATE_BATCH = int(os.environ.get('DEPOT_MIGRATE_BATCH', 200))
+STATE_CURSOR = 'depot_migrate_cursor_{mode}'
+
+
+def _target_folder(rel_path, shard):
+    """
+    Relative barcode folder of rel_path in the requested layout, or None if
+    the file is not a barcode-folder image or already in that layout.
+    """
+    fields = parse_depot_path(rel_path)
+    if not fields or 'sharded' not in fields or fields['sharded'] == shard:
+        return None
+    parts = rel_path.split('/')[:-1]
+    barcode = fields['barcode']
+    if shard:
+        return '/'.join(parts[:-1] + list(shard_dirs(barcode)) + [barcode])
+    return '/'.join(parts[:-3] + [barcode])
+
+
+def _move_tree(old_fs, new_fs, moves):
+    """
+    Rename a folder; merge entry by entry if the target already exists.
+    Every completed rename is appended to `moves` as (src, dst).
+    """
+    os.makedirs(os.path.dirname(new_fs), exist_ok=True)
+    if not os.path.exists(new_fs):
+        os.replace(old_fs, new_fs)
+        moves.append((old_fs, new_fs))
+        return
+    for name in os.listdir(old_fs):
+        os.replace(os.path.join(old_fs, name), os.path.join(new_fs, name))
+        moves.append((os.path.join(old_fs, name), os.path.join(new_fs, name)))
+    os.rmdir(old_fs)
+
+
+def _restore_tree(moves):
+    """Undo _move_tree renames (the index update failed and was rolled back)"""
+    for src, dst in reversed(moves):
+        os.makedirs(os.path.dirname(src), exist_ok=True)
+        os.replace(dst, src)
+
+
+def _remove_empty_shards(old_fs, shard):
+    """Drop the ab/cd folders left empty after unsharding"""
+    if shard:
+        return
+    parent = os.path.dirname(old_fs)
+    for _ in range(2):
+        try:
+            os.rmdir(parent)
+        except OSError:
+            return
+        parent = os.path.dirname(parent)
+
+
+def migrate_layout(shard=True, batch_size=None, max_folders=None):
+    """
+    Move barcode folders into (shard=True) or out of (shard=False) the
+    sharded layout.
+
+    Returns:
+        dict: {'success', 'done', 'moved', 'failed', 'cursor', 'seconds'}
+    """
+    batch_size = batch_size or DEPOT_MIGRATE_BATCH
+    mode = 'shard' if shard else 'unshard'
+    state_key = STATE_CURSOR.format(mode=mode)
+    started = time.monotonic()
+    stats = {'moved': 0, 'failed': 0}
+
+    if not database.get_app_state(STATE_BUILT_AT):
+        rebuild_depot_index()
+    if shard != DEPOT_SHARDING:
+        logging.warning(f"⚠️ DEPOT_SHARDING={DEPOT_SHARDING}: yeni yüklemeler hedef düzende olmayacak")
+
+    cursor = database.get_app_state(state_key) or ''
+    done = False
+    try:
+        while max_folders is None or stats['moved'] < max_folders:
+            with database.get_db() as conn:
+                rows = conn.execute('''SELECT rel_path FROM depot_images WHERE rel_path > ?
+                                       ORDER BY rel_path LIMIT ?''', (cursor, batch_size)).fetchall()
+            if not rows:
+                done = True
+                break
+
+            moved_here = set()
+            for row in rows:
+                cursor = row['rel_path']
+                target = _target_folder(row['rel_path'], shard)
+                if not target:
+                    continue
+                old_folder = row['rel_path'].rsplit('/', 1)[0]
+                if old_folder in moved_here:
+                    continue
+                old_fs, new_fs = to_fs_path(old_folder), to_fs_path(target)
+                moves = []
+                try:
+                    try:
+                        with index_transaction() as conn:
+                            _move_tree(old_fs, new_fs, moves)
+                            move_folder(old_fs, new_fs, conn=conn)
+                    except Exception:
+                        # İndeks geri alındı: klasör de eski yerine döner
+                        _restore_tree(moves)
+                        raise
+                    _remove_empty_shards(old_fs, shard)
+                    moved_here.add(old_folder)
+                    stats['moved'] += 1
+                except Exception as e:
+                    stats['failed'] += 1
+                    logging.error(f"❌ Depot migrate: {old_folder} taşınamadı - {e}")
+                if max_folders is not None and stats['moved'] >= max_folders:
+                    break
+
+            database.set_app_state(state_key, cursor)
+            logging.info(f"📦 Depot migrate ({mode}): {stats['moved']} klasör taşındı, imleç {cursor}")
+
+        if done:
+            database.delete_app_state(state_key)
+            cursor = None
+        return {'success': True, 'done': done, **stats, 'cursor': cursor,
+                'seconds': round(time.monotonic() - started, 2)}
+
+    except Exception as e:
+        logging.error(f"❌ Depot migrate error: {e}")
+        database.set_app_state(state_key, cursor)
+        return {'success': False, 'error': str(e), 'done': False, **stats, 'cursor': cursor}
+
+
+def get_layout_status():
+    """Indexed barcode folders per layout and pending migration cursors"""
+    counts = {'sharded': 0, 'plain': 0}
+    folders = set()
+    with database.get_db() as conn:
+        for row in conn.execute("SELECT rel_path FROM depot_images"):
+            fields = parse_depot_path(row['rel_path'])
+            folder = row['rel_path'].rsplit('/', 1)[0]
+            if not fields or 'sharded' not in fields or folder in folders:
+                continue
+            folders.add(folder)
+            counts['sharded' if fields['sharded'] else 'plain'] += 1
+    return {
+        'sharding_enabled': DEPOT_SHARDING,
+        'folders': counts,
+        'cursors': {mode: database.get_app_state(STATE_CURSOR.format(mode=mode)) for mode in ('shard', 'unshard')}
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Migrate depot folders between plain and sharded layouts')
+    parser.add_argument('command', choices=['shard', 'unshard', 'status'])
+    parser.add_argument('--batch-size', type=int, default=DEPOT_MIGRATE_BATCH)
+    parser.add_argument('--max-folders', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    database.init_db()
+    if args.command == 'status':
+        print(json.dumps(get_layout_status(), ensure_ascii=False))
+        return 0
+
+    result = migrate_layout(args.command == 'shard', args.batch_size, args.max_folders)
+    print(json.dumps(result, ensure_ascii=False))
+    return 0 if result['success'] else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
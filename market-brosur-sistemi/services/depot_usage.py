@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Depot Usage Service - Müşteri deposu kullanım sayaçları ve kotalar
+
+depot_usage keeps files / bytes per (customer, sector) for the customer
+depot (customers/{id}/...). services/depot_index.py adjusts it on every
+index write, move and delete in the same transaction as the depot_images
+change, so totals never need a filesystem walk. A full index rebuild
+recomputes it from depot_images (reconcile_usage).
+
+Bytes are the logical file sizes of the customer's files; blob dedup
+(services/blob_store.py) does not reduce them.
+
+Quotas (bytes / files per customer across all sectors, 0 = unlimited) are
+enforced by services/image_bank.save_to_customer_depot: check_quota runs on
+the standardized file inside the write transaction that stores it, so
+concurrent uploads are counted one after another:
+- soft: the upload is accepted with a warning
+- hard: the upload is rejected
+Defaults come from DEPOT_QUOTA_*; depot_quotas rows override them per
+customer (e.g. plan limits).
+
+CLI:
+    python -m services.depot_usage report [--limit 20]
+    python -m services.depot_usage reconcile
+"""
+
+import os
+import json
+import logging
+import argparse
+from datetime import datetime
+
+import database
+
+# ============= CONFIGURATION =============
+
+DEPOT_QUOTA_SOFT_BYTES = int(os.environ.get('DEPOT_QUOTA_SOFT_BYTES', 0))
+DEPOT_QUOTA_HARD_BYTES = int(os.environ.get('DEPOT_QUOTA_HARD_BYTES', 0))
+DEPOT_QUOTA_SOFT_FILES = int(os.environ.get('DEPOT_QUOTA_SOFT_FILES', 0))
+DEPOT_QUOTA_HARD_FILES = int(os.environ.get('DEPOT_QUOTA_HARD_FILES', 0))
+
+QUOTA_FIELDS = ('soft_bytes', 'hard_bytes', 'soft_files', 'hard_files')
+STATE_USAGE_COUNTED_AT = 'depot_usage_counted_at'
+
+
+class QuotaExceeded(Exception):
+    """Upload rejected: it would exceed the customer's hard quota"""
+
+    def __init__(self, quota):
+        super().__init__(f"Storage quota exceeded ({', '.join(quota['hard_exceeded'])})")
+        self.quota = quota
+
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+# ============= COUNTERS =============
+
+def track_file(conn, row, sign):
+    """
+    Add (sign=1) or remove (sign=-1) one depot_images row from the usage
+    counters. Rows outside the customer depot are ignored.
+    """
+    if not row or row['depot_type'] != 'customer' or not row['user_id']:
+        return
+    conn.execute('''INSERT INTO depot_usage (user_id, sector, files, bytes, updated_at) VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(user_id, sector) DO UPDATE SET
+                        files = MAX(files + excluded.files, 0),
+                        bytes = MAX(bytes + excluded.bytes, 0),
+                        updated_at = excluded.updated_at''',
+                 (int(row['user_id']), row['sector'], sign, sign * int(row['file_size'] or 0), _now()))
+
+
+def reconcile_usage(conn):
+    """Recompute every counter from depot_images (after a full index rebuild)"""
+    conn.execute("DELETE FROM depot_usage")
+    conn.execute('''INSERT INTO depot_usage (user_id, sector, files, bytes, updated_at)
+                    SELECT user_id, sector, COUNT(*), COALESCE(SUM(file_size), 0), ?
+                    FROM depot_images WHERE depot_type = 'customer' AND user_id > 0
+                    GROUP BY user_id, sector''', (_now(),))
+
+
+def ensure_usage_counted():
+    """Fill the counters once for an index built before they existed"""
+    if database.get_app_state(STATE_USAGE_COUNTED_AT):
+        return False
+    with database.get_db() as conn:
+        reconcile_usage(conn)
+        conn.commit()
+    database.set_app_state(STATE_USAGE_COUNTED_AT, datetime.now().isoformat())
+    logging.info("📊 Müşteri depo kullanımı indeksten hesaplandı")
+    return True
+
+
+# ============= READ =============
+
+def get_quota(user_id, conn=None):
+    """Effective quota of a customer (per-customer override or DEPOT_QUOTA_* default)"""
+    defaults = {'soft_bytes': DEPOT_QUOTA_SOFT_BYTES, 'hard_bytes': DEPOT_QUOTA_HARD_BYTES,
+                'soft_files': DEPOT_QUOTA_SOFT_FILES, 'hard_files': DEPOT_QUOTA_HARD_FILES}
+    if conn is None:
+        with database.get_db() as own:
+            return get_quota(user_id, own)
+    row = conn.execute("SELECT * FROM depot_quotas WHERE user_id = ?", (int(user_id),)).fetchone()
+    return {field: row[field] if row and row[field] is not None else default
+            for field, default in defaults.items()}
+
+
+def get_usage(user_id, conn=None):
+    """
+    Usage of one customer.
+
+    Returns:
+        dict: {'user_id', 'files', 'bytes', 'sectors': {sector: {'files', 'bytes'}}, 'quota'}
+    """
+    if conn is None:
+        with database.get_db() as own:
+            return get_usage(user_id, own)
+    rows = conn.execute("SELECT sector, files, bytes FROM depot_usage WHERE user_id = ? ORDER BY sector",
+                        (int(user_id),)).fetchall()
+    quota = get_quota(user_id, conn)
+    return {
+        'user_id': int(user_id),
+        'files': sum(row['files'] for row in rows),
+        'bytes': sum(row['bytes'] for row in rows),
+        'sectors': {row['sector']: {'files': row['files'], 'bytes': row['bytes']} for row in rows},
+        'quota': quota
+    }
+
+
+def list_usage(limit=100, order='bytes'):
+    """
+    Customers by usage (largest first), with email and effective quota.
+
+    Args:
+        order: 'bytes' or 'files'
+    """
+    order = 'files' if order == 'files' else 'bytes'
+    with database.get_db() as conn:
+        rows = conn.execute(f'''SELECT u.user_id, users.email, users.name,
+                                       SUM(u.files) AS files, SUM(u.bytes) AS bytes
+                                FROM depot_usage u LEFT JOIN users ON users.id = u.user_id
+                                GROUP BY u.user_id ORDER BY {order} DESC LIMIT ?''', (int(limit),)).fetchall()
+        usage = []
+        for row in rows:
+            item = dict(row)
+            item['quota'] = get_quota(row['user_id'], conn)
+            item['over_soft'] = _exceeded(item, item['quota'], 'soft')
+            item['over_hard'] = _exceeded(item, item['quota'], 'hard')
+            usage.append(item)
+    return usage
+
+
+# ============= QUOTAS =============
+
+def _exceeded(usage, quota, level):
+    """Names of the `level` ('soft' / 'hard') limits the usage is above"""
+    return [field for field in ('bytes', 'files')
+            if quota[f'{level}_{field}'] and usage[field] > quota[f'{level}_{field}']]
+
+
+def set_quota(user_id, **limits):
+    """
+    Override quota fields for one customer (None = back to the default).
+
+    Returns:
+        dict: Effective quota
+    """
+    values = {field: (int(limits[field]) if limits[field] is not None else None)
+              for field in QUOTA_FIELDS if field in limits}
+    with database.get_db() as conn:
+        conn.execute("INSERT OR IGNORE INTO depot_quotas (user_id) VALUES (?)", (int(user_id),))
+        if values:
+            conn.execute(f'''UPDATE depot_quotas SET {', '.join(f'{field} = ?' for field in values)}, updated_at = ?
+                             WHERE user_id = ?''', [*values.values(), _now(), int(user_id)])
+        conn.commit()
+        return get_quota(user_id, conn)
+
+
+def check_quota(user_id, incoming_bytes=0, incoming_files=1, replaced_bytes=0, conn=None):
+    """
+    Would an upload fit the customer's quota? Reads only depot_usage.
+
+    Args:
+        conn: The write transaction that will store the upload (race-free check)
+        incoming_bytes: Size of the upload
+        incoming_files: New files it adds (0 when it replaces an existing file)
+        replaced_bytes: Size of the file it overwrites
+
+    Returns:
+        dict: {'allowed': bool, 'soft_exceeded': [...], 'hard_exceeded': [...],
+               'usage': {'files', 'bytes'}, 'quota'}
+    """
+    usage = get_usage(user_id, conn)
+    after = {'bytes': usage['bytes'] + int(incoming_bytes) - int(replaced_bytes),
+             'files': usage['files'] + int(incoming_files)}
+    hard = _exceeded(after, usage['quota'], 'hard')
+    return {
+        'allowed': not hard,
+        'soft_exceeded': _exceeded(after, usage['quota'], 'soft'),
+        'hard_exceeded': hard,
+        'usage': {'files': usage['files'], 'bytes': usage['bytes']},
+        'quota': usage['quota']
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Customer depot usage counters')
+    parser.add_argument('command', choices=['report', 'reconcile'])
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    database.init_db()
+    if args.command == 'reconcile':
+        with database.get_db() as conn:
+            reconcile_usage(conn)
+            conn.commit()
+        database.set_app_state(STATE_USAGE_COUNTED_AT, datetime.now().isoformat())
+
+    print(json.dumps(list_usage(args.limit), ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
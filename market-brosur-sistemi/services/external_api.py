@@ -24,17 +24,21 @@ Features:
 import os
 import json
 import logging
+import time
 import requests
+import numpy as np
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from io import BytesIO
 from PIL import Image
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 import threading
 
 # Load environment variables
 from dotenv import load_dotenv
 load_dotenv()
 
+import database
 from services.image_bank import (
     search_image_hierarchy,
     save_to_admin_depot,
@@ -42,6 +46,14 @@ from services.image_bank import (
     CACHE_PATH
 )
 from utils.constants import SECTORS
+from services.admin_catalog import get_admin_catalog_product, get_admin_catalog_products
+from services.image_fetch import fetch_image, probe_image_candidates, ImageDownloadError
+from services.lookup_metrics import (
+    track_tier,
+    record_provider_call,
+    quota_from_headers,
+    get_lookup_metrics
+)
 
 # ============= API CONFIGURATIONS =============
 
@@ -52,7 +64,9 @@ CAMGOZ_API_KEY = os.environ.get('CAMGOZ_API_KEY', '')
 # Google Custom Search API (for product images)
 GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY', '')
 GOOGLE_SEARCH_CX = os.environ.get('GOOGLE_SEARCH_CX', '')
-GOOGLE_SEARCH_URL = 'https://www.googleapis.com/customsearch/v1'
+# Yük testi / kayıt-oynatma için stub sunucuya yönlendirilebilir (services/provider_stub.py)
+GOOGLE_SEARCH_URL = os.environ.get('GOOGLE_SEARCH_URL', 'https://www.googleapis.com/customsearch/v1')
+GOOGLE_DAILY_QUOTA = int(os.environ.get('GOOGLE_DAILY_QUOTA', 100))  # CSE ücretsiz kota
 
 # N11 API (Future - Hook Ready)
 N11_API_URL = os.environ.get('N11_API_URL', '')
@@ -76,8 +90,13 @@ GITTIGIDIYOR_API_KEY = os.environ.get('GITTIGIDIYOR_API_KEY', '')
 CACHE_DURATION_HOURS = 24
 MAX_CACHE_SIZE_MB = 100
 API_CALLS_PER_MINUTE = 60  # Increased for parallel queries
+# L1: süreç içi bellek önbelleği (JSON dosya önbelleği = L2)
+PRODUCT_CACHE_L1_TTL_SECONDS = int(os.environ.get('PRODUCT_CACHE_L1_TTL_SECONDS', 300))
+PRODUCT_CACHE_L1_MAX_ENTRIES = int(os.environ.get('PRODUCT_CACHE_L1_MAX_ENTRIES', 5000))
 _api_call_times = []
 _api_lock = threading.Lock()
+_l1_cache = OrderedDict()
+_l1_lock = threading.Lock()
 
 
 def _check_rate_limit():
@@ -95,32 +114,98 @@ def _check_rate_limit():
         return True
 
 
+def get_rate_limit_remaining():
+    """Remaining API calls in the current one-minute window"""
+    with _api_lock:
+        minute_ago = datetime.now() - timedelta(minutes=1)
+        recent = sum(1 for t in _api_call_times if t > minute_ago)
+    return max(0, API_CALLS_PER_MINUTE - recent)
+
+
 def _get_cache_path(barcode, api_source='combined'):
     """Get cache file path for a barcode"""
     return os.path.join(CACHE_PATH, f'{barcode}_{api_source}.json')
 
 
-def _get_from_cache(barcode, api_source='combined'):
-    """Get cached API response for a barcode"""
-    cache_file = _get_cache_path(barcode, api_source)
-    
-    if not os.path.exists(cache_file):
-        return None
-    
-    try:
-        with open(cache_file, 'r', encoding='utf-8') as f:
-            cached = json.load(f)
-        
-        cached_time = datetime.fromisoformat(cached.get('cached_at', '2000-01-01'))
-        if datetime.now() - cached_time > timedelta(hours=CACHE_DURATION_HOURS):
-            os.remove(cache_file)
+def _l1_get(key):
+    """L1 lookup (returns a copy, None if missing/expired)"""
+    with _l1_lock:
+        entry = _l1_cache.get(key)
+        if not entry:
             return None
+        stored_at, data = entry
+        if time.monotonic() - stored_at > PRODUCT_CACHE_L1_TTL_SECONDS:
+            del _l1_cache[key]
+            return None
+        _l1_cache.move_to_end(key)
+    return dict(data) if isinstance(data, dict) else data
+
+
+def _l1_put(key, data):
+    """L1 store with LRU eviction"""
+    if PRODUCT_CACHE_L1_TTL_SECONDS <= 0:
+        return
+    with _l1_lock:
+        _l1_cache[key] = (time.monotonic(), dict(data) if isinstance(data, dict) else data)
+        _l1_cache.move_to_end(key)
+        while len(_l1_cache) > PRODUCT_CACHE_L1_MAX_ENTRIES:
+            _l1_cache.popitem(last=False)
+
+
+def _l1_clear(barcode=None):
+    """Drop L1 entries (all, or for one barcode)"""
+    with _l1_lock:
+        if barcode is None:
+            _l1_cache.clear()
+        else:
+            for key in [k for k in _l1_cache if k[0] == barcode]:
+                del _l1_cache[key]
+
+
+def _get_from_cache_tiered(barcode, api_source='combined'):
+    """
+    Get cached API response and the tier that answered.
+    
+    Returns:
+        tuple: (data or None, 'l1' | 'l2' | None)
+    """
+    key = (barcode, api_source)
+    with track_tier('cache_l1') as t:
+        data = _l1_get(key)
+        if data is not None:
+            t['outcome'] = 'hit'
+            return data, 'l1'
+    
+    with track_tier('cache_l2') as t:
+        cache_file = _get_cache_path(barcode, api_source)
         
-        return cached.get('data')
+        if not os.path.exists(cache_file):
+            return None, None
         
-    except Exception as e:
-        logging.error(f"Cache read error: {e}")
-        return None
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            
+            cached_time = datetime.fromisoformat(cached.get('cached_at', '2000-01-01'))
+            if datetime.now() - cached_time > timedelta(hours=CACHE_DURATION_HOURS):
+                os.remove(cache_file)
+                return None, None
+            
+            data = cached.get('data')
+            if data is not None:
+                t['outcome'] = 'hit'
+                _l1_put(key, data)
+            return data, ('l2' if data is not None else None)
+            
+        except Exception as e:
+            t['outcome'] = 'error'
+            logging.error(f"Cache read error: {e}")
+            return None, None
+
+
+def _get_from_cache(barcode, api_source='combined'):
+    """Get cached API response for a barcode (L1 memory → L2 file)"""
+    return _get_from_cache_tiered(barcode, api_source)[0]
 
 
 def _save_to_cache(barcode, data, api_source='combined'):
@@ -134,11 +219,71 @@ def _save_to_cache(barcode, data, api_source='combined'):
                 'cached_at': datetime.now().isoformat(),
                 'data': data
             }, f, ensure_ascii=False)
+        
+        _l1_put((barcode, api_source), data)
             
     except Exception as e:
         logging.error(f"Cache write error: {e}")
 
 
+# ============= SEARCH RESULT CACHE =============
+# "AI Öner" aramaları için sorgu bazlı bellek içi önbellek.
+# Aynı ürün adı tekrar arandığında Google CSE kotası harcanmaz.
+
+SEARCH_CACHE_TTL_SECONDS = int(os.environ.get('SEARCH_CACHE_TTL_SECONDS', 6 * 3600))
+SEARCH_CACHE_MAX_ENTRIES = int(os.environ.get('SEARCH_CACHE_MAX_ENTRIES', 500))
+SEARCH_DEADLINE_SECONDS = float(os.environ.get('SEARCH_DEADLINE_SECONDS', 12))
+SEARCH_MAX_WORKERS = int(os.environ.get('SEARCH_MAX_WORKERS', 6))
+
+_search_cache = OrderedDict()
+_search_cache_lock = threading.Lock()
+_search_executor = ThreadPoolExecutor(max_workers=SEARCH_MAX_WORKERS, thread_name_prefix='image-search')
+
+
+def _normalize_search_query(query, barcode=None):
+    """Build cache key: case-folded, whitespace-collapsed query + barcode"""
+    normalized = ' '.join(str(query).casefold().split())
+    return f"{normalized}|{str(barcode or '').strip()}"
+
+
+def _get_cached_search(key):
+    """Return cached search response (copy) or None if missing/expired"""
+    with _search_cache_lock:
+        entry = _search_cache.get(key)
+        if not entry:
+            return None
+        cached_at, response = entry
+        if time.monotonic() - cached_at > SEARCH_CACHE_TTL_SECONDS:
+            del _search_cache[key]
+            return None
+        _search_cache.move_to_end(key)
+    
+    cached = dict(response)
+    cached['results'] = [dict(r) for r in response.get('results', [])]
+    return cached
+
+
+def _save_cached_search(key, response):
+    """Store search response, evicting least recently used entries"""
+    if SEARCH_CACHE_TTL_SECONDS <= 0:
+        return
+    stored = dict(response)
+    stored['results'] = [dict(r) for r in response.get('results', [])]
+    with _search_cache_lock:
+        _search_cache[key] = (time.monotonic(), stored)
+        _search_cache.move_to_end(key)
+        while len(_search_cache) > SEARCH_CACHE_MAX_ENTRIES:
+            _search_cache.popitem(last=False)
+
+
+def clear_search_cache():
+    """Clear in-memory image search cache"""
+    with _search_cache_lock:
+        count = len(_search_cache)
+        _search_cache.clear()
+    return count
+
+
 # ============= IMAGE QUALITY SCORING =============
 
 def calculate_image_quality_score(width, height, has_background_removed=False):
@@ -191,6 +336,36 @@ def calculate_image_quality_score(width, height, has_background_removed=False):
 
 # ============= GOOGLE CUSTOM SEARCH API (FOR IMAGES) =============
 
+def _count_google_call():
+    """Count one CSE request against the daily quota"""
+    try:
+        # Günlük kota tüm worker'larda ortak sayılır (süreç sayaçları ~worker sayısı kadar eksik kalır)
+        database.increment_provider_calls('google')
+    except Exception as e:
+        logging.warning(f"Google call counter error: {e}")
+
+
+def _record_google_failure(outcome, response=None):
+    """
+    Record a CSE request that raised (timeout / error). It is counted
+    against the daily quota unless its response was already recorded.
+    """
+    if response is None:
+        _count_google_call()
+        record_provider_call('google', outcome)
+
+
+def _record_google_response(response):
+    """Record Google CSE call outcome (403/429 = quota exhausted) and count it for the daily quota"""
+    _count_google_call()
+    if response.status_code == 200:
+        record_provider_call('google', 'ok')
+    elif response.status_code in (403, 429):
+        record_provider_call('google', 'rate_limited', quota_remaining=0)
+    else:
+        record_provider_call('google', 'error')
+
+
 def search_google_images(product_name, barcode=None):
     """
     Search Google for professional product images.
@@ -209,6 +384,7 @@ def search_google_images(product_name, barcode=None):
     if not _check_rate_limit():
         return {'success': False, 'error': 'Rate limit exceeded'}
     
+    response = None
     try:
         # Build search query - product name + "ürün" for better results
         search_query = f"{product_name} ürün beyaz arka plan"
@@ -225,6 +401,7 @@ def search_google_images(product_name, barcode=None):
         }
         
         response = requests.get(GOOGLE_SEARCH_URL, params=params, timeout=10)
+        _record_google_response(response)
         
         if response.status_code == 200:
             data = response.json()
@@ -262,15 +439,81 @@ def search_google_images(product_name, barcode=None):
             return {'success': False, 'error': f'Google API returned status {response.status_code}'}
             
     except requests.exceptions.Timeout:
+        _record_google_failure('timeout')
         return {'success': False, 'error': 'Google Search timeout'}
     except Exception as e:
+        _record_google_failure('error', response)
         logging.error(f"Google Search error: {e}")
         return {'success': False, 'error': str(e)}
 
 
+ECOMMERCE_IMAGE_DOMAINS = ('trendyol', 'hepsiburada', 'n11', 'amazon', 'migros', 'a101', 'bim', 'sok')
+# Yoklama sonrası sırayla denenecek en fazla aday
+GOOGLE_IMAGE_MAX_DOWNLOAD_ATTEMPTS = int(os.environ.get('GOOGLE_IMAGE_MAX_DOWNLOAD_ATTEMPTS', 3))
+
+
+def _score_image_candidate(img, width, height):
+    """Quality score from dimensions + bonus for e-commerce domains"""
+    score = calculate_image_quality_score(width, height)['score']
+    # Bonus for certain domains (e-commerce sites usually have good product photos)
+    source = img.get('source', '').lower()
+    if any(domain in source for domain in ECOMMERCE_IMAGE_DOMAINS):
+        score += 15
+    return score
+
+
+# Yoklaması sonuçsuz kalan adaylar (resim reddedilmedi, sadece doğrulanamadı)
+INCONCLUSIVE_PROBE_REASONS = ('deadline', 'timeout', 'error')
+
+
+def _rank_image_candidates(images):
+    """
+    Probe all candidates concurrently (first KBs only) and rank them by
+    verified dimensions. Candidates the probe rejected (unreachable /
+    non-image / too small...) are dropped. Reachable candidates whose header
+    could not be decoded from the probe (large WebP / AVIF headers) are
+    ranked by search-reported dimensions, as are candidates whose probe did
+    not finish or failed (deadline / timeout / error) when none verified.
+
+    Returns:
+        list: [(score, img, probe_or_None), ...] best first
+    """
+    candidates = [img for img in images if img.get('url')]
+    probes = probe_image_candidates([img['url'] for img in candidates])
+
+    ranked = []
+    unverified = []
+    for img in candidates:
+        probe = probes.get(img['url'])
+        if probe and probe['ok']:
+            width, height = probe['width'], probe['height']
+            if not width or not height:
+                width, height = img.get('width', 0), img.get('height', 0)
+            ranked.append((_score_image_candidate(img, width, height), img, probe))
+        elif not probe or probe['reason'] in INCONCLUSIVE_PROBE_REASONS:
+            unverified.append(img)
+
+    if not ranked and unverified:
+        logging.warning("⚠️ Hiçbir aday resim doğrulanamadı, yoklanamayanlar arama boyutlarıyla sıralanıyor")
+        for img in unverified:
+            width, height = img.get('width', 0), img.get('height', 0)
+            if width > 0 and height > 0:
+                ranked.append((_score_image_candidate(img, width, height), img, None))
+    else:
+        dropped = len(candidates) - len(ranked)
+        if dropped:
+            logging.info(f"🔎 Resim yoklama: {len(ranked)} aday doğrulandı, {dropped} elendi")
+
+    ranked.sort(key=lambda item: item[0], reverse=True)
+    return ranked
+
+
 def get_best_google_image(product_name, barcode=None, user_id=None, sector='supermarket'):
     """
     Search Google and download the best quality image.
+
+    Candidates are probed concurrently before downloading, so the choice is
+    made on real dimensions and a dead link falls through to the next one.
     
     Returns:
         dict: {success, image_url, quality_score, ...}
@@ -281,60 +524,40 @@ def get_best_google_image(product_name, barcode=None, user_id=None, sector='supe
     if not search_result.get('success') or not search_result.get('images'):
         return {'success': False, 'error': search_result.get('error', 'No images found')}
     
-    images = search_result['images']
-    
-    # Score each image and find the best one
-    best_image = None
-    best_score = -1
-    
-    for img in images:
-        width = img.get('width', 0)
-        height = img.get('height', 0)
-        
-        if width > 0 and height > 0:
-            quality = calculate_image_quality_score(width, height)
-            score = quality['score']
-            
-            # Bonus for certain domains (e-commerce sites usually have good product photos)
-            source = img.get('source', '').lower()
-            if any(domain in source for domain in ['trendyol', 'hepsiburada', 'n11', 'amazon', 'migros', 'a101', 'bim', 'sok']):
-                score += 15
-            
-            if score > best_score:
-                best_score = score
-                best_image = img
-                best_image['quality_score'] = score
-    
-    if not best_image:
+    ranked = _rank_image_candidates(search_result['images'])
+    if not ranked:
         return {'success': False, 'error': 'No suitable image found'}
     
-    # Download and save the best image
-    try:
-        image_result = download_and_process_image(
-            image_url=best_image['url'],
-            barcode=barcode or product_name.replace(' ', '_'),
-            user_id=user_id or 0,
-            sector=sector,
-            source='google_search'
-        )
+    # Download and save the best image (next candidate on failure)
+    image_result = {'success': False, 'error': 'No suitable image found'}
+    for score, image, probe in ranked[:GOOGLE_IMAGE_MAX_DOWNLOAD_ATTEMPTS]:
+        try:
+            image_result = download_and_process_image(
+                image_url=image['url'],
+                barcode=barcode or product_name.replace(' ', '_'),
+                user_id=user_id or 0,
+                sector=sector,
+                source='google_search'
+            )
+        except Exception as e:
+            logging.error(f"Google image download error: {e}")
+            image_result = {'success': False, 'error': str(e)}
         
         if image_result.get('success'):
             return {
                 'success': True,
                 'image_url': image_result['image_url'],
-                'original_url': best_image['url'],
-                'quality_score': best_score,
+                'original_url': image['url'],
+                'quality_score': score,
+                'verified': probe is not None,
                 'quality': image_result.get('quality', 'unknown'),
                 'quality_indicator': image_result.get('quality_indicator', '🟡'),
                 'source': 'google_search',
                 'search_query': search_result.get('query', '')
             }
-        else:
-            return image_result
-            
-    except Exception as e:
-        logging.error(f"Google image download error: {e}")
-        return {'success': False, 'error': str(e)}
+        logging.warning(f"⚠️ Aday resim indirilemedi, sıradaki deneniyor: {image['url'][:120]}")
+    
+    return image_result
 
 
 # ============= CAMGOZ/JOJAPI =============
@@ -342,6 +565,7 @@ def get_best_google_image(product_name, barcode=None, user_id=None, sector='supe
 def query_camgoz_api(barcode):
     """Query CAMGOZ/JoJAPI for Turkish products"""
     if not _check_rate_limit():
+        record_provider_call('camgoz', 'rate_limited')
         return {'success': False, 'error': 'Rate limit exceeded'}
     
     if not CAMGOZ_API_KEY:
@@ -355,6 +579,10 @@ def query_camgoz_api(barcode):
             timeout=15
         )
         
+        quota_remaining, quota_limit = quota_from_headers(response.headers)
+        outcome = 'ok' if response.status_code == 200 else ('rate_limited' if response.status_code == 429 else 'error')
+        record_provider_call('camgoz', outcome, quota_remaining, quota_limit)
+        
         if response.status_code == 200:
             api_response = response.json()
             
@@ -405,14 +633,30 @@ def query_camgoz_api(barcode):
             return {'success': False, 'error': f'CAMGOZ returned status {response.status_code}'}
             
     except requests.exceptions.Timeout:
+        record_provider_call('camgoz', 'timeout')
         return {'success': False, 'error': 'CAMGOZ API timeout'}
     except requests.exceptions.ConnectionError:
+        record_provider_call('camgoz', 'error')
         return {'success': False, 'error': 'Could not connect to CAMGOZ'}
     except Exception as e:
+        record_provider_call('camgoz', 'error')
         logging.error(f"CAMGOZ API error: {e}")
         return {'success': False, 'error': str(e)}
 
 
+def _query_camgoz_tracked(barcode):
+    """query_camgoz_api + 'camgoz' tier metrics"""
+    with track_tier('camgoz') as t:
+        api_result = query_camgoz_api(barcode)
+        if api_result.get('success'):
+            t['outcome'] = 'hit' if api_result.get('product') else 'miss'
+        elif 'timeout' in str(api_result.get('error', '')).lower():
+            t['outcome'] = 'timeout'
+        elif not api_result.get('skip'):
+            t['outcome'] = 'error'
+    return api_result
+
+
 # ============= N11 API (HOOK - FUTURE) =============
 
 def query_n11_api(barcode):
@@ -756,19 +1000,24 @@ def download_and_process_image(image_url, barcode, user_id, sector='supermarket'
     """
     Download image from URL, analyze quality, and save to depot
     """
+    with track_tier('download_image') as t:
+        result = _download_and_process_image(image_url, barcode, user_id, sector, source)
+        if result.get('success'):
+            t['outcome'] = 'hit'
+        elif 'timed out' in str(result.get('error', '')).lower():
+            t['outcome'] = 'timeout'
+        else:
+            t['outcome'] = 'error'
+        return result
+
+
+def _download_and_process_image(image_url, barcode, user_id, sector='supermarket', source='api'):
+    """Download + quality analysis + admin depot save (see download_and_process_image)"""
     try:
-        response = requests.get(
-            image_url, 
-            timeout=30,
-            headers={'User-Agent': 'AEU-Brosur-Sistemi/1.0'}
-        )
-        response.raise_for_status()
-        
-        image_data = response.content
-        
-        # Analyze quality
-        img = Image.open(BytesIO(image_data))
-        width, height = img.size
+        # Akışlı indirme: boyut sınırı + başlıktan erken format/ölçü kontrolü
+        fetched = fetch_image(image_url, timeout=30)
+        image_data = fetched['data']
+        width, height = fetched['width'], fetched['height']
         
         quality_info = calculate_image_quality_score(width, height)
         
@@ -804,6 +1053,8 @@ def download_and_process_image(image_url, barcode, user_id, sector='supermarket'
         else:
             return result
             
+    except ImageDownloadError as e:
+        return {'success': False, 'error': str(e), 'reason': e.reason}
     except Exception as e:
         logging.error(f"Image download error: {e}")
         return {'success': False, 'error': str(e)}
@@ -815,8 +1066,10 @@ def full_barcode_lookup(barcode, user_id, sector='supermarket', auto_download=Tr
     """
     Complete barcode lookup:
     1. Check local depots (customer → admin) for IMAGES
-    2. Query CAMGOZ API for PRODUCT INFO (name, category, price)
-    3. If no local image and product name found → Search Google for image
+    2. Product info cache (L1 memory → L2 file)
+    3. Local admin catalog (admin_products)
+    4. Query CAMGOZ API for PRODUCT INFO (name, category, price)
+    5. If no local image and product name found → Search Google for image
     
     Args:
         barcode: Product barcode
@@ -840,6 +1093,7 @@ def full_barcode_lookup(barcode, user_id, sector='supermarket', auto_download=Tr
     }
     
     # Step 1: Check local depots for existing images
+    # (customer_depot / admin_depot katmanları search_image_hierarchy içinde ölçülür)
     local_result = search_image_hierarchy(barcode, user_id, sector)
     
     if local_result['found']:
@@ -850,10 +1104,10 @@ def full_barcode_lookup(barcode, user_id, sector='supermarket', auto_download=Tr
             'quality_score': 100
         }
     
-    # Step 2: Check cache for product info
-    cached = _get_from_cache(barcode, 'camgoz')
+    # Step 2: Check cache for product info (L1 bellek → L2 dosya)
+    cached, cache_tier = _get_from_cache_tiered(barcode, 'camgoz')
     if cached:
-        logging.info(f"📦 Cache hit for {barcode}")
+        logging.info(f"📦 Cache ({cache_tier}) hit for {barcode}")
         result['found'] = True
         result['source'] = 'cache'
         result['product'] = cached
@@ -873,8 +1127,38 @@ def full_barcode_lookup(barcode, user_id, sector='supermarket', auto_download=Tr
         
         return result
     
-    # Step 3: Query CAMGOZ API for product info (ANA KAYNAK)
-    api_result = query_camgoz_api(barcode)
+    # Step 3: Local admin catalog (admin_products golden record) - ağ çağrısı yok
+    with track_tier('admin_catalog') as t:
+        catalog_product = get_admin_catalog_product(barcode)
+        if catalog_product:
+            t['outcome'] = 'hit'
+    
+    if catalog_product:
+        logging.info(f"📦 Admin catalog hit for {barcode}")
+        result['found'] = True
+        result['source'] = 'admin_catalog'
+        result['product'] = catalog_product
+        result['market_price'] = catalog_product.get('price', 0)
+        result['market_price_tax'] = catalog_product.get('price_with_tax', 0)
+        result['needs_verification'] = False
+        
+        if not result.get('image'):
+            catalog_image = catalog_product.get('image_path') or catalog_product.get('image_url')
+            if catalog_image:
+                if not catalog_image.startswith(('http://', 'https://', '/')):
+                    catalog_image = '/' + catalog_image.replace('\\', '/')
+                result['image'] = {
+                    'url': catalog_image,
+                    'quality': 'catalog',
+                    'quality_indicator': '🟢',
+                    'quality_score': 90,
+                    'source': 'admin_catalog'
+                }
+        
+        return result
+    
+    # Step 4: Query CAMGOZ API for product info (ANA KAYNAK)
+    api_result = _query_camgoz_tracked(barcode)
     
     if api_result.get('success') and api_result.get('product'):
         product = api_result['product']
@@ -914,12 +1198,14 @@ def full_barcode_lookup(barcode, user_id, sector='supermarket', auto_download=Tr
         if search_google_image and auto_download:
             logging.info(f"⚠️ CAMGOZ'da bulunamadı: {error_msg}, Google'a soruyorum...")
             # Barkod ile Google'da ara
-            google_result = get_best_google_image(
-                product_name=barcode,  # Barkod ile ara
-                barcode=barcode,
-                user_id=user_id,
-                sector=sector
-            )
+            with track_tier('google') as t:
+                google_result = get_best_google_image(
+                    product_name=barcode,  # Barkod ile ara
+                    barcode=barcode,
+                    user_id=user_id,
+                    sector=sector
+                )
+                t['outcome'] = 'hit' if google_result.get('success') else 'miss'
             
             if google_result.get('success'):
                 result['found'] = True
@@ -1001,11 +1287,74 @@ def batch_barcode_lookup(barcodes, user_id, sector='supermarket', auto_download=
     }
 
 
+def warm_barcode_cache(barcode):
+    """
+    Fetch CAMGOZ product info into the lookup cache (used by prefetcher).
+    
+    Returns:
+        str: 'cached' (already warm), 'fetched', 'not_found',
+             'rate_limited' or 'error'
+    """
+    if _get_from_cache(barcode, 'camgoz'):
+        return 'cached'
+    
+    api_result = query_camgoz_api(barcode)
+    
+    if api_result.get('success') and api_result.get('product'):
+        _save_to_cache(barcode, api_result['product'], 'camgoz')
+        return 'fetched'
+    if api_result.get('success'):
+        return 'not_found'
+    if api_result.get('error') in ('Rate limit exceeded', 'CAMGOZ rate limit exceeded'):
+        return 'rate_limited'
+    return 'error'
+
+
 # ============= PRICE COMPARISON =============
 
+PRICE_BATCH_MAX_ITEMS = int(os.environ.get('PRICE_BATCH_MAX_ITEMS', 500))
+PRICE_BATCH_UPSTREAM_WORKERS = int(os.environ.get('PRICE_BATCH_UPSTREAM_WORKERS', 4))
+
+
+def get_market_price(barcode, allow_upstream=True):
+    """
+    Price-only lookup - depo hiyerarşisi taranmaz.
+    Order: product cache (L1 → L2) → admin catalog → CAMGOZ
+    
+    Returns:
+        dict: {'found': bool, 'source': str, 'product': dict}
+    """
+    product, _ = _get_from_cache_tiered(barcode, 'camgoz')
+    if product:
+        return {'found': True, 'source': 'cache', 'product': product}
+    
+    product = get_admin_catalog_product(barcode)
+    if product:
+        return {'found': True, 'source': 'admin_catalog', 'product': product}
+    
+    if allow_upstream:
+        api_result = _query_camgoz_tracked(barcode)
+        if api_result.get('success') and api_result.get('product'):
+            _save_to_cache(barcode, api_result['product'], 'camgoz')
+            return {'found': True, 'source': 'camgoz', 'product': api_result['product']}
+    
+    return {'found': False, 'source': None, 'product': None}
+
+
+def _price_comparison_message(percentage, market_price):
+    """Turkish insight message for a price difference percentage"""
+    if percentage < -10:
+        return f"🎉 Bu ürün piyasa ortalamasının %{abs(percentage):.0f} altında!"
+    elif percentage < 0:
+        return f"✨ Fiyatınız piyasa ortalamasından %{abs(percentage):.0f} daha uygun."
+    elif percentage < 10:
+        return f"📊 Fiyatınız piyasa ortalamasına yakın (₺{market_price:.2f})."
+    return f"💡 Bu ürün piyasa ortalamasının %{percentage:.0f} üzerinde."
+
+
 def get_market_price_comparison(barcode, customer_price):
     """Compare customer price with market price"""
-    result = full_barcode_lookup(barcode, user_id=0, auto_download=False)
+    result = get_market_price(barcode)
     
     if not result['found'] or not result.get('product'):
         return {
@@ -1025,40 +1374,157 @@ def get_market_price_comparison(barcode, customer_price):
     difference = customer_price - market_price
     percentage = ((customer_price - market_price) / market_price) * 100
     
-    if percentage < -10:
-        message = f"🎉 Bu ürün piyasa ortalamasının %{abs(percentage):.0f} altında!"
-    elif percentage < 0:
-        message = f"✨ Fiyatınız piyasa ortalamasından %{abs(percentage):.0f} daha uygun."
-    elif percentage < 10:
-        message = f"📊 Fiyatınız piyasa ortalamasına yakın (₺{market_price:.2f})."
-    else:
-        message = f"💡 Bu ürün piyasa ortalamasının %{percentage:.0f} üzerinde."
-    
     return {
         'has_comparison': True,
         'market_price': market_price,
         'customer_price': customer_price,
         'difference': difference,
         'percentage': round(percentage, 1),
-        'message': message,
+        'message': _price_comparison_message(percentage, market_price),
         'product_name': product.get('name', ''),
         'source': result.get('source', '')
     }
 
 
+def batch_market_price_comparison(items, allow_upstream=True):
+    """
+    Price comparison for a whole brochure in one call.
+    
+    1. Single pass over the product cache (L1 → L2) for all barcodes
+    2. One batched admin_products query for cache misses
+    3. CAMGOZ (bounded concurrency) only for the rest
+    4. Vectorized difference / percentage (NumPy)
+    
+    Items without a valid (> 0) customer price are not looked up and are
+    answered like the single-item endpoint ('Valid price required').
+    
+    Args:
+        items: [{'barcode': str, 'price': float}, ...]
+        allow_upstream: Query CAMGOZ for barcodes not found locally
+    
+    Returns:
+        dict: {'results': [...], 'summary': {...}}
+    """
+    barcodes = []
+    customer_prices = []
+    for item in items[:PRICE_BATCH_MAX_ITEMS]:
+        barcodes.append(str(item.get('barcode', '')).strip())
+        try:
+            customer_prices.append(float(item.get('price') or 0))
+        except (TypeError, ValueError):
+            customer_prices.append(0.0)
+    
+    # Fiyatı olmayan kalemler tekli uç noktadaki gibi sorgulanmaz
+    unique = [b for b in dict.fromkeys(b for b, price in zip(barcodes, customer_prices) if price > 0) if b]
+    products = {}
+    sources = {}
+    
+    # 1. Önbellek - tek geçiş
+    for barcode in unique:
+        product, _ = _get_from_cache_tiered(barcode, 'camgoz')
+        if product:
+            products[barcode] = product
+            sources[barcode] = 'cache'
+    
+    # 2. Admin katalog - toplu sorgu
+    missing = [b for b in unique if b not in products]
+    if missing:
+        for barcode, product in get_admin_catalog_products(missing).items():
+            products[barcode] = product
+            sources[barcode] = 'admin_catalog'
+    
+    # 3. CAMGOZ - kalanlar
+    missing = [b for b in unique if b not in products]
+    if missing and allow_upstream:
+        with ThreadPoolExecutor(max_workers=PRICE_BATCH_UPSTREAM_WORKERS) as executor:
+            futures = {executor.submit(_query_camgoz_tracked, b): b for b in missing}
+            for future in as_completed(futures):
+                barcode = futures[future]
+                try:
+                    api_result = future.result()
+                except Exception as e:
+                    logging.error(f"Price lookup error for {barcode}: {e}")
+                    continue
+                if api_result.get('success') and api_result.get('product'):
+                    products[barcode] = api_result['product']
+                    sources[barcode] = 'camgoz'
+                    _save_to_cache(barcode, api_result['product'], 'camgoz')
+    
+    # 4. Vektörel hesaplama
+    customer = np.array(customer_prices, dtype=float)
+    market = np.array([
+        float((products.get(b) or {}).get('price_with_tax') or (products.get(b) or {}).get('price') or 0)
+        for b in barcodes
+    ], dtype=float)
+    comparable = (market > 0) & (customer > 0)
+    difference = customer - market
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percentage = np.where(comparable, difference / market * 100, np.nan)
+    
+    results = []
+    for idx, barcode in enumerate(barcodes):
+        product = products.get(barcode)
+        if customer[idx] <= 0:
+            results.append({
+                'barcode': barcode,
+                'has_comparison': False,
+                'customer_price': customer_prices[idx],
+                'error': 'Valid price required',
+                'message': 'Geçerli bir fiyat girilmedi'
+            })
+            continue
+        if not comparable[idx]:
+            results.append({
+                'barcode': barcode,
+                'has_comparison': False,
+                'customer_price': customer_prices[idx],
+                'message': 'Piyasa fiyatı bulunamadı' if not product else 'Piyasa fiyatı mevcut değil'
+            })
+            continue
+        pct = float(percentage[idx])
+        results.append({
+            'barcode': barcode,
+            'has_comparison': True,
+            'market_price': float(market[idx]),
+            'customer_price': customer_prices[idx],
+            'difference': round(float(difference[idx]), 2),
+            'percentage': round(pct, 1),
+            'message': _price_comparison_message(pct, float(market[idx])),
+            'product_name': product.get('name', ''),
+            'source': sources.get(barcode, '')
+        })
+    
+    compared = percentage[comparable]
+    summary = {
+        'total': len(barcodes),
+        'compared': int(comparable.sum()),
+        'cheaper': int((compared < 0).sum()),
+        'more_expensive': int((compared > 0).sum()),
+        'average_percentage': round(float(compared.mean()), 1) if compared.size else None,
+        'truncated': len(items) > PRICE_BATCH_MAX_ITEMS
+    }
+    
+    return {'results': results, 'summary': summary}
+
+
 # ============= CACHE MANAGEMENT =============
 
 def clear_cache(barcode=None):
-    """Clear API cache"""
+    """
+    Clear API cache: the shared file cache (L2) and this worker's in-memory
+    L1. Other workers keep their L1 entries until they expire
+    (PRODUCT_CACHE_L1_TTL_SECONDS).
+    """
     try:
         if barcode:
             count = 0
+            _l1_clear(barcode)
             for suffix in ['combined', 'openfoodfacts', 'camgoz']:
                 cache_file = _get_cache_path(barcode, suffix)
                 if os.path.exists(cache_file):
                     os.remove(cache_file)
                     count += 1
-            return {'success': True, 'cleared_count': count}
+            return {'success': True, 'cleared_count': count, 'l1_scope': 'process'}
         else:
             count = 0
             if os.path.exists(CACHE_PATH):
@@ -1066,7 +1532,10 @@ def clear_cache(barcode=None):
                     if filename.endswith('.json'):
                         os.remove(os.path.join(CACHE_PATH, filename))
                         count += 1
-            return {'success': True, 'cleared_count': count}
+            search_count = clear_search_cache()
+            _l1_clear()
+            return {'success': True, 'cleared_count': count, 'search_cleared_count': search_count,
+                    'l1_scope': 'process'}
             
     except Exception as e:
         logging.error(f"Cache clear error: {e}")
@@ -1087,9 +1556,13 @@ def get_cache_stats():
                 count += 1
                 total_size += os.path.getsize(os.path.join(CACHE_PATH, filename))
         
+        with _l1_lock:
+            l1_count = len(_l1_cache)
+        
         return {
             'count': count,
-            'size_mb': round(total_size / (1024 * 1024), 2)
+            'size_mb': round(total_size / (1024 * 1024), 2),
+            'l1_count': l1_count
         }
         
     except Exception as e:
@@ -1097,6 +1570,25 @@ def get_cache_stats():
         return {'count': 0, 'size_mb': 0, 'error': str(e)}
 
 
+# ============= LOOKUP METRICS =============
+
+def get_lookup_metrics_snapshot():
+    """
+    Tier/provider metrics of this process plus remaining quotas:
+    CAMGOZ per-minute budget (this process' rate limiter) and Google CSE
+    daily budget (shared counter of all workers).
+    """
+    snapshot = get_lookup_metrics(quota_sources={
+        'camgoz': lambda: {'remaining': get_rate_limit_remaining(), 'limit': API_CALLS_PER_MINUTE,
+                           'scope': 'process'},
+        'google': lambda: {'remaining': max(0, GOOGLE_DAILY_QUOTA - database.get_provider_calls('google')),
+                           'limit': GOOGLE_DAILY_QUOTA, 'scope': 'shared'}
+    })
+    
+    snapshot['cache'] = get_cache_stats()
+    return snapshot
+
+
 # ============= API STATUS =============
 
 def get_api_status():
@@ -1352,6 +1844,7 @@ def search_ecommerce_sites(barcode, max_results=5):
         return []
     
     results = []
+    response = None
     
     try:
         # Build site-specific search query
@@ -1369,6 +1862,7 @@ def search_ecommerce_sites(barcode, max_results=5):
         }
         
         response = requests.get(GOOGLE_SEARCH_URL, params=params, timeout=15)
+        _record_google_response(response)
         
         if response.status_code == 200:
             data = response.json()
@@ -1410,7 +1904,12 @@ def search_ecommerce_sites(barcode, max_results=5):
         
         return []
         
+    except requests.exceptions.Timeout:
+        _record_google_failure('timeout')
+        logging.error(f"E-commerce search timeout for '{barcode}'")
+        return []
     except Exception as e:
+        _record_google_failure('error', response)
         logging.error(f"E-commerce search error: {e}")
         return []
 
@@ -1476,6 +1975,7 @@ def search_with_google(query, max_results=6):
     if not GOOGLE_API_KEY or not GOOGLE_SEARCH_CX:
         return []
     
+    response = None
     try:
         search_query = query  # Sadece barkod/ürün adı ile ara
         
@@ -1492,6 +1992,7 @@ def search_with_google(query, max_results=6):
         }
         
         response = requests.get(GOOGLE_SEARCH_URL, params=params, timeout=15)
+        _record_google_response(response)
         
         if response.status_code == 200:
             data = response.json()
@@ -1531,8 +2032,13 @@ def search_with_google(query, max_results=6):
             return []
         else:
             return []
-            
+    
+    except requests.exceptions.Timeout:
+        _record_google_failure('timeout')
+        logging.error(f"Google search timeout for '{query}'")
+        return []
     except Exception as e:
+        _record_google_failure('error', response)
         logging.error(f"Google search error: {e}")
         return []
 
@@ -1596,6 +2102,10 @@ def search_product_by_name(product_name, barcode=None):
     1. Google Image Search
     2. Yandex Image Search
     
+    Engines are queried concurrently with a shared deadline
+    (SEARCH_DEADLINE_SECONDS). Merged, scored results are cached by
+    normalized query for SEARCH_CACHE_TTL_SECONDS.
+    
     Note: Market siteleri (asyasanalmarket, marketkarsilastir) 
           ayrı endpoint ile aranır ve frontend'de birleştirilir.
     
@@ -1606,22 +2116,43 @@ def search_product_by_name(product_name, barcode=None):
         return {'success': False, 'error': 'Ürün adı en az 3 karakter olmalı'}
     
     query = product_name.strip()
+    cache_key = _normalize_search_query(query, barcode)
+    
+    cached = _get_cached_search(cache_key)
+    if cached:
+        logging.info(f"📦 Search cache hit for '{query}'")
+        cached['cached'] = True
+        return cached
+    
     all_results = []
     engines_used = []
     
-    # ============= 2. SORGU: SADECE GOOGLE + YANDEX =============
+    # ============= 2. SORGU: GOOGLE + YANDEX (PARALEL) =============
+    engines = [
+        ('Google', search_with_google),
+        ('Yandex', search_with_yandex),  # good for Turkish products
+    ]
+    futures = {
+        name: _search_executor.submit(search_fn, query, max_results=5)
+        for name, search_fn in engines
+    }
+    done, not_done = wait(futures.values(), timeout=SEARCH_DEADLINE_SECONDS)
     
-    # 1. GOOGLE IMAGE SEARCH
-    google_results = search_with_google(query, max_results=5)
-    if google_results:
-        all_results.extend(google_results)
-        engines_used.append('Google')
+    for name, _ in engines:
+        future = futures[name]
+        if future not in done:
+            logging.warning(f"⏱️ {name} search exceeded {SEARCH_DEADLINE_SECONDS}s deadline for '{query}'")
+            continue
+        try:
+            engine_results = future.result()
+        except Exception as e:
+            logging.error(f"{name} search error: {e}")
+            continue
+        if engine_results:
+            all_results.extend(engine_results)
+            engines_used.append(name)
     
-    # 2. YANDEX IMAGE SEARCH (good for Turkish products)
-    yandex_results = search_with_yandex(query, max_results=5)
-    if yandex_results:
-        all_results.extend(yandex_results)
-        engines_used.append('Yandex')
+    timed_out = bool(not_done)
     
     if not all_results:
         logging.warning(f"⚠️ No images found for '{query}' in any search engine")
@@ -1677,7 +2208,7 @@ def search_product_by_name(product_name, barcode=None):
     
     logging.info(f"✅ Multi-Search: Found {len(top_results)} relevant images for '{query}' using {', '.join(engines_used)}")
     
-    return {
+    response = {
         'success': True,
         'results': top_results,
         'query': query,
@@ -1686,3 +2217,9 @@ def search_product_by_name(product_name, barcode=None):
         'engines_used': engines_used,
         'relevance_threshold': relevance_threshold
     }
+    
+    # Kısmi sonuçları (deadline aşımı) önbelleğe alma - sonraki tıklama tam arama yapsın
+    if not timed_out:
+        _save_cached_search(cache_key, response)
+    
+    return response
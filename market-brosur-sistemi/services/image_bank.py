@@ -13,10 +13,20 @@ Storage Structure:
 - /static/uploads/customers/{user_id}/{sector}/{barcode}/ - Customer specific images
 - /static/uploads/pending/{sector}/{barcode}/        - Awaiting admin approval
 - /static/uploads/cache/{barcode}/                   - Temporary API cache
+- /static/uploads/blobs/ab/cd/{sha256}.png           - Content-addressed image bytes;
+  depot files above are hardlinks into it (services/blob_store.py)
+- /static/uploads/derivatives/ab/{sha256}_{size}.jpg - Thumb/medium/editor variants
+  (services/image_derivatives.py)
+
+With DEPOT_SHARDING enabled, barcode folders get two hashed levels
+({group}/ab/cd/{barcode}/); the path helpers below handle both layouts.
+
+Every write / move / delete below also updates the depot index
+(services/depot_index.py) in the same DB transaction; lookups and
+listings query the index instead of walking the folders.
 """
 
 import os
-import json
 import shutil
 import logging
 from datetime import datetime
@@ -24,7 +34,29 @@ from pathlib import Path
 from PIL import Image
 from io import BytesIO
 
-from utils.constants import SECTORS, ALLOWED_IMAGE_EXTENSIONS
+from utils.constants import SECTORS
+from services.lookup_metrics import track_tier
+from services.blob_store import write_depot_file
+from services.image_derivatives import warm_derivatives
+from services.image_similarity import SIMILAR_AUTO_LINK_DISTANCE, index_hashes, find_similar
+from services.depot_usage import QuotaExceeded, check_quota
+from services.depot_index import (
+    DEPOT_SHARDING,
+    shard_dirs,
+    index_transaction,
+    index_image,
+    to_rel_path,
+    move_image,
+    move_folder,
+    remove_folder,
+    set_folder_metadata,
+    METADATA_FILENAME,
+    find_depot_image,
+    depot_url,
+    find_depot_images_bulk,
+    find_images_in_folder,
+    list_depot_images
+)
 
 # Base paths
 BASE_UPLOAD_PATH = 'static/uploads'
@@ -45,9 +77,18 @@ def ensure_base_directories():
         os.makedirs(os.path.join(PENDING_PATH, sector), exist_ok=True)
 
 
-def get_customer_depot_path(user_id, sector=None, group=None, barcode=None):
+def _barcode_folder(path, barcode, sharded=None):
+    """Append the barcode folder (behind ab/cd/ shard folders when sharding is on)"""
+    if sharded is None:
+        sharded = DEPOT_SHARDING
+    if sharded:
+        path = os.path.join(path, *shard_dirs(barcode))
+    return os.path.join(path, barcode)
+
+
+def get_customer_depot_path(user_id, sector=None, group=None, barcode=None, sharded=None):
     """Get path to customer's depot
-    Structure: customers/{user_id}/{sector}/{group}/{barcode}/
+    Structure: customers/{user_id}/{sector}/{group}/[ab/cd/]{barcode}/
     """
     path = os.path.join(CUSTOMERS_PATH, str(user_id))
     if sector:
@@ -55,13 +96,13 @@ def get_customer_depot_path(user_id, sector=None, group=None, barcode=None):
     if group:
         path = os.path.join(path, group)
     if barcode:
-        path = os.path.join(path, barcode)
+        path = _barcode_folder(path, barcode, sharded)
     return path
 
 
-def get_admin_depot_path(sector=None, group=None, barcode=None):
+def get_admin_depot_path(sector=None, group=None, barcode=None, sharded=None):
     """Get path to admin depot
-    Structure: admin/{sector}/{group}/{barcode}/
+    Structure: admin/{sector}/{group}/[ab/cd/]{barcode}/
     """
     path = ADMIN_PATH
     if sector:
@@ -69,13 +110,13 @@ def get_admin_depot_path(sector=None, group=None, barcode=None):
     if group:
         path = os.path.join(path, group)
     if barcode:
-        path = os.path.join(path, barcode)
+        path = _barcode_folder(path, barcode, sharded)
     return path
 
 
-def get_pending_path(sector=None, group=None, barcode=None):
+def get_pending_path(sector=None, group=None, barcode=None, sharded=None):
     """Get path to pending approval folder
-    Structure: pending/{sector}/{group}/{barcode}/
+    Structure: pending/{sector}/{group}/[ab/cd/]{barcode}/
     """
     path = PENDING_PATH
     if sector:
@@ -83,20 +124,58 @@ def get_pending_path(sector=None, group=None, barcode=None):
     if group:
         path = os.path.join(path, group)
     if barcode:
-        path = os.path.join(path, barcode)
+        path = _barcode_folder(path, barcode, sharded)
     return path
 
 
+def find_depot_folder(depot_type, sector, group, barcode, user_id=None):
+    """
+    Existing barcode folder in either layout (sharded or not); falls back
+    to the path new files would be written to.
+    """
+    if depot_type == 'customer':
+        candidates = [get_customer_depot_path(user_id, sector, group, barcode, sharded=s) for s in (True, False)]
+    elif depot_type == 'admin':
+        candidates = [get_admin_depot_path(sector, group, barcode, sharded=s) for s in (True, False)]
+    else:
+        candidates = [get_pending_path(sector, group, barcode, sharded=s) for s in (True, False)]
+    for folder in candidates:
+        if os.path.isdir(folder):
+            return folder
+    return candidates[0] if DEPOT_SHARDING else candidates[1]
+
+
 def find_image_in_depot(depot_path):
-    """Find first image file in a depot folder"""
-    if not os.path.exists(depot_path) or not os.path.isdir(depot_path):
-        return None
-    
-    for filename in os.listdir(depot_path):
-        ext = os.path.splitext(filename)[1].lower()
-        if ext in ALLOWED_IMAGE_EXTENSIONS:
-            return os.path.join(depot_path, filename)
-    return None
+    """Find first image file in a depot folder (from the depot index)"""
+    images = find_images_in_folder(depot_path)
+    return images[0]['image_path'] if images else None
+
+
+def _remove_metadata_file(folder):
+    """Drop a legacy / exported metadata.json left behind in a folder whose images moved away"""
+    try:
+        os.remove(os.path.join(folder, METADATA_FILENAME))
+    except OSError:
+        pass
+
+
+def _move_depot_file(src, dst, status, metadata):
+    """
+    Rename a depot file and re-point its index row (+ folder metadata) in one
+    transaction. If the index update fails the file is moved back, so the
+    file and its index row never end up in different depots.
+    """
+    try:
+        with index_transaction() as conn:
+            # Depo dosyası blob'a bağlantı: taşıma sadece yeniden adlandırma (bayt kopyalanmaz)
+            os.replace(src, dst)
+            move_image(src, dst, status=status, conn=conn)
+            # Metadata satırla birlikte taşındı
+            set_folder_metadata(os.path.dirname(dst), metadata, conn=conn)
+    except Exception:
+        if os.path.exists(dst) and not os.path.exists(src):
+            os.replace(dst, src)
+        raise
 
 
 def search_image_hierarchy(barcode, user_id, sector='supermarket'):
@@ -109,30 +188,30 @@ def search_image_hierarchy(barcode, user_id, sector='supermarket'):
     Returns:
         dict: {found: bool, source: str, image_path: str, image_url: str}
     """
-    ensure_base_directories()
-    
     # 1. Check customer's depot
-    customer_path = get_customer_depot_path(user_id, sector, barcode)
-    image_path = find_image_in_depot(customer_path)
-    if image_path:
-        relative_path = image_path.replace('\\', '/')
+    with track_tier('customer_depot') as t:
+        image = find_depot_image('customer', barcode, sector, user_id) if user_id else None
+        if image:
+            t['outcome'] = 'hit'
+    if image:
         return {
             'found': True,
             'source': 'customer_depot',
-            'image_path': image_path,
-            'image_url': f'/{relative_path}'
+            'image_path': image['image_path'],
+            'image_url': image['image_url']
         }
     
     # 2. Check admin's depot
-    admin_path = get_admin_depot_path(sector, barcode)
-    image_path = find_image_in_depot(admin_path)
-    if image_path:
-        relative_path = image_path.replace('\\', '/')
+    with track_tier('admin_depot') as t:
+        image = find_depot_image('admin', barcode, sector)
+        if image:
+            t['outcome'] = 'hit'
+    if image:
         return {
             'found': True,
             'source': 'admin_depot',
-            'image_path': image_path,
-            'image_url': f'/{relative_path}'
+            'image_path': image['image_path'],
+            'image_url': image['image_url']
         }
     
     # 3. Not found in local depots
@@ -144,6 +223,36 @@ def search_image_hierarchy(barcode, user_id, sector='supermarket'):
     }
 
 
+def resolve_images(user_id, sector, barcodes):
+    """
+    Batch version of search_image_hierarchy: map a list of barcodes to the
+    best depot image (customer depot first, then admin depot, any product
+    group) with one depot index query per 500 barcodes.
+    
+    Returns:
+        dict: {barcode: {found, source, image_path, image_url, group}}
+    """
+    with track_tier('depot_batch') as t:
+        images = find_depot_images_bulk(barcodes, sector, user_id or 0)
+        if images:
+            t['outcome'] = 'hit'
+    
+    results = {}
+    for barcode in barcodes:
+        barcode = str(barcode or '').strip()
+        if not barcode or barcode in results:
+            continue
+        image = images.get(barcode)
+        results[barcode] = {
+            'found': bool(image),
+            'source': f"{image['depot_type']}_depot" if image else None,
+            'image_path': image['image_path'] if image else None,
+            'image_url': image['image_url'] if image else None,
+            'group': image['product_group'] if image else None
+        }
+    return results
+
+
 def save_to_customer_depot(user_id, sector, barcode, image_data, filename='product.png', group='Genel', skip_processing=False):
     """
     Save image DIRECTLY to customer's depot.
@@ -161,7 +270,10 @@ def save_to_customer_depot(user_id, sector, barcode, image_data, filename='produ
         skip_processing: If True, image_data is already processed (PNG from Stage 1)
     
     Returns:
-        dict: {success: bool, customer_url: str}
+        dict: {success: bool, customer_url: str, quota_warning: list}
+    
+    Raises:
+        QuotaExceeded: The standardized image would exceed the customer's hard quota
     """
     try:
         # Eğer image_processor tarafından zaten işlendiyse, tekrar işleme
@@ -175,26 +287,36 @@ def save_to_customer_depot(user_id, sector, barcode, image_data, filename='produ
             image_bytes = standardized['image_bytes']
         
         # Save DIRECTLY to customer depot (not pending!)
-        customer_path = get_customer_depot_path(user_id, sector, group, barcode)
+        customer_path = find_depot_folder('customer', sector, group, barcode, user_id)
         os.makedirs(customer_path, exist_ok=True)
         customer_file = os.path.join(customer_path, filename)
-        with open(customer_file, 'wb') as f:
-            f.write(image_bytes)
+        with index_transaction() as conn:
+            # Kota: kaydedilecek (standart) dosyanın boyutuyla, yazma kilidi altında;
+            # aynı barkodun resmi yeniden yüklenirse eski dosyanın boyutu düşülür
+            conn.execute("BEGIN IMMEDIATE")
+            existing = conn.execute("SELECT file_size FROM depot_images WHERE rel_path = ?",
+                                    (to_rel_path(customer_file),)).fetchone()
+            quota = check_quota(user_id, len(image_bytes), incoming_files=0 if existing else 1,
+                                replaced_bytes=existing['file_size'] if existing else 0, conn=conn)
+            if not quota['allowed']:
+                raise QuotaExceeded(quota)
+            content_hash = write_depot_file(customer_file, image_bytes)
+            index_image(customer_file, status='customer_depot', conn=conn, content_hash=content_hash)
+            hashes = index_hashes(conn, content_hash, image_bytes)
+            set_folder_metadata(customer_path, {
+                'user_id': user_id,
+                'group': group,
+                'uploaded_at': datetime.now().isoformat(),
+                'status': 'customer_depot',
+                'original_filename': filename
+            }, conn=conn)
+        warm_derivatives(content_hash, customer_file)
         
-        # Save metadata
-        metadata = {
-            'user_id': user_id,
-            'sector': sector,
-            'group': group,
-            'barcode': barcode,
-            'uploaded_at': datetime.now().isoformat(),
-            'status': 'customer_depot',
-            'original_filename': filename
-        }
-        with open(os.path.join(customer_path, 'metadata.json'), 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, ensure_ascii=False, indent=2)
+        # Admin deposunda görsel olarak aynı resim varsa öner (tekrar onaya gerek kalmadan bağlanabilir)
+        similar_admin = find_similar(hashes['phash'], hashes['dhash'], max_distance=SIMILAR_AUTO_LINK_DISTANCE,
+                                     depot_type='admin', sector=sector, limit=5) if hashes else []
         
-        customer_url = f'/{customer_file.replace(os.sep, "/")}'
+        customer_url = depot_url(customer_file)
         
         logging.info(f"Image saved to CUSTOMER DEPOT: {barcode} (user: {user_id}, group: {group})")
         
@@ -202,9 +324,13 @@ def save_to_customer_depot(user_id, sector, barcode, image_data, filename='produ
             'success': True,
             'customer_url': customer_url,
             'pending_url': customer_url,  # Backward compatibility
-            'group': group
+            'group': group,
+            'similar_admin': similar_admin,
+            'quota_warning': quota['soft_exceeded']
         }
         
+    except QuotaExceeded:
+        raise
     except Exception as e:
         logging.error(f"Save to pending depot error: {str(e)}")
         return {'success': False, 'error': str(e)}
@@ -225,7 +351,7 @@ def move_from_pending_to_customer(user_id, sector, barcode, group='Genel'):
         dict: {success: bool, customer_url: str}
     """
     try:
-        pending_path = get_pending_path(sector, group, barcode)
+        pending_path = find_depot_folder('pending', sector, group, barcode)
         
         # PNG veya JPG dosyasını bul
         pending_file = os.path.join(pending_path, 'product.png')
@@ -237,7 +363,7 @@ def move_from_pending_to_customer(user_id, sector, barcode, group='Genel'):
             return {'success': False, 'error': 'Pending image not found'}
         
         # Create customer depot path
-        customer_path = get_customer_depot_path(user_id, sector, group, barcode)
+        customer_path = find_depot_folder('customer', sector, group, barcode, user_id)
         os.makedirs(customer_path, exist_ok=True)
         
         # Aynı uzantıyı kullan
@@ -245,29 +371,16 @@ def move_from_pending_to_customer(user_id, sector, barcode, group='Genel'):
         customer_file = os.path.join(customer_path, filename)
         
         # Move file
-        shutil.move(pending_file, customer_file)
-        
-        # Update metadata
-        metadata_file = os.path.join(pending_path, 'metadata.json')
-        if os.path.exists(metadata_file):
-            with open(metadata_file, 'r', encoding='utf-8') as f:
-                metadata = json.load(f)
-            metadata['status'] = 'approved'
-            metadata['approved_at'] = datetime.now().isoformat()
-            
-            # Move metadata to customer path
-            customer_metadata = os.path.join(customer_path, 'metadata.json')
-            with open(customer_metadata, 'w', encoding='utf-8') as f:
-                json.dump(metadata, f, ensure_ascii=False, indent=2)
-            os.remove(metadata_file)
+        _move_depot_file(pending_file, customer_file, 'approved', {'approved_at': datetime.now().isoformat()})
         
         # Remove empty pending folder
+        _remove_metadata_file(pending_path)
         try:
             os.rmdir(pending_path)
         except:
             pass
         
-        customer_url = f'/{customer_file.replace(os.sep, "/")}'
+        customer_url = depot_url(customer_file)
         
         logging.info(f"Image moved from pending to customer depot: {barcode} (user: {user_id})")
         
@@ -301,7 +414,7 @@ def move_to_admin_depot(user_id, sector, barcode, group='Genel'):
     """
     try:
         # Source: Customer depot
-        customer_path = get_customer_depot_path(user_id, sector, group, barcode)
+        customer_path = find_depot_folder('customer', sector, group, barcode, user_id)
         
         # Find image file (PNG or JPG)
         customer_file = os.path.join(customer_path, 'product.png')
@@ -310,47 +423,24 @@ def move_to_admin_depot(user_id, sector, barcode, group='Genel'):
         
         if not os.path.exists(customer_file):
             logging.warning(f"Customer image not found: {customer_path}")
-            return {'success': False, 'error': 'Customer image not found'}
+            return {'success': False, 'error': 'Customer image not found', 'missing': True}
         
         # Destination: Admin depot
-        admin_path = get_admin_depot_path(sector, group, barcode)
+        admin_path = find_depot_folder('admin', sector, group, barcode)
         os.makedirs(admin_path, exist_ok=True)
         
         # Same filename
         filename = os.path.basename(customer_file)
         admin_file = os.path.join(admin_path, filename)
         
-        # MOVE file (not copy!) - Müşteri deposundan TAŞI
-        shutil.move(customer_file, admin_file)
-        
-        # Customer metadata'yı admin deposuna taşı
-        customer_metadata_file = os.path.join(customer_path, 'metadata.json')
-        if os.path.exists(customer_metadata_file):
-            with open(customer_metadata_file, 'r', encoding='utf-8') as f:
-                metadata = json.load(f)
-            # Metadata'yı güncelle
-            metadata['original_user_id'] = user_id
-            metadata['approved_at'] = datetime.now().isoformat()
-            metadata['status'] = 'admin_depot'
-            # Admin deposuna yaz
-            with open(os.path.join(admin_path, 'metadata.json'), 'w', encoding='utf-8') as f:
-                json.dump(metadata, f, ensure_ascii=False, indent=2)
-            # Müşteri metadata'sını sil
-            os.remove(customer_metadata_file)
-        else:
-            # Yeni metadata oluştur
-            metadata = {
-                'original_user_id': user_id,
-                'sector': sector,
-                'group': group,
-                'barcode': barcode,
-                'approved_at': datetime.now().isoformat(),
-                'status': 'admin_depot'
-            }
-            with open(os.path.join(admin_path, 'metadata.json'), 'w', encoding='utf-8') as f:
-                json.dump(metadata, f, ensure_ascii=False, indent=2)
+        # MOVE file (not copy!) - Müşteri deposundan TAŞI (metadata satırla birlikte gelir)
+        _move_depot_file(customer_file, admin_file, 'admin_depot', {
+            'original_user_id': user_id,
+            'approved_at': datetime.now().isoformat()
+        })
         
         # Müşteri klasörünü temizle (boşsa sil)
+        _remove_metadata_file(customer_path)
         try:
             # customer_path içinde başka dosya kalmadıysa klasörü sil
             remaining_files = os.listdir(customer_path) if os.path.exists(customer_path) else []
@@ -360,7 +450,7 @@ def move_to_admin_depot(user_id, sector, barcode, group='Genel'):
         except Exception as cleanup_error:
             logging.warning(f"Customer folder cleanup warning: {cleanup_error}")
         
-        admin_url = f'/{admin_file.replace(os.sep, "/")}'
+        admin_url = depot_url(admin_file)
         
         logging.info(f"Image MOVED to admin depot: {barcode} (from user: {user_id}) - Customer copy DELETED")
         
@@ -395,10 +485,12 @@ def delete_from_pending(sector, barcode, group='Genel'):
         dict: {success: bool}
     """
     try:
-        pending_path = get_pending_path(sector, group, barcode)
+        pending_path = find_depot_folder('pending', sector, group, barcode)
         
         if os.path.exists(pending_path):
-            shutil.rmtree(pending_path)
+            with index_transaction() as conn:
+                remove_folder(pending_path, conn=conn)
+                shutil.rmtree(pending_path)
             logging.info(f"Pending image deleted: {barcode}")
             return {'success': True}
         else:
@@ -430,7 +522,7 @@ def save_to_admin_depot(sector, barcode, image_data, filename='product.png', met
     """
     try:
         # Ensure directory with group hierarchy
-        admin_path = get_admin_depot_path(sector, group, barcode)
+        admin_path = find_depot_folder('admin', sector, group, barcode)
         os.makedirs(admin_path, exist_ok=True)
         
         # TODO: Aşama 1 - OpenAI 1024px resize buraya eklenecek
@@ -443,16 +535,15 @@ def save_to_admin_depot(sector, barcode, image_data, filename='product.png', met
         
         # Save to admin depot
         admin_file = os.path.join(admin_path, filename)
-        with open(admin_file, 'wb') as f:
-            f.write(standardized['image_bytes'])
-        
-        # Save metadata
-        if metadata:
-            metadata['group'] = group
-            with open(os.path.join(admin_path, 'metadata.json'), 'w', encoding='utf-8') as f:
-                json.dump(metadata, f, ensure_ascii=False, indent=2)
+        with index_transaction() as conn:
+            content_hash = write_depot_file(admin_file, standardized['image_bytes'])
+            index_image(admin_file, status='admin_depot', conn=conn, content_hash=content_hash)
+            index_hashes(conn, content_hash, standardized['image_bytes'])
+            set_folder_metadata(admin_path, {'uploaded_at': datetime.now().isoformat(),
+                                             **(metadata or {}), 'group': group}, conn=conn)
+        warm_derivatives(content_hash, admin_file)
         
-        admin_url = f'/{admin_file.replace(os.sep, "/")}'
+        admin_url = depot_url(admin_file)
         
         logging.info(f"Image saved to admin depot: {barcode} (group: {group})")
         
@@ -480,8 +571,8 @@ def approve_pending_image(sector, barcode):
         dict: {success: bool, admin_url: str}
     """
     try:
-        pending_path = get_pending_path(sector, barcode)
-        admin_path = get_admin_depot_path(sector, barcode)
+        pending_path = find_depot_folder('pending', sector, None, barcode)
+        admin_path = get_admin_depot_path(sector, barcode=barcode)
         
         if not os.path.exists(pending_path):
             return {'success': False, 'error': 'Pending image not found'}
@@ -489,36 +580,34 @@ def approve_pending_image(sector, barcode):
         # Create admin directory
         os.makedirs(os.path.dirname(admin_path), exist_ok=True)
         
-        # Remove existing admin folder if exists
-        if os.path.exists(admin_path):
-            shutil.rmtree(admin_path)
+        # Yükleyen müşteri (indeksten, metadata.json okunmadan)
+        pending_images = find_images_in_folder(pending_path)
+        user_id = pending_images[0]['uploader_id'] if pending_images else None
         
-        # Move from pending to admin
-        shutil.move(pending_path, admin_path)
-        
-        # Update metadata
-        metadata_file = os.path.join(admin_path, 'metadata.json')
-        if os.path.exists(metadata_file):
-            with open(metadata_file, 'r', encoding='utf-8') as f:
-                metadata = json.load(f)
-            
-            # Remove from customer depot (image now belongs to admin)
-            user_id = metadata.get('user_id')
-            if user_id:
-                customer_path = get_customer_depot_path(user_id, sector, barcode)
-                if os.path.exists(customer_path):
-                    shutil.rmtree(customer_path)
-                    logging.info(f"Removed from customer depot after approval: {barcode}")
+        with index_transaction() as conn:
+            # Remove existing admin folder if exists (either layout)
+            for existing in {admin_path, find_depot_folder('admin', sector, None, barcode)}:
+                if os.path.exists(existing):
+                    remove_folder(existing, conn=conn)
+                    shutil.rmtree(existing)
             
-            metadata['status'] = 'approved'
-            metadata['approved_at'] = datetime.now().isoformat()
-            
-            with open(metadata_file, 'w', encoding='utf-8') as f:
-                json.dump(metadata, f, ensure_ascii=False, indent=2)
+            # Move from pending to admin
+            shutil.move(pending_path, admin_path)
+            move_folder(pending_path, admin_path, status='approved', conn=conn)
+            set_folder_metadata(admin_path, {'approved_at': datetime.now().isoformat()}, conn=conn)
+        
+        # Remove from customer depot (image now belongs to admin)
+        customer_image = find_depot_image('customer', barcode, sector, user_id) if user_id else None
+        if customer_image:
+            customer_path = customer_image['folder']
+            with index_transaction() as conn:
+                remove_folder(customer_path, conn=conn)
+                shutil.rmtree(customer_path)
+            logging.info(f"Removed from customer depot after approval: {barcode}")
         
         # Find the image file
         image_path = find_image_in_depot(admin_path)
-        admin_url = f'/{image_path.replace(os.sep, "/")}' if image_path else None
+        admin_url = depot_url(image_path) if image_path else None
         
         logging.info(f"Image approved and moved to admin depot: {barcode}")
         
@@ -545,33 +634,25 @@ def reject_pending_image(sector, barcode):
         dict: {success: bool}
     """
     try:
-        pending_path = get_pending_path(sector, barcode)
+        pending_path = find_depot_folder('pending', sector, None, barcode)
         
         if not os.path.exists(pending_path):
             return {'success': False, 'error': 'Pending image not found'}
         
-        # Get user_id from metadata before deleting
-        metadata_file = os.path.join(pending_path, 'metadata.json')
-        user_id = None
-        if os.path.exists(metadata_file):
-            with open(metadata_file, 'r', encoding='utf-8') as f:
-                metadata = json.load(f)
-            user_id = metadata.get('user_id')
+        # Get uploader from the index before deleting
+        pending_images = find_images_in_folder(pending_path)
+        user_id = pending_images[0]['uploader_id'] if pending_images else None
         
         # Remove pending folder
-        shutil.rmtree(pending_path)
-        
-        # Update customer depot metadata to show rejection
-        if user_id:
-            customer_path = get_customer_depot_path(user_id, sector, barcode)
-            customer_metadata = os.path.join(customer_path, 'metadata.json')
-            if os.path.exists(customer_metadata):
-                with open(customer_metadata, 'r', encoding='utf-8') as f:
-                    metadata = json.load(f)
-                metadata['status'] = 'rejected'
-                metadata['rejected_at'] = datetime.now().isoformat()
-                with open(customer_metadata, 'w', encoding='utf-8') as f:
-                    json.dump(metadata, f, ensure_ascii=False, indent=2)
+        with index_transaction() as conn:
+            remove_folder(pending_path, conn=conn)
+            shutil.rmtree(pending_path)
+        
+        # Update customer depot metadata to show rejection (any group)
+        customer_image = find_depot_image('customer', barcode, sector, user_id) if user_id else None
+        if customer_image:
+            set_folder_metadata(customer_image['folder'], {'status': 'rejected',
+                                                           'rejected_at': datetime.now().isoformat()})
         
         logging.info(f"Image rejected: {barcode}")
         
@@ -649,46 +730,19 @@ def get_pending_images_list():
     """
     pending_list = []
     
-    if not os.path.exists(PENDING_PATH):
-        return pending_list
-    
-    for sector in os.listdir(PENDING_PATH):
-        sector_path = os.path.join(PENDING_PATH, sector)
-        if not os.path.isdir(sector_path):
-            continue
-        
-        for barcode in os.listdir(sector_path):
-            barcode_path = os.path.join(sector_path, barcode)
-            if not os.path.isdir(barcode_path):
-                continue
-            
-            # Find image
-            image_path = find_image_in_depot(barcode_path)
-            if not image_path:
-                continue
-            
-            # Load metadata
-            metadata = {}
-            metadata_file = os.path.join(barcode_path, 'metadata.json')
-            if os.path.exists(metadata_file):
-                try:
-                    with open(metadata_file, 'r', encoding='utf-8') as f:
-                        metadata = json.load(f)
-                except:
-                    pass
-            
-            pending_list.append({
-                'barcode': barcode,
-                'sector': sector,
-                'sector_name': SECTORS.get(sector, sector),
-                'image_url': f'/{image_path.replace(os.sep, "/")}',
-                'user_id': metadata.get('user_id'),
-                'uploaded_at': metadata.get('uploaded_at'),
-                'original_filename': metadata.get('original_filename')
-            })
+    for image in list_depot_images('pending'):
+        pending_list.append({
+            'barcode': image['barcode'],
+            'sector': image['sector'],
+            'sector_name': SECTORS.get(image['sector'], image['sector']),
+            'image_url': image['image_url'],
+            'user_id': image['uploader_id'],
+            'uploaded_at': image['uploaded_at'],
+            'original_filename': image['original_filename']
+        })
     
     # Sort by upload date (newest first)
-    pending_list.sort(key=lambda x: x.get('uploaded_at', ''), reverse=True)
+    pending_list.sort(key=lambda x: x.get('uploaded_at') or '', reverse=True)
     
     return pending_list
 
@@ -704,36 +758,14 @@ def get_admin_images_by_sector(sector):
         list: List of image info dicts
     """
     images = []
-    sector_path = get_admin_depot_path(sector)
     
-    if not os.path.exists(sector_path):
-        return images
-    
-    for barcode in os.listdir(sector_path):
-        barcode_path = os.path.join(sector_path, barcode)
-        if not os.path.isdir(barcode_path):
-            continue
-        
-        image_path = find_image_in_depot(barcode_path)
-        if not image_path:
-            continue
-        
-        # Load metadata
-        metadata = {}
-        metadata_file = os.path.join(barcode_path, 'metadata.json')
-        if os.path.exists(metadata_file):
-            try:
-                with open(metadata_file, 'r', encoding='utf-8') as f:
-                    metadata = json.load(f)
-            except:
-                pass
-        
+    for image in list_depot_images('admin', sector=sector):
         images.append({
-            'barcode': barcode,
+            'barcode': image['barcode'],
             'sector': sector,
-            'product_name': metadata.get('product_name', barcode),
-            'image_url': f'/{image_path.replace(os.sep, "/")}',
-            'approved_at': metadata.get('approved_at')
+            'product_name': image['product_name'] or image['barcode'],
+            'image_url': image['image_url'],
+            'approved_at': image['approved_at']
         })
     
     return images
@@ -751,46 +783,19 @@ def get_customer_images(user_id, sector=None):
         list: List of image info dicts
     """
     images = []
-    customer_base = get_customer_depot_path(user_id)
     
-    if not os.path.exists(customer_base):
-        return images
-    
-    sectors_to_check = [sector] if sector else os.listdir(customer_base)
-    
-    for sec in sectors_to_check:
-        sector_path = os.path.join(customer_base, sec)
-        if not os.path.isdir(sector_path):
+    for image in list_depot_images('customer', sector=sector, user_id=user_id):
+        if image['sector'] not in SECTORS:
             continue
-        
-        for barcode in os.listdir(sector_path):
-            barcode_path = os.path.join(sector_path, barcode)
-            if not os.path.isdir(barcode_path):
-                continue
-            
-            image_path = find_image_in_depot(barcode_path)
-            if not image_path:
-                continue
-            
-            # Load metadata
-            metadata = {}
-            metadata_file = os.path.join(barcode_path, 'metadata.json')
-            if os.path.exists(metadata_file):
-                try:
-                    with open(metadata_file, 'r', encoding='utf-8') as f:
-                        metadata = json.load(f)
-                except:
-                    pass
-            
-            images.append({
-                'barcode': barcode,
-                'sector': sec,
-                'sector_name': SECTORS.get(sec, sec),
-                'product_name': metadata.get('product_name', barcode),
-                'image_url': f'/{image_path.replace(os.sep, "/")}',
-                'status': metadata.get('status', 'pending'),
-                'uploaded_at': metadata.get('uploaded_at')
-            })
+        images.append({
+            'barcode': image['barcode'],
+            'sector': image['sector'],
+            'sector_name': SECTORS.get(image['sector'], image['sector']),
+            'product_name': image['product_name'] or image['barcode'],
+            'image_url': image['image_url'],
+            'status': image['status'] or 'pending',
+            'uploaded_at': image['uploaded_at']
+        })
     
     return images
 
@@ -809,19 +814,25 @@ def delete_image_from_depot(depot_type, sector, barcode, user_id=None):
         dict: {success: bool}
     """
     try:
-        if depot_type == 'admin':
-            path = get_admin_depot_path(sector, barcode)
-        elif depot_type == 'customer':
-            if not user_id:
-                return {'success': False, 'error': 'user_id required for customer depot'}
-            path = get_customer_depot_path(user_id, sector, barcode)
-        elif depot_type == 'pending':
-            path = get_pending_path(sector, barcode)
+        if depot_type == 'customer' and not user_id:
+            return {'success': False, 'error': 'user_id required for customer depot'}
+        if depot_type in ('admin', 'customer', 'pending'):
+            path = find_depot_folder(depot_type, sector, None, barcode, user_id)
         else:
             return {'success': False, 'error': 'Invalid depot type'}
         
+        # Gruplu klasörler ({sector}/{group}/{barcode}) indeksten bulunur
+        folders = {image['folder'] for image in list_depot_images(depot_type, sector=sector,
+                                                                   user_id=user_id or 0, barcode=barcode)}
         if os.path.exists(path):
-            shutil.rmtree(path)
+            folders.add(path)
+        
+        if folders:
+            with index_transaction() as conn:
+                for folder in folders:
+                    remove_folder(folder, conn=conn)
+                    if os.path.exists(folder):
+                        shutil.rmtree(folder)
             logging.info(f"Deleted from {depot_type}: {barcode}")
             return {'success': True}
         
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+Image Derivatives Service - Küçük resim / orta boy türevleri
+
+Resized variants of depot images are generated once and stored by the
+source content hash:
+
+    static/uploads/derivatives/ab/<sha256>_<size>.jpg
+
+- thumb (150px), medium (500px), editor (1024px)
+- Generated in the background after ingest (warm_derivatives) or lazily on
+  first request (get_derivative); concurrent requests write atomically
+- Keys follow the source bytes: a replaced image gets a new hash and thus
+  new derivatives; stale ones are removed with the blob (blob_store.gc_blobs)
+- Transparent sources are flattened onto white (JPEG has no alpha)
+
+Full-size format variants keep transparency and are chosen per request
+from the Accept header (routes/image_bank.py serve_depot_image):
+
+    static/uploads/derivatives/ab/<sha256>.webp   (near-lossless WebP)
+    static/uploads/derivatives/ab/<sha256>.avif   (if Pillow has AVIF support)
+
+A variant that is not smaller than the source is never served. Requests
+never encode: a missing variant is queued on the warm executor (once per
+hash and format) and the next best format or the source is served meanwhile.
+"""
+
+import os
+import uuid
+import logging
+import warnings
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, features
+
+# ============= CONFIGURATION =============
+
+DERIVATIVE_ROOT = os.path.join('static', 'uploads', 'derivatives')
+DERIVATIVE_SIZES = {
+    'thumb': 150,
+    'medium': 500,
+    'editor': 1024,
+}
+DERIVATIVE_QUALITY = int(os.environ.get('DERIVATIVE_QUALITY', 85))
+DERIVATIVE_WARM_WORKERS = int(os.environ.get('DERIVATIVE_WARM_WORKERS', 2))
+# Yüklemeden sonra hangi türevler önceden üretilsin (virgülle ayrılmış)
+DERIVATIVE_WARM_SIZES = [s.strip() for s in os.environ.get('DERIVATIVE_WARM_SIZES', 'thumb,medium').split(',')
+                         if s.strip() in DERIVATIVE_SIZES]
+
+# Tam boy format varyantları (alfa korunur)
+VARIANT_FORMATS = {
+    'avif': {'mimetype': 'image/avif', 'pil_format': 'AVIF',
+             'options': {'quality': int(os.environ.get('AVIF_QUALITY', 80)), 'speed': 6}},
+    'webp': {'mimetype': 'image/webp', 'pil_format': 'WEBP',
+             'options': {'quality': int(os.environ.get('WEBP_QUALITY', 90)), 'alpha_quality': 100,
+                         'method': 4, 'exact': True}},
+}
+# Yüklemeden sonra önceden üretilecek format varyantları
+VARIANT_WARM_FORMATS = [f.strip() for f in os.environ.get('VARIANT_WARM_FORMATS', 'webp').split(',')
+                        if f.strip() in VARIANT_FORMATS]
+
+_supported_formats = None
+_warm_executor = ThreadPoolExecutor(max_workers=DERIVATIVE_WARM_WORKERS, thread_name_prefix='derivatives')
+# Kuyruktaki varyantlar (hash, format): aynı varyant iki kez kodlanmaz
+_queued_variants = set()
+_queued_lock = threading.Lock()
+
+
+def derivative_path(content_hash, size):
+    """Filesystem path of a derivative: derivatives/ab/<hash>_<size>.jpg"""
+    return os.path.join(DERIVATIVE_ROOT, content_hash[:2], f'{content_hash}_{size}.jpg')
+
+
+def variant_path(content_hash, fmt):
+    """Filesystem path of a full-size format variant: derivatives/ab/<hash>.<fmt>"""
+    return os.path.join(DERIVATIVE_ROOT, content_hash[:2], f'{content_hash}.{fmt}')
+
+
+def supported_variant_formats():
+    """Variant formats the installed Pillow can encode, preferred first"""
+    global _supported_formats
+    if _supported_formats is None:
+        with warnings.catch_warnings():
+            # Eski Pillow sürümleri 'avif' özelliğini tanımaz (uyarı + False)
+            warnings.simplefilter('ignore')
+            _supported_formats = [fmt for fmt in VARIANT_FORMATS if features.check(fmt)]
+    return _supported_formats
+
+
+def _render(source_path, max_side):
+    """Decode the source once and return an RGB image fitting max_side"""
+    with Image.open(source_path) as img:
+        img.draft('RGB', (max_side, max_side))
+        img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        if img.mode in ('RGBA', 'LA', 'P'):
+            rgba = img.convert('RGBA')
+            flat = Image.new('RGB', rgba.size, (255, 255, 255))
+            flat.paste(rgba, mask=rgba.split()[-1])
+            return flat
+        return img.convert('RGB')
+
+
+def get_derivative(content_hash, source_path, size='thumb'):
+    """
+    Path of the `size` derivative of an image, generating it if missing.
+
+    Args:
+        content_hash: sha256 of the source (depot_images.content_hash)
+        source_path: Source image file (used only when generating)
+        size: 'thumb' | 'medium' | 'editor'
+
+    Returns:
+        str: Derivative file path, or None if the source cannot be rendered
+    """
+    if size not in DERIVATIVE_SIZES or not content_hash:
+        return None
+
+    path = derivative_path(content_hash, size)
+    if os.path.exists(path):
+        return path
+
+    try:
+        img = _render(source_path, DERIVATIVE_SIZES[size])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{uuid.uuid4().hex[:8]}.tmp'
+        img.save(tmp, 'JPEG', quality=DERIVATIVE_QUALITY, optimize=True)
+        os.replace(tmp, path)
+        return path
+    except Exception as e:
+        logging.error(f"❌ Derivative error ({size}, {content_hash[:12]}): {e}")
+        return None
+
+
+def get_variant(content_hash, source_path, fmt, wait=True):
+    """
+    Path of the full-size `fmt` variant (webp/avif) of an image, encoding it
+    if missing.
+
+    Args:
+        wait: False = do not encode in the caller's thread; a missing
+              variant is queued (queue_variant) and None returned
+
+    Returns:
+        str: Variant file path, or None if unsupported, failed, not yet
+             encoded or not smaller than the source (callers then serve
+             the source)
+    """
+    if fmt not in supported_variant_formats() or not content_hash:
+        return None
+
+    path = variant_path(content_hash, fmt)
+    if not os.path.exists(path):
+        if not wait:
+            queue_variant(content_hash, source_path, fmt)
+            return None
+        try:
+            spec = VARIANT_FORMATS[fmt]
+            with Image.open(source_path) as img:
+                img = img.convert('RGBA' if img.mode in ('RGBA', 'LA', 'P', 'PA') else 'RGB')
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp = f'{path}.{uuid.uuid4().hex[:8]}.tmp'
+                img.save(tmp, spec['pil_format'], **spec['options'])
+            os.replace(tmp, path)
+        except Exception as e:
+            logging.error(f"❌ Variant error ({fmt}, {content_hash[:12]}): {e}")
+            return None
+
+    try:
+        if os.path.getsize(path) >= os.path.getsize(source_path):
+            return None
+    except OSError:
+        return None
+    return path
+
+
+def _encode_queued(key, content_hash, source_path, fmt):
+    try:
+        get_variant(content_hash, source_path, fmt)
+    finally:
+        with _queued_lock:
+            _queued_variants.discard(key)
+
+
+def queue_variant(content_hash, source_path, fmt):
+    """
+    Encode a format variant in the background unless it is already queued
+    (single-flight per process).
+
+    Returns:
+        bool: True if a new encode was queued
+    """
+    key = (content_hash, fmt)
+    with _queued_lock:
+        if key in _queued_variants:
+            return False
+        _queued_variants.add(key)
+    _warm_executor.submit(_encode_queued, key, content_hash, source_path, fmt)
+    return True
+
+
+def warm_derivatives(content_hash, source_path, sizes=None, formats=None):
+    """Generate derivatives and format variants in the background after an image was stored"""
+    if not content_hash:
+        return
+    for size in sizes or DERIVATIVE_WARM_SIZES:
+        _warm_executor.submit(get_derivative, content_hash, source_path, size)
+    for fmt in VARIANT_WARM_FORMATS if formats is None else formats:
+        queue_variant(content_hash, source_path, fmt)
+
+
+def remove_derivatives(content_hash):
+    """Delete all derivatives and variants of a source hash (called when its blob is deleted)"""
+    removed = 0
+    paths = [derivative_path(content_hash, size) for size in DERIVATIVE_SIZES]
+    paths += [variant_path(content_hash, fmt) for fmt in VARIANT_FORMATS]
+    for path in paths:
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
@@ -0,0 +1,401 @@
+# -*- coding: utf-8 -*-
+"""
+Image Fetch Service - Dış kaynaklardan resim indirme yardımcıları
+
+Features:
+- Streamed downloads with a byte cap (no full response.content buffering)
+- Content-Type / Content-Length pre-checks before reading the body
+- Early format/dimension sniffing from the first KBs (PIL ImageFile.Parser;
+  WebP / AVIF container headers are parsed directly since PIL needs the
+  whole file for them); clearly unusable images are aborted before the
+  rest is downloaded
+- Concurrent header-only probing of candidate URLs (Range request for the
+  first KBs) to verify reachability, real dimensions and format
+- Image host redirection (IMAGE_FETCH_PROXY_URL) for the record/replay
+  stub server (services/provider_stub.py) and load tests
+"""
+
+import os
+import struct
+import logging
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+from io import BytesIO
+from PIL import Image, ImageFile
+
+from utils.constants import MAX_IMAGE_SIZE
+
+# ============= CONFIGURATION =============
+
+# Ayarlıysa tüm resim indirmeleri bu adrese yönlendirilir:
+#   {IMAGE_FETCH_PROXY_URL}?url=<orijinal url>
+# Örnek: IMAGE_FETCH_PROXY_URL=http://127.0.0.1:8099/image
+IMAGE_FETCH_PROXY_URL = os.environ.get('IMAGE_FETCH_PROXY_URL', '').rstrip('/')
+
+IMAGE_DOWNLOAD_MAX_BYTES = int(os.environ.get('IMAGE_DOWNLOAD_MAX_BYTES', MAX_IMAGE_SIZE))
+IMAGE_DOWNLOAD_MAX_PIXELS = int(os.environ.get('IMAGE_DOWNLOAD_MAX_PIXELS', 40_000_000))
+IMAGE_DOWNLOAD_MIN_SIDE = int(os.environ.get('IMAGE_DOWNLOAD_MIN_SIDE', 50))
+# Bu kadar bayt okunduğu halde başlık çözülemezse indirme iptal edilir
+IMAGE_SNIFF_MAX_BYTES = 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+# Bazı CDN'ler resimleri genel tiplerle sunar
+GENERIC_CONTENT_TYPES = {'application/octet-stream', 'binary/octet-stream', ''}
+ALLOWED_FORMATS = {'JPEG', 'PNG', 'GIF', 'WEBP', 'BMP', 'TIFF', 'MPO', 'AVIF'}
+
+DEFAULT_HEADERS = {'User-Agent': 'AEU-Brosur-Sistemi/1.0'}
+
+# Aday resim yoklama (probe) ayarları
+IMAGE_PROBE_BYTES = int(os.environ.get('IMAGE_PROBE_BYTES', 64 * 1024))
+IMAGE_PROBE_TIMEOUT_SECONDS = float(os.environ.get('IMAGE_PROBE_TIMEOUT_SECONDS', 5))
+IMAGE_PROBE_DEADLINE_SECONDS = float(os.environ.get('IMAGE_PROBE_DEADLINE_SECONDS', 6))
+IMAGE_PROBE_MAX_WORKERS = int(os.environ.get('IMAGE_PROBE_MAX_WORKERS', 8))
+
+_probe_executor = ThreadPoolExecutor(max_workers=IMAGE_PROBE_MAX_WORKERS, thread_name_prefix='image-probe')
+
+
+class ImageDownloadError(Exception):
+    """Download aborted: unreachable, wrong type, too large or unusable"""
+
+    def __init__(self, message, reason='error'):
+        super().__init__(message)
+        self.reason = reason
+
+
+def rewrite_image_url(url):
+    """
+    Redirect an external image URL through IMAGE_FETCH_PROXY_URL.
+    Local / relative URLs and unset configuration are left unchanged.
+    """
+    if not IMAGE_FETCH_PROXY_URL or not url:
+        return url
+    if not url.startswith(('http://', 'https://')) or url.startswith(IMAGE_FETCH_PROXY_URL):
+        return url
+    return f"{IMAGE_FETCH_PROXY_URL}?url={quote(url, safe='')}"
+
+
+# ============= SNIFFING =============
+
+def check_image_header(image_format, width, height, min_side=None, max_pixels=None):
+    """Raise ImageDownloadError if sniffed format/dimensions are unusable"""
+    min_side = IMAGE_DOWNLOAD_MIN_SIDE if min_side is None else min_side
+    max_pixels = IMAGE_DOWNLOAD_MAX_PIXELS if max_pixels is None else max_pixels
+
+    if image_format and image_format.upper() not in ALLOWED_FORMATS:
+        raise ImageDownloadError(f'Unsupported image format: {image_format}', 'format')
+    if width < min_side or height < min_side:
+        raise ImageDownloadError(f'Image too small: {width}x{height}', 'too_small')
+    if width * height > max_pixels:
+        raise ImageDownloadError(f'Image too large: {width}x{height}', 'too_many_pixels')
+
+
+def _webp_size(head):
+    """Canvas size from a RIFF/WEBP header (VP8 / VP8L / VP8X), None if more bytes are needed"""
+    fourcc = head[12:16]
+    if fourcc == b'VP8 ' and len(head) >= 30:
+        if head[23:26] != b'\x9d\x01\x2a':
+            raise ImageDownloadError('Invalid VP8 frame header', 'format')
+        width, height = struct.unpack('<HH', head[26:30])
+        return width & 0x3fff, height & 0x3fff
+    if fourcc == b'VP8L' and len(head) >= 25:
+        if head[20] != 0x2f:
+            raise ImageDownloadError('Invalid VP8L signature', 'format')
+        bits = struct.unpack('<I', head[21:25])[0]
+        return (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1
+    if fourcc == b'VP8X' and len(head) >= 30:
+        width = int.from_bytes(head[24:27], 'little') + 1
+        height = int.from_bytes(head[27:30], 'little') + 1
+        return width, height
+    if len(head) >= 16 and fourcc not in (b'VP8 ', b'VP8L', b'VP8X'):
+        raise ImageDownloadError(f'Unknown WebP chunk: {fourcc!r}', 'format')
+    return None
+
+
+def _avif_size(head):
+    """Largest 'ispe' (image spatial extents) size in the AVIF meta box, None until the box is complete"""
+    meta = head.find(b'meta')
+    if meta < 4:
+        return None
+    # Meta kutusu tamamlanmadan karar verme (ispe kutuları küçük resim / alfa için de olabilir)
+    end = meta - 4 + struct.unpack('>I', head[meta - 4:meta])[0]
+    if len(head) < end:
+        return None
+    sizes = []
+    start = head.find(b'ispe', meta, end)
+    while start != -1 and start + 16 <= end:
+        sizes.append(struct.unpack('>II', head[start + 8:start + 16]))
+        start = head.find(b'ispe', start + 4, end)
+    if not sizes:
+        raise ImageDownloadError('AVIF without image size (ispe)', 'format')
+    return max(sizes, key=lambda size: size[0] * size[1])
+
+
+def _container_format(head):
+    """'WEBP' / 'AVIF' for formats PIL can only identify from the whole file"""
+    if len(head) >= 12 and head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'WEBP'
+    if len(head) >= 12 and head[4:8] == b'ftyp':
+        # Ana marka + uyumlu markalar
+        brands = head[8:12] + head[16:struct.unpack('>I', head[:4])[0]]
+        if b'avif' in brands or b'avis' in brands:
+            return 'AVIF'
+    return None
+
+
+class HeaderSniffer:
+    """
+    Feed chunks until format and size are known from the header.
+    WebP / AVIF container headers are parsed here; other formats go
+    through PIL's incremental parser.
+    """
+
+    def __init__(self):
+        self._parser = ImageFile.Parser()
+        self._head = bytearray()
+        self.container = None
+        self.format = None
+        self.size = None
+        self.fed_bytes = 0
+
+    @property
+    def done(self):
+        return self.size is not None
+
+    def feed(self, chunk):
+        if self.done:
+            return True
+        self.fed_bytes += len(chunk)
+        if self.container is None and len(self._head) < 32:
+            self._head.extend(chunk)
+            if len(self._head) < 12:
+                return False
+            self.container = _container_format(self._head) or ''
+            if not self.container:
+                chunk, self._head = bytes(self._head), None
+        elif self.container:
+            if len(self._head) > IMAGE_SNIFF_MAX_BYTES:
+                return False
+            self._head.extend(chunk)
+
+        if self.container:
+            head = self._head
+            size = _webp_size(head) if self.container == 'WEBP' else _avif_size(head)
+            if size:
+                self.format, self.size = self.container, size
+                self._head = None
+                return True
+            return False
+
+        try:
+            self._parser.feed(chunk)
+        except Exception as e:
+            raise ImageDownloadError(f'Not a readable image: {e}', 'format')
+        image = self._parser.image
+        if image is not None:
+            self.format = image.format
+            self.size = image.size
+            return True
+        return False
+
+    def finish(self, data):
+        """Last resort for a container whose header was not found while streaming: open the whole file"""
+        if self.done or not self.container:
+            return self.done
+        try:
+            with Image.open(BytesIO(data)) as image:
+                self.format, self.size = image.format, image.size
+        except Exception as e:
+            raise ImageDownloadError(f'Not a readable image: {e}', 'format')
+        return True
+
+
+def _check_response_headers(response, max_bytes):
+    content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+    if content_type and not content_type.startswith('image/') and content_type not in GENERIC_CONTENT_TYPES:
+        raise ImageDownloadError(f'Not an image (Content-Type: {content_type})', 'content_type')
+
+    content_length = response.headers.get('Content-Length')
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise ImageDownloadError(f'Image exceeds {max_bytes} bytes ({content_length})', 'too_large')
+    return content_type
+
+
+# ============= DOWNLOAD =============
+
+def fetch_image(url, timeout=30, max_bytes=None, headers=None, min_side=None, max_pixels=None):
+    """
+    Stream an image with byte cap and early header checks.
+
+    Args:
+        url: Image URL (redirected through IMAGE_FETCH_PROXY_URL if set)
+        timeout: Connect/read timeout (seconds)
+        max_bytes: Abort when body exceeds this size
+        headers: Extra request headers
+        min_side / max_pixels: Dimension limits checked from the header
+
+    Returns:
+        dict: {'data': bytes, 'format': str, 'width': int, 'height': int,
+               'content_type': str, 'size_bytes': int}
+
+    Raises:
+        ImageDownloadError: Unusable image (reason in .reason)
+        requests.RequestException: Network / HTTP errors
+    """
+    max_bytes = max_bytes or IMAGE_DOWNLOAD_MAX_BYTES
+    request_headers = dict(DEFAULT_HEADERS)
+    request_headers.update(headers or {})
+
+    response = requests.get(rewrite_image_url(url), stream=True, timeout=timeout, headers=request_headers)
+    try:
+        response.raise_for_status()
+        content_type = _check_response_headers(response, max_bytes)
+
+        sniffer = HeaderSniffer()
+        buffer = bytearray()
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            if not chunk:
+                continue
+            buffer.extend(chunk)
+            if len(buffer) > max_bytes:
+                raise ImageDownloadError(f'Image exceeds {max_bytes} bytes', 'too_large')
+
+            if not sniffer.done:
+                if sniffer.feed(chunk):
+                    check_image_header(sniffer.format, *sniffer.size, min_side=min_side, max_pixels=max_pixels)
+                elif sniffer.fed_bytes > IMAGE_SNIFF_MAX_BYTES and not sniffer.container:
+                    # WebP / AVIF: başlık bulunamazsa boyut sınırına kadar okunur, sonda çözülür
+                    raise ImageDownloadError('Image header not found in first 1MB', 'format')
+
+        if not sniffer.done and sniffer.finish(bytes(buffer)):
+            check_image_header(sniffer.format, *sniffer.size, min_side=min_side, max_pixels=max_pixels)
+        if not sniffer.done:
+            raise ImageDownloadError('Incomplete or unreadable image', 'format')
+
+        return {
+            'data': bytes(buffer),
+            'format': sniffer.format,
+            'width': sniffer.size[0],
+            'height': sniffer.size[1],
+            'content_type': content_type,
+            'size_bytes': len(buffer)
+        }
+    except ImageDownloadError as e:
+        logging.warning(f"⚠️ Resim indirme iptal ({e.reason}): {url[:120]} - {e}")
+        raise
+    finally:
+        response.close()
+
+
+def fetch_image_bytes(url, timeout=30, max_bytes=None, headers=None):
+    """fetch_image() shortcut returning only the bytes"""
+    return fetch_image(url, timeout=timeout, max_bytes=max_bytes, headers=headers)['data']
+
+
+# ============= PROBING =============
+
+def _total_size(response):
+    """Full resource size from Content-Range (206) or Content-Length (200)"""
+    content_range = response.headers.get('Content-Range', '')
+    if '/' in content_range:
+        total = content_range.rsplit('/', 1)[1]
+        if total.isdigit():
+            return int(total)
+    content_length = response.headers.get('Content-Length', '')
+    if response.status_code == 200 and content_length.isdigit():
+        return int(content_length)
+    return None
+
+
+def probe_image(url, timeout=None, probe_bytes=None, max_bytes=None):
+    """
+    Fetch only the first bytes of an image (Range request, streamed) and
+    verify reachability, format and real dimensions.
+
+    A reachable WebP / AVIF whose header does not fit in the probe bytes is
+    still ok (reason 'header_undecoded', width/height 0): callers fall back
+    to the dimensions reported by the search.
+
+    Returns:
+        dict: {'ok': bool, 'url', 'format', 'width', 'height',
+               'size_bytes', 'reason', 'error'}
+    """
+    timeout = timeout or IMAGE_PROBE_TIMEOUT_SECONDS
+    probe_bytes = probe_bytes or IMAGE_PROBE_BYTES
+    max_bytes = max_bytes or IMAGE_DOWNLOAD_MAX_BYTES
+    result = {'ok': False, 'url': url, 'format': None, 'width': 0, 'height': 0,
+              'size_bytes': None, 'reason': None, 'error': None}
+
+    headers = dict(DEFAULT_HEADERS)
+    headers['Range'] = f'bytes=0-{probe_bytes - 1}'
+    try:
+        response = requests.get(rewrite_image_url(url), stream=True, timeout=timeout, headers=headers)
+        try:
+            response.raise_for_status()
+            if response.status_code == 200:
+                # Sunucu Range desteklemiyor; gövdenin sadece başı okunacak
+                _check_response_headers(response, max_bytes)
+            result['size_bytes'] = _total_size(response)
+            if result['size_bytes'] and result['size_bytes'] > max_bytes:
+                raise ImageDownloadError(f"Image exceeds {max_bytes} bytes ({result['size_bytes']})", 'too_large')
+
+            sniffer = HeaderSniffer()
+            for chunk in response.iter_content(chunk_size=8192):
+                if chunk and sniffer.feed(chunk):
+                    break
+                if sniffer.fed_bytes >= probe_bytes:
+                    break
+
+            if not sniffer.done and sniffer.container:
+                result['format'] = sniffer.container
+                result['reason'] = 'header_undecoded'
+                result['ok'] = True
+                return result
+            if not sniffer.done:
+                raise ImageDownloadError('Image header not found in probe bytes', 'format')
+
+            result['format'] = sniffer.format
+            result['width'], result['height'] = sniffer.size
+            check_image_header(sniffer.format, *sniffer.size)
+            result['ok'] = True
+        finally:
+            response.close()
+
+    except ImageDownloadError as e:
+        result['reason'], result['error'] = e.reason, str(e)
+    except requests.exceptions.Timeout as e:
+        result['reason'], result['error'] = 'timeout', str(e)
+    except requests.RequestException as e:
+        result['reason'], result['error'] = 'unreachable', str(e)
+
+    return result
+
+
+def probe_image_candidates(urls, deadline=None):
+    """
+    Probe candidate URLs concurrently within a shared deadline.
+
+    Returns:
+        dict: {url: probe result} for probes finished before the deadline
+              (unfinished ones are reported with reason 'deadline')
+    """
+    deadline = IMAGE_PROBE_DEADLINE_SECONDS if deadline is None else deadline
+    urls = [u for u in dict.fromkeys(urls) if u]
+    futures = {_probe_executor.submit(probe_image, url): url for url in urls}
+    done, _ = wait(futures, timeout=deadline)
+
+    results = {}
+    for future, url in futures.items():
+        if future in done:
+            try:
+                results[url] = future.result()
+                continue
+            except Exception as e:
+                error = str(e)
+        else:
+            error = 'probe deadline exceeded'
+        results[url] = {'ok': False, 'url': url, 'format': None, 'width': 0, 'height': 0,
+                        'size_bytes': None, 'reason': 'deadline' if future not in done else 'error',
+                        'error': error}
+    return results
@@ -8,19 +8,94 @@ Image Processor Service - Aşama 1
 3. PNG olarak kaydeder
 
 Önemli: Resmin orijinalliği %95-100 korunur, ekstra detay EKLENMEZ!
+
+rembg session: the ONNX model (REMBG_MODEL) is loaded once per process and
+shared by all request threads (ONNX Runtime inference is thread-safe).
+rembg is imported lazily, so importing this module does not load it.
+With REMBG_PRELOAD the model is loaded in the background right after a
+gunicorn worker starts (post_fork in gunicorn_config.py) instead of on
+the first image.
 """
 
 import os
+import time
 import logging
-import requests
+import threading
 from io import BytesIO
 from PIL import Image
-from rembg import remove
+
+from services.image_fetch import fetch_image_bytes
 
 # Hedef boyut
 TARGET_SIZE = (1024, 1024)
 OUTPUT_FORMAT = 'PNG'
 
+# ============= REMBG SESSION =============
+
+REMBG_MODEL = os.environ.get('REMBG_MODEL', 'u2net')
+REMBG_PRELOAD = os.environ.get('REMBG_PRELOAD', 'false').lower() in ('1', 'true', 'yes')
+# ONNX Runtime thread havuzları (0 = ONNX Runtime varsayılanı). Her worker'da
+# `threads` kadar istek aynı anda çıkarım yapabilir: çekirdek sayısını aşmayacak şekilde ayarlayın
+ONNX_INTRA_OP_THREADS = int(os.environ.get('ONNX_INTRA_OP_THREADS', 0))
+ONNX_INTER_OP_THREADS = int(os.environ.get('ONNX_INTER_OP_THREADS', 1))
+
+_sessions = {}
+_session_lock = threading.Lock()
+
+
+def _create_session(model_name):
+    """New rembg session with the configured ONNX Runtime thread settings"""
+    import onnxruntime as ort
+    from rembg import new_session
+
+    options = ort.SessionOptions()
+    if ONNX_INTRA_OP_THREADS:
+        options.intra_op_num_threads = ONNX_INTRA_OP_THREADS
+    if ONNX_INTER_OP_THREADS:
+        options.inter_op_num_threads = ONNX_INTER_OP_THREADS
+    try:
+        from rembg.sessions import sessions_class
+    except ImportError:
+        sessions_class = []
+    for session_class in sessions_class:
+        if session_class.name() == model_name:
+            return session_class(model_name, options)
+    # Eski rembg sürümleri SessionOptions almaz (OMP_NUM_THREADS ile ayarlanır)
+    logging.warning(f"⚠️ rembg: {model_name} için ONNX thread ayarları uygulanamadı")
+    return new_session(model_name)
+
+
+def get_rembg_session(model_name=None):
+    """Per-process rembg session (created on first use, then reused)"""
+    model_name = model_name or REMBG_MODEL
+    session = _sessions.get(model_name)
+    if session is not None:
+        return session
+    with _session_lock:
+        if model_name not in _sessions:
+            started = time.monotonic()
+            _sessions[model_name] = _create_session(model_name)
+            logging.info(f"🧠 rembg modeli yüklendi: {model_name} ({time.monotonic() - started:.1f}s, "
+                         f"pid {os.getpid()})")
+        return _sessions[model_name]
+
+
+def preload_rembg_session(background=True):
+    """
+    Load the rembg model before the first image (REMBG_PRELOAD). Call
+    after fork: ONNX Runtime thread pools do not survive fork().
+    """
+    def load():
+        try:
+            get_rembg_session()
+        except Exception as e:
+            logging.error(f"❌ rembg modeli yüklenemedi: {e}")
+
+    if background:
+        threading.Thread(target=load, name='rembg-preload', daemon=True).start()
+    else:
+        load()
+
 
 def download_image(url: str, timeout: int = 30) -> bytes:
     """
@@ -39,11 +114,10 @@ def download_image(url: str, timeout: int = 30) -> bytes:
             from urllib.parse import unquote
             url = unquote(url.replace('/proxy-image?url=', ''))
         
-        response = requests.get(url, timeout=timeout, headers={
+        # Akışlı, boyut sınırlı indirme (bkz. services/image_fetch.py)
+        return fetch_image_bytes(url, timeout=timeout, headers={
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         })
-        response.raise_for_status()
-        return response.content
         
     except Exception as e:
         logging.error(f"Resim indirme hatası: {url} - {e}")
@@ -61,8 +135,10 @@ def remove_background(image_data: bytes) -> Image.Image:
         PIL.Image: Arka planı kaldırılmış resim (RGBA)
     """
     try:
-        # rembg ile arka plan kaldır
-        output_data = remove(image_data)
+        from rembg import remove
+        
+        # rembg ile arka plan kaldır (süreç başına tek model oturumu)
+        output_data = remove(image_data, session=get_rembg_session())
         img = Image.open(BytesIO(output_data))
         
         # RGBA moduna çevir (şeffaflık için)
@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+"""
+Image Similarity Service - Algısal hash ile benzer / kopya resim tespiti
+
+Every depot image gets two 64-bit perceptual hashes (depot_images.phash /
+dhash, 16-char hex), computed with vectorized NumPy:
+    dHash  9x8 grayscale, sign of horizontal gradients
+    pHash  32x32 grayscale -> 2D DCT -> 8x8 low frequencies vs. their median
+Transparent product photos are flattened onto white first, so a cut-out and
+the same cut-out on a white background hash alike.
+
+Hashes depend only on the content, so they are computed once per content
+hash at ingest (save_to_customer_depot / save_to_admin_depot) and copied to
+other files with the same bytes by depot_index.index_image. Older images
+are hashed in batches by backfill_hashes (depot GC 'hashes' phase / CLI).
+
+Lookup (multi-index hashing): the pHash is split into 8 bands of 8 bits,
+stored in image_hash_bands. Two hashes within hamming distance <= 7 share at
+least one band exactly, so candidates come from 8 indexed lookups and are
+verified with a popcount - no full scan, shared by all workers via SQLite.
+
+CLI:
+    python -m services.image_similarity backfill [--limit 1000]
+    python -m services.image_similarity similar <image path or /static/uploads URL> [--depot admin]
+"""
+
+import os
+import json
+import logging
+import argparse
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+import database
+from services.blob_store import local_image_path
+from services.depot_index import NOT_TOMBSTONED, to_rel_path, to_fs_path, image_url_for
+
+# ============= CONFIGURATION =============
+
+HASH_BANDS = 8
+BAND_BITS = 64 // HASH_BANDS
+# Bant eşleşmesi bu mesafeye kadar eksiksiz sonuç garanti eder
+MAX_SIMILAR_DISTANCE = HASH_BANDS - 1
+SIMILAR_DISTANCE = int(os.environ.get('IMAGE_SIMILAR_DISTANCE', 6))
+# Yükleme yanıtında önerilecek admin deposu eşleşmeleri için eşik
+SIMILAR_AUTO_LINK_DISTANCE = int(os.environ.get('IMAGE_SIMILAR_AUTO_LINK_DISTANCE', 4))
+HASH_BACKFILL_BATCH = int(os.environ.get('IMAGE_HASH_BACKFILL_BATCH', 64))
+
+# Çözülemeyen resimler: tekrar denenmesin
+UNHASHABLE = ''
+
+PHASH_SIZE = 32
+PHASH_LOW = 8
+
+
+def _dct_matrix(n):
+    """Orthonormal DCT-II matrix: coefficients = D @ x"""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+_DCT = _dct_matrix(PHASH_SIZE)
+_BIT_WEIGHTS = (1 << np.arange(63, -1, -1, dtype=np.uint64)).astype(np.uint64)
+
+
+# ============= HASHING =============
+
+def _load_gray(source):
+    """Decode bytes / path into an 'L' image, transparency flattened onto white"""
+    with Image.open(BytesIO(source) if isinstance(source, (bytes, bytearray)) else source) as img:
+        img.draft('RGB', (PHASH_SIZE * 2, PHASH_SIZE * 2))
+        if img.mode in ('RGBA', 'LA', 'P', 'PA'):
+            rgba = img.convert('RGBA')
+            flat = Image.new('RGB', rgba.size, (255, 255, 255))
+            flat.paste(rgba, mask=rgba.split()[-1])
+            img = flat
+        return img.convert('L')
+
+
+def _pack(bits):
+    """(n, 64) bool array -> list of 16-char hex strings"""
+    values = (bits.astype(np.uint64) * _BIT_WEIGHTS).sum(axis=1, dtype=np.uint64)
+    return [f'{int(v):016x}' for v in values]
+
+
+def hash_arrays(dhash_pixels, phash_pixels):
+    """
+    Vectorized hashes of a batch of preprocessed images.
+
+    Args:
+        dhash_pixels: (n, 8, 9) grayscale array
+        phash_pixels: (n, 32, 32) grayscale array
+
+    Returns:
+        tuple: (dhash hex list, phash hex list)
+    """
+    d = np.asarray(dhash_pixels, dtype=np.float32)
+    dbits = (d[:, :, 1:] > d[:, :, :-1]).reshape(len(d), -1)
+
+    p = np.asarray(phash_pixels, dtype=np.float64)
+    coeffs = (_DCT @ p @ _DCT.T)[:, :PHASH_LOW, :PHASH_LOW].reshape(len(p), -1)
+    # DC bileşeni medyana katılmaz (genel parlaklık)
+    median = np.median(coeffs[:, 1:], axis=1, keepdims=True)
+    pbits = coeffs > median
+
+    return _pack(dbits), _pack(pbits)
+
+
+def _preprocess(source):
+    gray = _load_gray(source)
+    dpix = np.asarray(gray.resize((9, 8), Image.Resampling.LANCZOS))
+    ppix = np.asarray(gray.resize((PHASH_SIZE, PHASH_SIZE), Image.Resampling.LANCZOS))
+    return dpix, ppix
+
+
+def compute_hashes(source):
+    """
+    Perceptual hashes of one image.
+
+    Args:
+        source: Image bytes or file path
+
+    Returns:
+        dict: {'dhash': hex, 'phash': hex}
+    """
+    dpix, ppix = _preprocess(source)
+    dhashes, phashes = hash_arrays(dpix[None], ppix[None])
+    return {'dhash': dhashes[0], 'phash': phashes[0]}
+
+
+def hamming(a, b):
+    """Bit distance of two hex hashes"""
+    return (int(a, 16) ^ int(b, 16)).bit_count()
+
+
+def _bands(phash):
+    value = int(phash, 16)
+    return [(band, (value >> (64 - BAND_BITS * (band + 1))) & ((1 << BAND_BITS) - 1))
+            for band in range(HASH_BANDS)]
+
+
+# ============= STORAGE =============
+
+def store_hashes(conn, content_hash, hashes):
+    """Write hashes to every index row of a content hash and its pHash bands"""
+    phash = hashes['phash'] if hashes else UNHASHABLE
+    dhash = hashes['dhash'] if hashes else UNHASHABLE
+    conn.execute("UPDATE depot_images SET phash = ?, dhash = ? WHERE content_hash = ?",
+                 (phash, dhash, content_hash))
+    if phash:
+        conn.executemany("INSERT OR IGNORE INTO image_hash_bands (band, value, content_hash) VALUES (?, ?, ?)",
+                         [(band, value, content_hash) for band, value in _bands(phash)])
+
+
+def index_hashes(conn, content_hash, source):
+    """
+    Hash an ingested image unless its content was hashed before (called in
+    the ingest transaction, after depot_index.index_image).
+
+    Returns:
+        dict: {'dhash', 'phash'} or None if the image cannot be decoded
+    """
+    row = conn.execute("SELECT phash, dhash FROM depot_images WHERE content_hash = ? AND phash IS NOT NULL LIMIT 1",
+                       (content_hash,)).fetchone()
+    if row:
+        return {'phash': row['phash'], 'dhash': row['dhash']} if row['phash'] else None
+    try:
+        hashes = compute_hashes(source)
+    except Exception as e:
+        logging.warning(f"⚠️ Perceptual hash error ({content_hash[:12]}): {e}")
+        hashes = None
+    store_hashes(conn, content_hash, hashes)
+    return hashes
+
+
+def backfill_hashes(limit=None):
+    """
+    Hash index rows that have no perceptual hash yet (one decode per content
+    hash, one vectorized hashing pass per batch).
+
+    Returns:
+        dict: {'success', 'hashed', 'failed'}
+    """
+    limit = limit or HASH_BACKFILL_BATCH
+    stats = {'hashed': 0, 'failed': 0}
+    try:
+        with database.get_db() as conn:
+            rows = conn.execute('''SELECT content_hash, MIN(rel_path) AS rel_path FROM depot_images
+                                   WHERE phash IS NULL AND content_hash IS NOT NULL
+                                   GROUP BY content_hash LIMIT ?''', (limit,)).fetchall()
+        if not rows:
+            return {'success': True, **stats}
+
+        done, dpixels, ppixels, failed = [], [], [], []
+        for row in rows:
+            image = {'rel_path': row['rel_path'], 'image_path': to_fs_path(row['rel_path']),
+                     'content_hash': row['content_hash']}
+            try:
+                dpix, ppix = _preprocess(local_image_path(image))
+                dpixels.append(dpix)
+                ppixels.append(ppix)
+                done.append(row['content_hash'])
+            except Exception as e:
+                logging.warning(f"⚠️ Perceptual hash error ({row['rel_path']}): {e}")
+                failed.append(row['content_hash'])
+
+        dhashes, phashes = hash_arrays(np.stack(dpixels), np.stack(ppixels)) if done else ([], [])
+        with database.get_db() as conn:
+            for content_hash, dhash, phash in zip(done, dhashes, phashes):
+                store_hashes(conn, content_hash, {'dhash': dhash, 'phash': phash})
+            for content_hash in failed:
+                store_hashes(conn, content_hash, None)
+            conn.commit()
+
+        stats['hashed'], stats['failed'] = len(done), len(failed)
+        logging.info(f"🔎 Perceptual hash backfill: {stats}")
+        return {'success': True, **stats}
+
+    except Exception as e:
+        logging.error(f"❌ Perceptual hash backfill error: {e}")
+        return {'success': False, 'error': str(e), **stats}
+
+
+# ============= LOOKUP =============
+
+def find_similar(phash, dhash=None, max_distance=None, depot_type=None, sector=None,
+                 exclude_path=None, limit=20):
+    """
+    Depot images whose pHash is within `max_distance` bits of `phash`.
+
+    Args:
+        dhash: Optional; reported per match as a tie-breaker
+        max_distance: Capped at MAX_SIMILAR_DISTANCE (band lookup guarantee)
+        exclude_path: Depot file to leave out (the query image itself); byte-identical
+                      copies elsewhere are still returned (distance 0)
+
+    Returns:
+        list: Matches sorted by distance: barcode, depot_type, user_id, sector,
+              product_group, image_url, content_hash, distance, dhash_distance
+    """
+    max_distance = min(SIMILAR_DISTANCE if max_distance is None else max_distance, MAX_SIMILAR_DISTANCE)
+    bands = _bands(phash)
+
+    with database.get_db() as conn:
+        candidates = [row['content_hash'] for row in conn.execute(
+            "SELECT DISTINCT content_hash FROM image_hash_bands WHERE "
+            + " OR ".join(["(band = ? AND value = ?)"] * len(bands)),
+            [v for pair in bands for v in pair])]
+
+        conditions, params = [NOT_TOMBSTONED], []
+        for column, value in (('depot_type', depot_type), ('sector', sector)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        rows = []
+        for start in range(0, len(candidates), 500):
+            chunk = candidates[start:start + 500]
+            where = " AND ".join([f"content_hash IN ({','.join('?' * len(chunk))})"] + conditions)
+            rows.extend(conn.execute(f'''SELECT barcode, depot_type, user_id, sector, product_group, rel_path,
+                                                content_hash, phash, dhash
+                                         FROM depot_images WHERE {where}''', chunk + params).fetchall())
+
+    matches = []
+    for row in rows:
+        if not row['phash'] or row['rel_path'] == exclude_path:
+            continue
+        distance = hamming(phash, row['phash'])
+        if distance > max_distance:
+            continue
+        matches.append({
+            'barcode': row['barcode'],
+            'depot_type': row['depot_type'],
+            'user_id': row['user_id'],
+            'sector': row['sector'],
+            'product_group': row['product_group'],
+            'image_url': image_url_for(row['rel_path'], row['content_hash']),
+            'content_hash': row['content_hash'],
+            'distance': distance,
+            'dhash_distance': hamming(dhash, row['dhash']) if dhash and row['dhash'] else None
+        })
+    matches.sort(key=lambda m: (m['distance'], m['dhash_distance'] or 0, m['barcode']))
+    return matches[:limit]
+
+
+def find_similar_to_path(path, **kwargs):
+    """
+    find_similar for an indexed depot image (filesystem path or
+    /static/uploads URL); the image itself is excluded.
+
+    Returns:
+        list or None if the path is not indexed / not hashable
+    """
+    with database.get_db() as conn:
+        row = conn.execute("SELECT rel_path, content_hash, phash, dhash FROM depot_images WHERE rel_path = ?",
+                           (to_rel_path(path),)).fetchone()
+        if not row:
+            return None
+        hashes = {'phash': row['phash'], 'dhash': row['dhash']} if row['phash'] is not None else None
+        if hashes is None:
+            image = {'rel_path': row['rel_path'], 'image_path': to_fs_path(row['rel_path']),
+                     'content_hash': row['content_hash']}
+            hashes = index_hashes(conn, row['content_hash'], local_image_path(image))
+            conn.commit()
+    if not hashes or not hashes['phash']:
+        return None
+    kwargs.setdefault('exclude_path', row['rel_path'])
+    return find_similar(hashes['phash'], hashes['dhash'], **kwargs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Perceptual hash index for near-duplicate depot images')
+    sub = parser.add_subparsers(dest='command', required=True)
+    backfill_parser = sub.add_parser('backfill')
+    backfill_parser.add_argument('--limit', type=int, default=None, help='stop after N images')
+    similar_parser = sub.add_parser('similar')
+    similar_parser.add_argument('path')
+    similar_parser.add_argument('--depot', choices=['admin', 'customer', 'pending'])
+    similar_parser.add_argument('--max-distance', type=int, default=SIMILAR_DISTANCE)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    database.init_db()
+    if args.command == 'similar':
+        matches = find_similar_to_path(args.path, depot_type=args.depot, max_distance=args.max_distance)
+        print(json.dumps(matches, ensure_ascii=False, indent=2))
+        return 0 if matches is not None else 1
+
+    total = {'hashed': 0, 'failed': 0}
+    while args.limit is None or total['hashed'] + total['failed'] < args.limit:
+        batch = HASH_BACKFILL_BATCH if args.limit is None else min(HASH_BACKFILL_BATCH,
+                                                                    args.limit - total['hashed'] - total['failed'])
+        result = backfill_hashes(batch)
+        if not result['success']:
+            print(json.dumps(result, ensure_ascii=False))
+            return 1
+        total['hashed'] += result['hashed']
+        total['failed'] += result['failed']
+        if result['hashed'] + result['failed'] < batch:
+            break
+    print(json.dumps({'success': True, **total}, ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
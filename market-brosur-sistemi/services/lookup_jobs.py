@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+Lookup Jobs Service - Arka plan toplu barkod sorgulama
+
+Features:
+- Submit returns a job ID, lookups run in background workers
+- Each barcode result is persisted as soon as it is ready (lookup_job_items)
+- Polling / SSE clients read incremental results by sequence number
+- Cancellation and resume (also across gunicorn workers, state lives in SQLite)
+"""
+
+import os
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+from services.external_api import full_barcode_lookup
+
+# ============= CONFIGURATION =============
+
+LOOKUP_JOB_WORKERS = int(os.environ.get('LOOKUP_JOB_WORKERS', 2))
+LOOKUP_JOB_MAX_BARCODES = int(os.environ.get('LOOKUP_JOB_MAX_BARCODES', 5000))
+LOOKUP_JOB_DELAY_SECONDS = float(os.environ.get('LOOKUP_JOB_DELAY_SECONDS', 0.5))
+# Bu süre boyunca ilerleme kaydetmeyen "running" iş, ölmüş kabul edilir (resume edilebilir)
+LOOKUP_JOB_STALE_SECONDS = int(os.environ.get('LOOKUP_JOB_STALE_SECONDS', 120))
+
+TERMINAL_STATUSES = ('completed', 'cancelled', 'failed')
+
+_job_executor = ThreadPoolExecutor(max_workers=LOOKUP_JOB_WORKERS, thread_name_prefix='lookup-job')
+_active_jobs = set()
+_active_jobs_lock = threading.Lock()
+
+
+# ============= HELPERS =============
+
+def _clean_barcodes(barcodes):
+    """Strip, drop empties and duplicates (order preserved)"""
+    seen = set()
+    cleaned = []
+    for barcode in barcodes or []:
+        barcode = str(barcode).strip()
+        if barcode and barcode not in seen:
+            seen.add(barcode)
+            cleaned.append(barcode)
+    return cleaned
+
+
+def _summarize_result(barcode, result):
+    """Compact per-barcode result (same shape as /api/barkod-sorgula product)"""
+    summary = {
+        'found': result.get('found', False),
+        'source': result.get('source')
+    }
+    if result.get('found'):
+        product = result.get('product') or {}
+        image = result.get('image') or {}
+        summary['product'] = {
+            'barcode': barcode,
+            'name': product.get('name', ''),
+            'product_group': product.get('category', ''),
+            'brand': product.get('brand', ''),
+            'image_url': image.get('url', ''),
+            'quality_indicator': image.get('quality_indicator', '⚪'),
+            'market_price': result.get('market_price', 0),
+            'market_price_tax': result.get('market_price_tax', 0)
+        }
+    return summary
+
+
+def _is_stale(job):
+    """True if a queued/running job has not made progress recently"""
+    from datetime import datetime
+    try:
+        updated_at = datetime.fromisoformat(job['updated_at'])
+    except (TypeError, ValueError):
+        return True
+    return (datetime.now() - updated_at).total_seconds() > LOOKUP_JOB_STALE_SECONDS
+
+
+# ============= WORKER =============
+
+def _run_job(job_id):
+    """Process pending items of a job until done or cancelled"""
+    try:
+        job = database.get_lookup_job(job_id)
+        if not job or job['status'] in TERMINAL_STATUSES:
+            return
+
+        if not database.update_lookup_job_status(job_id, 'running', expected_status=('queued', 'running')):
+            return
+
+        pending = database.get_pending_lookup_job_items(job_id)
+        logging.info(f"📦 Lookup job {job_id}: {len(pending)} barkod işlenecek")
+
+        for idx, (seq, barcode) in enumerate(pending):
+            # İptal kontrolü - başka bir worker süreci de iptal etmiş olabilir
+            current = database.get_lookup_job(job_id)
+            if current and current['status'] == 'queued':
+                # Bu süreçte çalışırken resume edildi - devam et
+                database.update_lookup_job_status(job_id, 'running', expected_status='queued')
+            elif not current or current['status'] != 'running':
+                logging.info(f"⏹️ Lookup job {job_id} durduruldu ({current['status'] if current else 'silindi'})")
+                return
+
+            if idx > 0 and LOOKUP_JOB_DELAY_SECONDS > 0:
+                time.sleep(LOOKUP_JOB_DELAY_SECONDS)
+
+            try:
+                result = full_barcode_lookup(
+                    barcode=barcode,
+                    user_id=job['user_id'],
+                    sector=job['sector'],
+                    auto_download=bool(job['auto_download'])
+                )
+                summary = _summarize_result(barcode, result)
+                database.save_lookup_job_item(job_id, seq, 'done', summary, found=summary['found'])
+            except Exception as e:
+                logging.error(f"Lookup job {job_id} barcode {barcode} error: {e}")
+                database.save_lookup_job_item(job_id, seq, 'error', {'found': False, 'error': str(e)})
+
+        database.update_lookup_job_status(job_id, 'completed', expected_status='running')
+        logging.info(f"✅ Lookup job {job_id} tamamlandı")
+
+    except Exception as e:
+        logging.error(f"❌ Lookup job {job_id} failed: {e}")
+        database.update_lookup_job_status(job_id, 'failed', error=str(e))
+    finally:
+        with _active_jobs_lock:
+            _active_jobs.discard(job_id)
+
+
+def _schedule(job_id):
+    """Submit job to the worker pool once per process"""
+    with _active_jobs_lock:
+        if job_id in _active_jobs:
+            return False
+        _active_jobs.add(job_id)
+    _job_executor.submit(_run_job, job_id)
+    return True
+
+
+# ============= PUBLIC API =============
+
+def submit_lookup_job(barcodes, user_id, sector='supermarket', auto_download=True):
+    """
+    Create a background lookup job.
+
+    Args:
+        barcodes: List of barcodes
+        user_id: Owner user ID
+        sector: Sector for depot lookups
+        auto_download: Download images for found products
+
+    Returns:
+        dict: {'success': bool, 'job': {...}} or error
+    """
+    cleaned = _clean_barcodes(barcodes)
+    if not cleaned:
+        return {'success': False, 'error': 'Barcodes required'}
+    if len(cleaned) > LOOKUP_JOB_MAX_BARCODES:
+        return {'success': False, 'error': f'En fazla {LOOKUP_JOB_MAX_BARCODES} barkod gönderilebilir'}
+
+    job_id = uuid.uuid4().hex
+    job = database.create_lookup_job(job_id, user_id, cleaned, sector=sector, auto_download=auto_download)
+    _schedule(job_id)
+    logging.info(f"📦 Lookup job oluşturuldu: {job_id} ({len(cleaned)} barkod)")
+    return {'success': True, 'job': job}
+
+
+def get_lookup_job_progress(job_id, since=0, limit=None):
+    """
+    Job status plus finished items after `since` (sequence number).
+
+    Returns:
+        dict or None if job does not exist
+    """
+    job = database.get_lookup_job(job_id)
+    if not job:
+        return None
+
+    items = database.get_lookup_job_items(job_id, since_seq=since, limit=limit)
+    return {
+        'job': job,
+        'items': items,
+        'next_since': items[-1]['seq'] if items else since,
+        'done': job['status'] in TERMINAL_STATUSES
+    }
+
+
+def cancel_lookup_job(job_id):
+    """Cancel a queued/running job (worker stops before the next barcode)"""
+    return database.update_lookup_job_status(job_id, 'cancelled', expected_status=('queued', 'running'))
+
+
+def resume_lookup_job(job_id):
+    """
+    Resume a cancelled, failed or interrupted job. Already finished
+    items are kept, only pending barcodes are looked up.
+
+    Returns:
+        dict: {'success': bool, ...}
+    """
+    job = database.get_lookup_job(job_id)
+    if not job:
+        return {'success': False, 'error': 'Job not found'}
+
+    if job['status'] == 'completed':
+        return {'success': False, 'error': 'Job already completed'}
+
+    if job['status'] in ('queued', 'running') and not _is_stale(job):
+        return {'success': False, 'error': 'Job is still running'}
+
+    database.update_lookup_job_status(job_id, 'queued')
+    _schedule(job_id)
+    return {'success': True, 'job': database.get_lookup_job(job_id)}
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+"""
+Lookup Metrics Service - Sorgu katmanları için sayaç ve gecikme histogramları
+
+Features:
+- Per-tier counters (hit / miss / error / timeout) and latency histograms
+  (customer depot, admin depot, L1/L2 cache, CAMGOZ, Google, downloads)
+- Per-provider call outcomes (ok / error / timeout / rate_limited)
+- Remaining quota per provider (local rate limiter, upstream headers, daily budget)
+- JSON snapshot for the admin API and Prometheus text exposition
+
+NOT: Sayaçlar süreç bazlıdır (her gunicorn worker kendi değerlerini tutar);
+Prometheus serilerinde pid etiketi bulunur. Kalan kota kaynağı scope ile
+belirtilir: upstream (sağlayıcı başlıkları), process (bu worker'ın limiti),
+shared (tüm worker'ların ortak sayacı).
+"""
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+from datetime import date
+
+# ============= CONFIGURATION =============
+
+# Saniye cinsinden histogram sınırları
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+TIER_OUTCOMES = ('hit', 'miss', 'error', 'timeout')
+PROVIDER_OUTCOMES = ('ok', 'error', 'timeout', 'rate_limited')
+
+_lock = threading.Lock()
+_tiers = {}
+_providers = {}
+_started_at = time.time()
+
+
+def _new_tier():
+    return {
+        'outcomes': dict.fromkeys(TIER_OUTCOMES, 0),
+        'buckets': [0] * (len(LATENCY_BUCKETS) + 1),
+        'sum': 0.0,
+        'count': 0
+    }
+
+
+def _new_provider():
+    return {
+        'outcomes': dict.fromkeys(PROVIDER_OUTCOMES, 0),
+        'quota_remaining': None,
+        'quota_limit': None,
+        'daily_calls': 0,
+        'daily_date': date.today().isoformat()
+    }
+
+
+# ============= RECORDING =============
+
+def record_tier(tier, outcome, seconds):
+    """
+    Record one lookup attempt on a tier.
+
+    Args:
+        tier: Tier name (customer_depot, admin_depot, cache_l1, cache_l2, camgoz, google, ...)
+        outcome: hit, miss, error or timeout
+        seconds: Elapsed time
+    """
+    with _lock:
+        stats = _tiers.get(tier)
+        if stats is None:
+            stats = _tiers[tier] = _new_tier()
+        stats['outcomes'][outcome] = stats['outcomes'].get(outcome, 0) + 1
+        stats['sum'] += seconds
+        stats['count'] += 1
+        for idx, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                stats['buckets'][idx] += 1
+                break
+        else:
+            stats['buckets'][-1] += 1
+
+
+@contextmanager
+def track_tier(tier):
+    """
+    Time a block and record it on `tier`. The block sets the outcome:
+
+        with track_tier('camgoz') as t:
+            ...
+            t['outcome'] = 'hit'
+
+    Unhandled exceptions are recorded as 'error'. Default outcome is 'miss'.
+    """
+    state = {'outcome': 'miss'}
+    started = time.perf_counter()
+    try:
+        yield state
+    except Exception:
+        state['outcome'] = 'error'
+        raise
+    finally:
+        record_tier(tier, state['outcome'], time.perf_counter() - started)
+
+
+def record_provider_call(provider, outcome, quota_remaining=None, quota_limit=None):
+    """
+    Record an upstream provider call.
+
+    Args:
+        provider: camgoz, google, ...
+        outcome: ok, error, timeout or rate_limited
+        quota_remaining: Remaining quota reported by upstream (optional)
+        quota_limit: Quota limit reported by upstream (optional)
+    """
+    today = date.today().isoformat()
+    with _lock:
+        stats = _providers.get(provider)
+        if stats is None:
+            stats = _providers[provider] = _new_provider()
+        if stats['daily_date'] != today:
+            stats['daily_date'] = today
+            stats['daily_calls'] = 0
+        stats['outcomes'][outcome] = stats['outcomes'].get(outcome, 0) + 1
+        stats['daily_calls'] += 1
+        if quota_remaining is not None:
+            stats['quota_remaining'] = quota_remaining
+        if quota_limit is not None:
+            stats['quota_limit'] = quota_limit
+
+
+def quota_from_headers(headers):
+    """Parse X-RateLimit-Remaining / X-RateLimit-Limit style headers"""
+    def _int(name):
+        value = headers.get(name) if headers else None
+        try:
+            return int(value) if value is not None else None
+        except (TypeError, ValueError):
+            return None
+    return _int('X-RateLimit-Remaining'), _int('X-RateLimit-Limit')
+
+
+# ============= SNAPSHOT =============
+
+def _percentile(buckets, count, fraction):
+    """Upper bucket bound containing the given fraction of samples"""
+    if not count:
+        return None
+    target = count * fraction
+    running = 0
+    for idx, bucket_count in enumerate(buckets):
+        running += bucket_count
+        if running >= target:
+            return LATENCY_BUCKETS[idx] if idx < len(LATENCY_BUCKETS) else float('inf')
+    return float('inf')
+
+
+def get_lookup_metrics(quota_sources=None):
+    """
+    Snapshot of all tier and provider metrics.
+
+    Args:
+        quota_sources: Optional {provider: callable} returning
+                       {'remaining': int, 'limit': int, 'scope': 'process' | 'shared'}
+                       for local budgets
+
+    Returns:
+        dict: {'tiers': {...}, 'providers': {...}, 'pid': ..., 'uptime_seconds': ...}
+    """
+    with _lock:
+        tiers = {}
+        for name, stats in _tiers.items():
+            outcomes = dict(stats['outcomes'])
+            answered = outcomes['hit'] + outcomes['miss']
+            tiers[name] = {
+                'count': stats['count'],
+                **outcomes,
+                'hit_ratio': round(outcomes['hit'] / answered, 4) if answered else None,
+                'avg_ms': round(stats['sum'] / stats['count'] * 1000, 2) if stats['count'] else None,
+                'p50_ms': _ms(_percentile(stats['buckets'], stats['count'], 0.5)),
+                'p95_ms': _ms(_percentile(stats['buckets'], stats['count'], 0.95)),
+                'sum_seconds': stats['sum'],
+                'histogram': _histogram(stats['buckets'])
+            }
+
+        providers = {}
+        for name, stats in _providers.items():
+            outcomes = dict(stats['outcomes'])
+            total = sum(outcomes.values())
+            providers[name] = {
+                'calls': total,
+                **outcomes,
+                'error_rate': round(outcomes['error'] / total, 4) if total else None,
+                'timeout_rate': round(outcomes['timeout'] / total, 4) if total else None,
+                'rate_limited_rate': round(outcomes['rate_limited'] / total, 4) if total else None,
+                'calls_today': stats['daily_calls'],
+                'quota_remaining': stats['quota_remaining'],
+                'quota_limit': stats['quota_limit']
+            }
+
+    for name, source in (quota_sources or {}).items():
+        try:
+            quota = source()
+        except Exception:
+            continue
+        entry = providers.setdefault(name, {'calls': 0})
+        entry['local_quota_remaining'] = quota.get('remaining')
+        entry['local_quota_limit'] = quota.get('limit')
+        entry['local_quota_scope'] = quota.get('scope', 'process')
+
+    return {
+        'pid': os.getpid(),
+        'uptime_seconds': round(time.time() - _started_at, 1),
+        'tiers': tiers,
+        'providers': providers
+    }
+
+
+def _ms(seconds):
+    if seconds is None:
+        return None
+    return None if seconds == float('inf') else round(seconds * 1000, 1)
+
+
+def _histogram(buckets):
+    labels = [str(b) for b in LATENCY_BUCKETS] + ['+Inf']
+    return dict(zip(labels, buckets))
+
+
+def reset_lookup_metrics():
+    """Clear all counters"""
+    global _started_at
+    with _lock:
+        _tiers.clear()
+        _providers.clear()
+        _started_at = time.time()
+
+
+# ============= PROMETHEUS =============
+
+def render_prometheus(snapshot):
+    """
+    Render a get_lookup_metrics() snapshot in Prometheus text format.
+    Every series carries the worker pid: counters are per process.
+    """
+    pid = snapshot['pid']
+    lines = [
+        '# HELP brosur_lookup_tier_total Lookup attempts per tier and outcome (per worker process)',
+        '# TYPE brosur_lookup_tier_total counter'
+    ]
+    for tier, stats in snapshot['tiers'].items():
+        for outcome in TIER_OUTCOMES:
+            lines.append(f'brosur_lookup_tier_total{{pid="{pid}",tier="{tier}",outcome="{outcome}"}} {stats[outcome]}')
+
+    lines += [
+        '# HELP brosur_lookup_tier_seconds Lookup latency per tier (per worker process)',
+        '# TYPE brosur_lookup_tier_seconds histogram'
+    ]
+    for tier, stats in snapshot['tiers'].items():
+        cumulative = 0
+        for le, bucket_count in stats['histogram'].items():
+            cumulative += bucket_count
+            lines.append(f'brosur_lookup_tier_seconds_bucket{{pid="{pid}",tier="{tier}",le="{le}"}} {cumulative}')
+        lines.append(f'brosur_lookup_tier_seconds_sum{{pid="{pid}",tier="{tier}"}} {stats["sum_seconds"]:.6f}')
+        lines.append(f'brosur_lookup_tier_seconds_count{{pid="{pid}",tier="{tier}"}} {stats["count"]}')
+
+    lines += [
+        '# HELP brosur_provider_calls_total Upstream provider calls per outcome (per worker process)',
+        '# TYPE brosur_provider_calls_total counter'
+    ]
+    for provider, stats in snapshot['providers'].items():
+        for outcome in PROVIDER_OUTCOMES:
+            if outcome in stats:
+                lines.append(f'brosur_provider_calls_total{{pid="{pid}",provider="{provider}",outcome="{outcome}"}} '
+                             f'{stats[outcome]}')
+
+    lines += [
+        '# HELP brosur_provider_quota_remaining Remaining provider quota '
+        '(scope: upstream = provider headers, process = this worker\'s limiter, shared = all workers)',
+        '# TYPE brosur_provider_quota_remaining gauge'
+    ]
+    for provider, stats in snapshot['providers'].items():
+        for key, scope in (('quota_remaining', 'upstream'),
+                           ('local_quota_remaining', stats.get('local_quota_scope', 'process'))):
+            if stats.get(key) is not None:
+                lines.append(f'brosur_provider_quota_remaining{{pid="{pid}",provider="{provider}",scope="{scope}"}} '
+                             f'{stats[key]}')
+
+    return '\n'.join(lines) + '\n'
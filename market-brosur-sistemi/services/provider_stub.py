@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+"""
+Provider Stub Server - CAMGOZ, Google CSE ve resim sunucuları için kayıt/oynatma
+
+Ücretli kota harcamadan ve değişken gecikmeden bağımsız performans
+testi için yerel HTTP sunucusu.
+
+Modes:
+- record: İstekleri gerçek sağlayıcıya iletir, cevabı diske kaydeder
+- replay: Kayıtlı cevapları sunar; gecikme dağılımı, hata / 429
+          enjeksiyonu ve saniye başı istek limiti uygulanır
+
+Routes:
+- /camgoz/<path>       → CAMGOZ_UPSTREAM_URL/<path>   (ör. /camgoz/search?query=...)
+- /customsearch/v1     → Google Custom Search
+- /image?url=<url>     → resim baytları (Range desteği ile)
+- /_stub/stats         → sayaçlar
+
+Uygulamayı stub'a yönlendirme:
+    CAMGOZ_API_URL=http://127.0.0.1:8099/camgoz
+    GOOGLE_SEARCH_URL=http://127.0.0.1:8099/customsearch/v1
+    IMAGE_FETCH_PROXY_URL=http://127.0.0.1:8099/image
+
+CLI:
+    python -m services.provider_stub record --data-dir stub_data
+    python -m services.provider_stub replay --data-dir stub_data \\
+        --latency-dist lognormal --latency-ms 120 --jitter-ms 60 \\
+        --error-rate 0.02 --rate-429 0.01 --max-rps 20
+"""
+
+import os
+import json
+import time
+import random
+import hashlib
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+import requests
+
+# ============= CONFIGURATION =============
+
+CAMGOZ_UPSTREAM_URL = os.environ.get('CAMGOZ_UPSTREAM_URL', 'https://nhghk.jojapi.net/api/external')
+GOOGLE_UPSTREAM_URL = os.environ.get('GOOGLE_UPSTREAM_URL', 'https://www.googleapis.com/customsearch/v1')
+
+# Anahtara dahil edilmeyen (gizli / değişken) parametreler
+IGNORED_PARAMS = {'key'}
+# Kayıtta saklanan cevap başlıkları
+KEPT_HEADERS = ('Content-Type', 'X-RateLimit-Remaining', 'X-RateLimit-Limit', 'Retry-After')
+# Kayıt yokken dönen "bulunamadı" cevapları
+MISS_RESPONSES = {
+    'camgoz': (200, 'application/json', b'{"content": []}'),
+    'google': (200, 'application/json', b'{"items": []}'),
+    'image': (404, 'text/plain', b'not recorded'),
+}
+
+
+# ============= STORAGE =============
+
+def _route_for(path):
+    """Map request path to (route name, upstream-relative path)"""
+    if path.startswith('/camgoz'):
+        return 'camgoz', path[len('/camgoz'):] or '/'
+    if path.startswith('/customsearch/v1'):
+        return 'google', ''
+    if path.startswith('/image'):
+        return 'image', ''
+    return None, None
+
+
+def _recording_key(route, sub_path, params):
+    """Stable key: route + path + sorted params (secrets excluded)"""
+    canonical = urlencode(sorted((k, v) for k, v in params if k not in IGNORED_PARAMS))
+    return hashlib.sha256(f"{route}|{sub_path}|{canonical}".encode('utf-8')).hexdigest()[:32]
+
+
+class RecordingStore:
+    """Recorded responses on disk: {data_dir}/{route}/{key}.json + .body"""
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+
+    def _paths(self, route, key):
+        base = os.path.join(self.data_dir, route, key)
+        return base + '.json', base + '.body'
+
+    def load(self, route, key):
+        meta_path, body_path = self._paths(route, key)
+        if not os.path.exists(meta_path) or not os.path.exists(body_path):
+            return None
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        with open(body_path, 'rb') as f:
+            meta['body'] = f.read()
+        return meta
+
+    def save(self, route, key, status, headers, body, request_info, latency_ms):
+        os.makedirs(os.path.join(self.data_dir, route), exist_ok=True)
+        meta_path, body_path = self._paths(route, key)
+        with open(body_path, 'wb') as f:
+            f.write(body)
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'status': status,
+                'headers': {h: headers[h] for h in KEPT_HEADERS if h in headers},
+                'request': request_info,
+                'latency_ms': round(latency_ms, 1),
+                'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+            }, f, ensure_ascii=False, indent=2)
+
+
+# ============= FAULT / LATENCY INJECTION =============
+
+class TokenBucket:
+    """Simple thread-safe token bucket (max_rps <= 0 disables)"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        # En az 1 token birikebilir (0 < max_rps < 1 da istek geçirir)
+        self.capacity = max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        if self.rate <= 0:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+def sample_latency(options, recorded_ms=None):
+    """Latency in seconds for the configured distribution"""
+    base, jitter = options.latency_ms, options.jitter_ms
+    dist = options.latency_dist
+    if dist == 'recorded' and recorded_ms is not None:
+        value = recorded_ms
+    elif dist == 'uniform':
+        value = random.uniform(max(0, base - jitter), base + jitter)
+    elif dist == 'normal':
+        value = random.gauss(base, jitter)
+    elif dist == 'lognormal' and base > 0:
+        # median = base, jitter ≈ yayılım
+        import math
+        sigma = math.log1p(jitter / base) if jitter > 0 else 0
+        value = random.lognormvariate(math.log(base), sigma)
+    else:
+        value = base
+    return max(0.0, value) / 1000.0
+
+
+# ============= HTTP HANDLER =============
+
+class StubHandler(BaseHTTPRequestHandler):
+    server_version = 'ProviderStub/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, fmt, *args):
+        logging.debug("stub: " + fmt % args)
+
+    def _send(self, status, content_type, body, extra_headers=None, head_only=False):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if not head_only:
+            self.wfile.write(body)
+
+    def _count(self, name):
+        stats = self.server.stats
+        with self.server.stats_lock:
+            stats[name] = stats.get(name, 0) + 1
+
+    def do_HEAD(self):
+        self._handle(head_only=True)
+
+    def do_GET(self):
+        self._handle(head_only=False)
+
+    def _handle(self, head_only):
+        parts = urlsplit(self.path)
+        if parts.path == '/_stub/stats':
+            with self.server.stats_lock:
+                body = json.dumps({'mode': self.server.options.mode, **self.server.stats}).encode('utf-8')
+            return self._send(200, 'application/json', body, head_only=head_only)
+
+        route, sub_path = _route_for(parts.path)
+        if not route:
+            return self._send(404, 'text/plain', b'unknown route', head_only=head_only)
+
+        params = parse_qsl(parts.query, keep_blank_values=True)
+        key = _recording_key(route, sub_path, params)
+        self._count(f'{route}_requests')
+
+        if self.server.options.mode == 'record':
+            return self._record(route, sub_path, params, key, head_only)
+        return self._replay(route, key, head_only)
+
+    # ----- record -----
+
+    def _upstream_request(self, route, sub_path, params):
+        if route == 'camgoz':
+            url = CAMGOZ_UPSTREAM_URL.rstrip('/') + sub_path
+            headers = {h: self.headers[h] for h in ('X-JoJAPI-Key',) if self.headers.get(h)}
+            return url, params, headers
+        if route == 'google':
+            return GOOGLE_UPSTREAM_URL, params, {}
+        target = dict(params).get('url', '')
+        return target, None, {'User-Agent': self.headers.get('User-Agent', 'AEU-Brosur-Sistemi/1.0')}
+
+    def _record(self, route, sub_path, params, key, head_only):
+        url, upstream_params, headers = self._upstream_request(route, sub_path, params)
+        if not url.startswith(('http://', 'https://')):
+            return self._send(400, 'text/plain', b'invalid upstream url', head_only=head_only)
+
+        started = time.perf_counter()
+        try:
+            response = requests.get(url, params=upstream_params, headers=headers, timeout=30)
+        except requests.RequestException as e:
+            self._count(f'{route}_upstream_errors')
+            return self._send(502, 'text/plain', str(e).encode('utf-8'), head_only=head_only)
+        latency_ms = (time.perf_counter() - started) * 1000
+
+        request_info = {'path': sub_path, 'params': [(k, v) for k, v in params if k not in IGNORED_PARAMS]}
+        self.server.store.save(route, key, response.status_code, response.headers,
+                               response.content, request_info, latency_ms)
+        self._count(f'{route}_recorded')
+
+        kept = {h: response.headers[h] for h in KEPT_HEADERS[1:] if h in response.headers}
+        return self._send(response.status_code, response.headers.get('Content-Type', 'application/octet-stream'),
+                          response.content, kept, head_only=head_only)
+
+    # ----- replay -----
+
+    def _replay(self, route, key, head_only):
+        options = self.server.options
+        recording = self.server.store.load(route, key)
+
+        time.sleep(sample_latency(options, recording.get('latency_ms') if recording else None))
+
+        if not self.server.bucket.take():
+            self._count('throttled')
+            return self._send(429, 'application/json', b'{"error": "throughput limit"}',
+                              {'Retry-After': '1'}, head_only=head_only)
+
+        roll = random.random()
+        if roll < options.timeout_rate:
+            self._count('injected_timeouts')
+            time.sleep(options.hang_seconds)
+            self.close_connection = True
+            return
+        roll -= options.timeout_rate
+        if roll < options.rate_429:
+            self._count('injected_429')
+            return self._send(429, 'application/json', b'{"error": "rate limit"}',
+                              {'Retry-After': '1', 'X-RateLimit-Remaining': '0'}, head_only=head_only)
+        roll -= options.rate_429
+        if roll < options.error_rate:
+            self._count('injected_errors')
+            return self._send(503, 'application/json', b'{"error": "injected failure"}', head_only=head_only)
+
+        if not recording:
+            self._count(f'{route}_misses')
+            status, content_type, body = MISS_RESPONSES[route]
+            return self._send(status, content_type, body, head_only=head_only)
+
+        self._count(f'{route}_hits')
+        headers = dict(recording.get('headers', {}))
+        content_type = headers.pop('Content-Type', 'application/octet-stream')
+        body = recording['body']
+
+        # Range: bytes=start-end (resim yoklama için)
+        range_header = self.headers.get('Range', '')
+        if route == 'image' and range_header.startswith('bytes='):
+            try:
+                start_s, end_s = range_header[6:].split('-', 1)
+                start = int(start_s or 0)
+                end = min(int(end_s) if end_s else len(body) - 1, len(body) - 1)
+                if start <= end:
+                    headers['Content-Range'] = f'bytes {start}-{end}/{len(body)}'
+                    headers['Accept-Ranges'] = 'bytes'
+                    return self._send(206, content_type, body[start:end + 1], headers, head_only=head_only)
+            except ValueError:
+                pass
+
+        headers['Accept-Ranges'] = 'bytes'
+        return self._send(recording.get('status', 200), content_type, body, headers, head_only=head_only)
+
+
+# ============= SERVER =============
+
+def create_server(options):
+    """Build a ThreadingHTTPServer for the given argparse options"""
+    server = ThreadingHTTPServer((options.host, options.port), StubHandler)
+    server.daemon_threads = True
+    server.options = options
+    server.store = RecordingStore(options.data_dir)
+    server.bucket = TokenBucket(options.max_rps)
+    server.stats = {}
+    server.stats_lock = threading.Lock()
+    return server
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Record/replay stub for CAMGOZ, Google CSE and image hosts')
+    parser.add_argument('mode', choices=['record', 'replay'])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--data-dir', default='stub_data')
+    parser.add_argument('--latency-dist', choices=['fixed', 'uniform', 'normal', 'lognormal', 'recorded'],
+                        default='fixed')
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of 503 responses')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='Fraction of 429 responses')
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help='Fraction of hung requests')
+    parser.add_argument('--hang-seconds', type=float, default=35.0)
+    parser.add_argument('--max-rps', type=float, default=0.0, help='Throughput limit (0 = unlimited)')
+    return parser
+
+
+def main(argv=None):
+    options = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    server = create_server(options)
+    logging.info(f"🧪 Provider stub ({options.mode}) http://{options.host}:{options.port} → {options.data_dir}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+Storage Service - Resim deposu için depolama arka ucu (yerel / S3 uyumlu)
+
+Keys are '/'-separated paths relative to the upload root
+(e.g. 'blobs/ab/cd/<sha256>.png'). Backends implement:
+    put(key, data_or_fileobj, content_type)  - streaming upload
+    put_file(key, path, content_type)
+    get(key) / open(key, start, end)          - full or ranged reads
+    move(src, dst) / delete(key)
+    list(prefix) / stat(key)
+    url(key, expires)                         - public or presigned URL
+
+Configuration (IMAGE_STORAGE_BACKEND):
+- local (default): files under static/uploads, served by Flask
+- s3: any S3-compatible store (AWS, MinIO, R2...) via boto3 (optional
+  dependency); image bytes are served by redirecting to presigned or
+  public URLs so they bypass the Flask workers. A misconfigured or
+  unreachable bucket stops start-up: falling back to local files would
+  silently split the image bank between nodes.
+
+The blob store (services/blob_store.py) mirrors content-addressed blobs to
+the configured backend, so every app node can serve every image.
+"""
+
+import os
+import shutil
+import logging
+import mimetypes
+import threading
+from datetime import datetime
+
+# ============= CONFIGURATION =============
+
+IMAGE_STORAGE_BACKEND = os.environ.get('IMAGE_STORAGE_BACKEND', 'local').lower()
+LOCAL_STORAGE_ROOT = os.path.join('static', 'uploads')
+
+S3_BUCKET = os.environ.get('S3_BUCKET', '')
+S3_PREFIX = os.environ.get('S3_PREFIX', '').strip('/')
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL') or None  # MinIO / R2 için
+S3_REGION = os.environ.get('S3_REGION') or None
+# Ayarlıysa presigned yerine bu adres kullanılır (herkese açık bucket / CDN)
+S3_PUBLIC_BASE_URL = os.environ.get('S3_PUBLIC_BASE_URL', '').rstrip('/')
+S3_PRESIGN_EXPIRES_SECONDS = int(os.environ.get('S3_PRESIGN_EXPIRES_SECONDS', 3600))
+
+CHUNK_SIZE = 64 * 1024
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def _content_type(key, content_type=None):
+    return content_type or mimetypes.guess_type(key)[0] or 'application/octet-stream'
+
+
+# ============= LOCAL =============
+
+class LocalStorage:
+    """Files under a local root directory (default static/uploads)"""
+
+    remote = False
+
+    def __init__(self, root=LOCAL_STORAGE_ROOT, url_prefix='/static/uploads'):
+        self.root = root
+        self.url_prefix = url_prefix.rstrip('/')
+
+    def path(self, key):
+        path = os.path.abspath(os.path.join(self.root, *key.split('/')))
+        if not path.startswith(os.path.abspath(self.root) + os.sep):
+            raise ValueError(f'Invalid storage key: {key}')
+        return path
+
+    def put(self, key, data, content_type=None):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            if isinstance(data, (bytes, bytearray)):
+                f.write(data)
+            else:
+                shutil.copyfileobj(data, f, CHUNK_SIZE)
+        os.replace(tmp, path)
+        return key
+
+    def put_file(self, key, file_path, content_type=None):
+        if os.path.abspath(file_path) == self.path(key):
+            return key
+        with open(file_path, 'rb') as f:
+            return self.put(key, f, content_type)
+
+    def get(self, key):
+        with open(self.path(key), 'rb') as f:
+            return f.read()
+
+    def open(self, key, start=None, end=None):
+        """Iterate the bytes of [start, end] (inclusive, like HTTP Range)"""
+        with open(self.path(key), 'rb') as f:
+            if start:
+                f.seek(start)
+            remaining = None if end is None else end - (start or 0) + 1
+            while remaining is None or remaining > 0:
+                chunk = f.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def move(self, src, dst):
+        dst_path = self.path(dst)
+        os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+        os.replace(self.path(src), dst_path)
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def list(self, prefix=''):
+        base = self.path(prefix.rstrip('/')) if prefix.strip('/') else os.path.abspath(self.root)
+        for root, dirs, files in os.walk(base):
+            dirs.sort()
+            for filename in sorted(files):
+                rel = os.path.relpath(os.path.join(root, filename), os.path.abspath(self.root))
+                yield rel.replace(os.sep, '/')
+
+    def stat(self, key):
+        try:
+            st = os.stat(self.path(key))
+        except (FileNotFoundError, ValueError):
+            return None
+        return {'size': st.st_size, 'modified': datetime.fromtimestamp(st.st_mtime), 'etag': None}
+
+    def url(self, key, expires=None):
+        return f'{self.url_prefix}/{key}'
+
+
+# ============= S3 =============
+
+class S3Storage:
+    """S3-compatible object storage (AWS S3, MinIO, Cloudflare R2...)"""
+
+    remote = True
+
+    def __init__(self, bucket=S3_BUCKET, prefix=S3_PREFIX, endpoint_url=S3_ENDPOINT_URL,
+                 region=S3_REGION, public_base_url=S3_PUBLIC_BASE_URL):
+        try:
+            import boto3
+            from botocore.exceptions import ClientError
+        except ImportError:
+            raise RuntimeError('boto3 is required for IMAGE_STORAGE_BACKEND=s3 (pip install boto3)')
+        if not bucket:
+            raise RuntimeError('S3_BUCKET is not set')
+
+        self._client_error = ClientError
+        self.client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region)
+        self.bucket = bucket
+        self.prefix = prefix
+        self.public_base_url = public_base_url
+
+    def _key(self, key):
+        return f'{self.prefix}/{key}' if self.prefix else key
+
+    def check(self):
+        """Raise unless the bucket is reachable with the configured credentials"""
+        self.client.head_bucket(Bucket=self.bucket)
+
+    def put(self, key, data, content_type=None):
+        extra = {'ContentType': _content_type(key, content_type)}
+        if isinstance(data, (bytes, bytearray)):
+            self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=bytes(data), **extra)
+        else:
+            # Çok parçalı (multipart) akış yüklemesi; dosya belleğe alınmaz
+            self.client.upload_fileobj(data, self.bucket, self._key(key), ExtraArgs=extra)
+        return key
+
+    def put_file(self, key, file_path, content_type=None):
+        self.client.upload_file(file_path, self.bucket, self._key(key),
+                                ExtraArgs={'ContentType': _content_type(key, content_type)})
+        return key
+
+    def get(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=self._key(key))['Body'].read()
+
+    def open(self, key, start=None, end=None):
+        """Iterate the bytes of [start, end] (inclusive) using a ranged GET"""
+        params = {'Bucket': self.bucket, 'Key': self._key(key)}
+        if start is not None or end is not None:
+            params['Range'] = f"bytes={start or 0}-{'' if end is None else end}"
+        body = self.client.get_object(**params)['Body']
+        try:
+            for chunk in body.iter_chunks(CHUNK_SIZE):
+                yield chunk
+        finally:
+            body.close()
+
+    def move(self, src, dst):
+        # S3'te yeniden adlandırma yok: sunucu tarafı kopya + silme
+        self.client.copy_object(Bucket=self.bucket, Key=self._key(dst),
+                                CopySource={'Bucket': self.bucket, 'Key': self._key(src)})
+        self.delete(src)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+        return True
+
+    def list(self, prefix=''):
+        paginator = self.client.get_paginator('list_objects_v2')
+        strip = len(self.prefix) + 1 if self.prefix else 0
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            for item in page.get('Contents', []):
+                yield item['Key'][strip:]
+
+    def stat(self, key):
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except self._client_error as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+        return {'size': head['ContentLength'], 'modified': head['LastModified'],
+                'etag': head.get('ETag', '').strip('"')}
+
+    def url(self, key, expires=None):
+        if self.public_base_url:
+            return f'{self.public_base_url}/{self._key(key)}'
+        return self.client.generate_presigned_url(
+            'get_object', Params={'Bucket': self.bucket, 'Key': self._key(key)},
+            ExpiresIn=expires or S3_PRESIGN_EXPIRES_SECONDS)
+
+
+# ============= FACTORY =============
+
+def get_storage():
+    """
+    Configured storage backend (one instance per process).
+
+    Raises:
+        RuntimeError: IMAGE_STORAGE_BACKEND=s3 but the bucket is not usable
+    """
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                if IMAGE_STORAGE_BACKEND == 's3':
+                    try:
+                        storage = S3Storage()
+                        storage.check()
+                    except Exception as e:
+                        logging.error(f"❌ S3 storage unavailable: {e}")
+                        raise RuntimeError(f'IMAGE_STORAGE_BACKEND=s3 is not usable: {e}') from e
+                    _storage = storage
+                    logging.info(f"✅ Image storage: S3 ({S3_BUCKET}, endpoint={S3_ENDPOINT_URL or 'aws'})")
+                elif IMAGE_STORAGE_BACKEND == 'local':
+                    _storage = LocalStorage()
+                else:
+                    raise RuntimeError(f'Unknown IMAGE_STORAGE_BACKEND: {IMAGE_STORAGE_BACKEND}')
+    return _storage
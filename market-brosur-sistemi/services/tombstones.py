@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+"""
+Tombstones Service - Asenkron ürün silme (mezar taşı + arka plan temizleyici)
+
+Deleting a product used to walk every depot, customer folder and the cache
+inside the request. Now:
+
+1. tombstone_product (in the request): one transaction inserts a row in
+   product_tombstones and deletes the barcode's DB rows (products,
+   customer_images, admin_images, admin_products, barcode_verifications).
+   Depot images indexed before the tombstone are hidden from every index
+   read at once (depot_index.NOT_TOMBSTONED).
+2. reap_tombstones (background thread, every TOMBSTONE_REAP_INTERVAL_SECONDS,
+   woken right after a delete): removes the barcode's files found through
+   the depot index, TOMBSTONE_REAP_BATCH files per run, then its barcode
+   folders and lookup cache files. Failures are retried with exponential
+   backoff up to TOMBSTONE_MAX_ATTEMPTS (then status 'failed'; the barcode
+   stays hidden and an admin can retry).
+
+Images uploaded for the barcode after the tombstone are neither hidden nor
+removed. Finished tombstones stay as the audit record (who, when, what was
+removed).
+
+CLI:
+    python -m services.tombstones reap
+    python -m services.tombstones list [--status failed]
+"""
+
+import os
+import glob
+import json
+import time
+import shutil
+import sqlite3
+import logging
+import argparse
+import threading
+from datetime import datetime, timedelta
+
+import database
+from services.depot_index import (
+    TIMESTAMP_FORMAT,
+    UPLOAD_ROOT,
+    to_fs_path,
+    index_transaction,
+    remove_image
+)
+
+# ============= CONFIGURATION =============
+
+TOMBSTONE_REAP_INTERVAL_SECONDS = int(os.environ.get('TOMBSTONE_REAP_INTERVAL_SECONDS', 30))
+TOMBSTONE_REAP_BATCH = int(os.environ.get('TOMBSTONE_REAP_BATCH', 200))
+TOMBSTONE_MAX_ATTEMPTS = int(os.environ.get('TOMBSTONE_MAX_ATTEMPTS', 5))
+TOMBSTONE_RETRY_BASE_SECONDS = int(os.environ.get('TOMBSTONE_RETRY_BASE_SECONDS', 60))
+# Bir worker'ın kaydı sahiplenme süresi (çökerse başka worker devralır)
+TOMBSTONE_CLAIM_SECONDS = 300
+
+PRODUCT_TABLES = ['products', 'customer_images', 'admin_images', 'admin_products', 'barcode_verifications']
+CACHE_PATH = os.path.join(UPLOAD_ROOT, 'cache')
+CACHE_EXTENSIONS = ('.json', '.png', '.jpg', '.jpeg')
+
+_reaper_thread = None
+_wake = threading.Event()
+
+
+def _now():
+    # depot_images.updated_at ile aynı biçim (karşılaştırılıyor)
+    return datetime.now().strftime(TIMESTAMP_FORMAT)
+
+
+def _row(row):
+    row = dict(row)
+    row['stats'] = json.loads(row['stats'] or '{}')
+    return row
+
+
+# ============= DELETE =============
+
+def tombstone_product(barcode, requested_by=None, source=None):
+    """
+    Mark a barcode deleted: hide its depot images, delete its DB rows and
+    queue the file cleanup.
+
+    Returns:
+        dict: {'success', 'tombstone_id', 'rows_deleted'} or
+              {'success': False, 'error': 'not_found'}
+    """
+    barcode = str(barcode).strip()
+    now = _now()
+    with database.get_db() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows_deleted = {}
+            for table in PRODUCT_TABLES:
+                try:
+                    count = conn.execute(f"DELETE FROM {table} WHERE barcode = ?", (barcode,)).rowcount
+                except sqlite3.OperationalError as e:
+                    logging.warning(f"Could not delete from {table}: {e}")
+                    continue
+                if count:
+                    rows_deleted[table] = count
+
+            has_images = conn.execute("SELECT 1 FROM depot_images WHERE barcode = ? LIMIT 1", (barcode,)).fetchone()
+            if not rows_deleted and not has_images:
+                conn.rollback()
+                return {'success': False, 'error': 'not_found'}
+
+            stats = json.dumps({'rows_deleted': rows_deleted})
+            active = conn.execute("SELECT id FROM product_tombstones WHERE barcode = ? AND status != 'done'",
+                                  (barcode,)).fetchone()
+            if active:
+                # Tekrar silme: kapsamı şimdiye genişlet, denemeleri sıfırla
+                conn.execute('''UPDATE product_tombstones SET created_at = ?, status = 'pending', attempts = 0,
+                                       last_error = NULL, next_attempt_at = ?, requested_by = ?, source = ?
+                                WHERE id = ?''', (now, now, requested_by, source, active['id']))
+                tombstone_id = active['id']
+            else:
+                tombstone_id = conn.execute('''INSERT INTO product_tombstones
+                                                   (barcode, requested_by, source, stats, created_at, next_attempt_at)
+                                               VALUES (?, ?, ?, ?, ?, ?)''',
+                                            (barcode, requested_by, source, stats, now, now)).lastrowid
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    logging.info(f"🪦 Product tombstoned: {barcode} (#{tombstone_id}, rows: {rows_deleted})")
+    _wake.set()
+    return {'success': True, 'tombstone_id': tombstone_id, 'rows_deleted': rows_deleted}
+
+
+# ============= REAPER =============
+
+def _claim(tombstone_id):
+    now = time.time()
+    with database.get_db() as conn:
+        claimed = conn.execute('''UPDATE product_tombstones SET claimed_until = ?
+                                  WHERE id = ? AND status = 'pending'
+                                    AND (claimed_until IS NULL OR claimed_until < ?)''',
+                               (now + TOMBSTONE_CLAIM_SECONDS, tombstone_id, now)).rowcount
+        conn.commit()
+    return bool(claimed)
+
+
+def _remove_cache_files(barcode):
+    removed = 0
+    for path in glob.glob(os.path.join(CACHE_PATH, f'{glob.escape(barcode)}_*')):
+        if path.endswith(CACHE_EXTENSIONS):
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+def _reap_one(tombstone, batch_size, delta):
+    """
+    Remove up to batch_size files of one tombstone, counting into `delta`
+    (kept on failure too, for the audit stats).
+
+    Returns:
+        bool: True when nothing is left to remove
+    """
+    with database.get_db() as conn:
+        rows = conn.execute('''SELECT rel_path FROM depot_images
+                               WHERE barcode = ? AND updated_at <= ? ORDER BY rel_path LIMIT ?''',
+                            (tombstone['barcode'], tombstone['created_at'], batch_size)).fetchall()
+
+    folders = {}
+    for row in rows:
+        folders.setdefault(row['rel_path'].rsplit('/', 1)[0], []).append(row['rel_path'])
+
+    for folder_rel, rel_paths in folders.items():
+        # Klasör silinemezse indeks değişikliği geri alınır: sonraki deneme aynı satırları bulur
+        with index_transaction() as conn:
+            for rel_path in rel_paths:
+                remove_image(rel_path, conn=conn)
+                try:
+                    os.remove(to_fs_path(rel_path))
+                except FileNotFoundError:
+                    pass
+            remaining = [r['rel_path'] for r in conn.execute(
+                "SELECT rel_path FROM depot_images WHERE rel_path >= ? AND rel_path < ?",
+                (folder_rel + '/', folder_rel + '0'))]
+            # Mezar taşından sonra yüklenmiş resim kaldıysa klasöre dokunma
+            folder = to_fs_path(folder_rel)
+            removed_folder = False
+            if not any('/' not in r[len(folder_rel) + 1:] for r in remaining) and os.path.isdir(folder):
+                shutil.rmtree(folder)
+                removed_folder = True
+        delta['files_removed'] += len(rel_paths)
+        delta['folders_removed'] += int(removed_folder)
+
+    finished = len(rows) < batch_size
+    if finished:
+        delta['cache_files_removed'] = _remove_cache_files(tombstone['barcode'])
+    return finished
+
+
+def _merge_stats(old, delta):
+    merged = dict(old)
+    for key, value in delta.items():
+        merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def reap_tombstones(limit=None, batch_size=None):
+    """
+    Process due tombstones (status 'pending', next_attempt_at reached).
+
+    Returns:
+        dict: {'success', 'processed', 'completed', 'failed'}
+    """
+    batch_size = batch_size or TOMBSTONE_REAP_BATCH
+    stats = {'processed': 0, 'completed': 0, 'failed': 0}
+    with database.get_db() as conn:
+        due = conn.execute('''SELECT * FROM product_tombstones
+                              WHERE status = 'pending' AND next_attempt_at <= ?
+                              ORDER BY id LIMIT ?''', (_now(), limit or 20)).fetchall()
+
+    for tombstone in due:
+        if not _claim(tombstone['id']):
+            continue
+        stats['processed'] += 1
+        old_stats = json.loads(tombstone['stats'] or '{}')
+        delta = {'files_removed': 0, 'folders_removed': 0, 'cache_files_removed': 0}
+        try:
+            finished = _reap_one(tombstone, batch_size, delta)
+            # Bu sırada barkod tekrar silindiyse (created_at değişti) kayıt açık kalır
+            done = finished
+            with database.get_db() as conn:
+                done = finished and conn.execute('''UPDATE product_tombstones SET status = 'done', completed_at = ?
+                                                    WHERE id = ? AND created_at = ?''',
+                                                 (_now(), tombstone['id'], tombstone['created_at'])).rowcount > 0
+                conn.execute("UPDATE product_tombstones SET stats = ?, claimed_until = NULL WHERE id = ?",
+                             (json.dumps(_merge_stats(old_stats, delta)), tombstone['id']))
+                conn.commit()
+            if done:
+                stats['completed'] += 1
+                logging.info(f"🪦 Tombstone #{tombstone['id']} ({tombstone['barcode']}) tamamlandı")
+        except Exception as e:
+            attempts = tombstone['attempts'] + 1
+            give_up = attempts >= TOMBSTONE_MAX_ATTEMPTS
+            retry_at = datetime.now() + timedelta(seconds=TOMBSTONE_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+            with database.get_db() as conn:
+                conn.execute('''UPDATE product_tombstones SET attempts = ?, last_error = ?, claimed_until = NULL,
+                                       status = ?, next_attempt_at = ?, stats = ?
+                                WHERE id = ?''',
+                             (attempts, str(e), 'failed' if give_up else 'pending',
+                              retry_at.strftime(TIMESTAMP_FORMAT),
+                              json.dumps(_merge_stats(old_stats, delta)), tombstone['id']))
+                conn.commit()
+            stats['failed'] += 1
+            logging.error(f"❌ Tombstone #{tombstone['id']} ({tombstone['barcode']}) deneme {attempts}: {e}")
+
+    return {'success': True, **stats}
+
+
+def retry_tombstone(tombstone_id):
+    """Re-queue a failed tombstone"""
+    with database.get_db() as conn:
+        updated = conn.execute('''UPDATE product_tombstones SET status = 'pending', attempts = 0,
+                                         next_attempt_at = ?, claimed_until = NULL
+                                  WHERE id = ? AND status = 'failed' ''', (_now(), tombstone_id)).rowcount
+        conn.commit()
+    if updated:
+        _wake.set()
+    return bool(updated)
+
+
+def list_tombstones(status=None, barcode=None, limit=100):
+    """Recent tombstones (newest first) - the deletion audit log"""
+    query, params = "SELECT * FROM product_tombstones WHERE 1 = 1", []
+    if status:
+        query += " AND status = ?"
+        params.append(status)
+    if barcode:
+        query += " AND barcode = ?"
+        params.append(str(barcode))
+    query += " ORDER BY id DESC LIMIT ?"
+    params.append(int(limit))
+    with database.get_db() as conn:
+        return [_row(row) for row in conn.execute(query, params).fetchall()]
+
+
+def start_tombstone_reaper():
+    """Start the background reaper thread (once per process)"""
+    global _reaper_thread
+    if _reaper_thread and _reaper_thread.is_alive():
+        return False
+
+    def loop():
+        while True:
+            _wake.wait(TOMBSTONE_REAP_INTERVAL_SECONDS)
+            _wake.clear()
+            try:
+                # Büyük silmeler: parti parti, iş kalmayana kadar
+                while reap_tombstones()['processed']:
+                    pass
+            except Exception as e:
+                logging.error(f"❌ Tombstone reaper error: {e}")
+
+    _reaper_thread = threading.Thread(target=loop, name='tombstone-reaper', daemon=True)
+    _reaper_thread.start()
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Product tombstones: background file cleanup and audit log')
+    parser.add_argument('command', choices=['reap', 'list'])
+    parser.add_argument('--status', choices=['pending', 'failed', 'done'])
+    parser.add_argument('--limit', type=int, default=100)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    database.init_db()
+    if args.command == 'list':
+        print(json.dumps(list_tombstones(args.status, limit=args.limit), ensure_ascii=False, indent=2))
+        return 0
+
+    total = {'processed': 0, 'completed': 0, 'failed': 0}
+    while True:
+        result = reap_tombstones()
+        for key in total:
+            total[key] += result[key]
+        if not result['processed']:
+            break
+    print(json.dumps({'success': True, **total}, ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -22,6 +22,10 @@ function buildFsImageUrl(product, size = 'thumb') {
         customer_id: product.customer_id || '',
         size
     });
+    if (product.image_version) {
+        // İçerik hash'i: resim değişince adres de değişir, tarayıcı önbelleği güvenle kullanılır
+        params.set('v', product.image_version);
+    }
     return `/admin/get-image?${params.toString()}`;
 }
 
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+S3Storage and the blob store's remote paths against an in-process S3
+stand-in (moto server, MinIO-compatible API).
+
+    pip install -e .[s3,test]
+    python -m pytest -q tests
+"""
+
+import io
+import os
+import uuid
+
+import pytest
+import requests
+
+boto3 = pytest.importorskip('boto3')
+moto_server = pytest.importorskip('moto.server')
+
+from botocore.exceptions import ClientError
+
+import database
+from services import storage, blob_store, depot_index
+
+
+@pytest.fixture(scope='module')
+def s3_endpoint():
+    server = moto_server.ThreadedMotoServer(ip_address='127.0.0.1', port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    yield f'http://{host}:{port}'
+    server.stop()
+
+
+@pytest.fixture
+def s3(s3_endpoint, monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'test')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'test')
+    bucket = f'brosur-{uuid.uuid4().hex[:8]}'
+    boto3.client('s3', endpoint_url=s3_endpoint, region_name='us-east-1').create_bucket(Bucket=bucket)
+    return storage.S3Storage(bucket=bucket, prefix='images', endpoint_url=s3_endpoint, region='us-east-1',
+                             public_base_url='')
+
+
+@pytest.fixture
+def app_dir(tmp_path, monkeypatch):
+    """Empty working directory with a fresh database (relative upload paths)"""
+    monkeypatch.chdir(tmp_path)
+    database.init_db()
+    return tmp_path
+
+
+@pytest.fixture
+def remote(s3, monkeypatch):
+    """Make get_storage() return the S3 stand-in"""
+    monkeypatch.setattr(storage, '_storage', s3)
+    return s3
+
+
+# ============= S3Storage =============
+
+def test_put_get_stat(s3):
+    s3.put('blobs/ab/cd/x.png', b'hello world', 'image/png')
+    assert s3.get('blobs/ab/cd/x.png') == b'hello world'
+    info = s3.stat('blobs/ab/cd/x.png')
+    assert info['size'] == 11
+    assert info['etag']
+    head = s3.client.head_object(Bucket=s3.bucket, Key='images/blobs/ab/cd/x.png')
+    assert head['ContentType'] == 'image/png'
+
+
+def test_stat_missing_is_none(s3):
+    assert s3.stat('blobs/missing.png') is None
+
+
+def test_get_missing_raises(s3):
+    with pytest.raises(ClientError):
+        s3.get('blobs/missing.png')
+
+
+def test_put_streaming_multipart(s3):
+    # upload_fileobj çok parçalı yükleme eşiğinin (8 MB) üstünde
+    data = os.urandom(9 * 1024 * 1024)
+    s3.put('big.bin', io.BytesIO(data))
+    assert s3.stat('big.bin')['size'] == len(data)
+    assert s3.get('big.bin') == data
+
+
+def test_put_file(s3, tmp_path):
+    path = tmp_path / 'a.jpg'
+    path.write_bytes(b'\xff\xd8jpeg')
+    s3.put_file('a.jpg', str(path))
+    assert s3.get('a.jpg') == b'\xff\xd8jpeg'
+    head = s3.client.head_object(Bucket=s3.bucket, Key='images/a.jpg')
+    assert head['ContentType'] == 'image/jpeg'
+
+
+@pytest.mark.parametrize('start, end, expected', [
+    (None, None, b'0123456789'),
+    (2, 5, b'2345'),
+    (7, None, b'789'),
+    (0, 0, b'0'),
+])
+def test_open_ranges(s3, start, end, expected):
+    s3.put('range.bin', b'0123456789')
+    assert b''.join(s3.open('range.bin', start, end)) == expected
+
+
+def test_move(s3):
+    s3.put('old/x.png', b'abc')
+    s3.move('old/x.png', 'new/x.png')
+    assert s3.stat('old/x.png') is None
+    assert s3.get('new/x.png') == b'abc'
+
+
+def test_delete(s3):
+    s3.put('gone.png', b'abc')
+    assert s3.delete('gone.png') is True
+    assert s3.stat('gone.png') is None
+
+
+def test_list_strips_prefix(s3):
+    for key in ('blobs/aa/1.png', 'blobs/bb/2.png', 'other/3.png'):
+        s3.put(key, b'x')
+    assert sorted(s3.list('blobs/')) == ['blobs/aa/1.png', 'blobs/bb/2.png']
+    assert sorted(s3.list()) == ['blobs/aa/1.png', 'blobs/bb/2.png', 'other/3.png']
+
+
+def test_presigned_url(s3):
+    s3.put('p.png', b'presigned')
+    response = requests.get(s3.url('p.png', expires=60), timeout=10)
+    assert response.status_code == 200
+    assert response.content == b'presigned'
+
+
+def test_public_url(s3):
+    s3.public_base_url = 'https://cdn.example.com'
+    assert s3.url('p.png') == 'https://cdn.example.com/images/p.png'
+
+
+# ============= get_storage =============
+
+def test_get_storage_refuses_misconfigured_s3(monkeypatch):
+    monkeypatch.setattr(storage, '_storage', None)
+    monkeypatch.setattr(storage, 'IMAGE_STORAGE_BACKEND', 's3')
+    monkeypatch.setattr(storage.S3Storage.__init__, '__defaults__', ('', '', None, None, ''))
+    with pytest.raises(RuntimeError):
+        storage.get_storage()
+    assert storage._storage is None
+
+
+def test_get_storage_refuses_missing_bucket(s3, monkeypatch):
+    monkeypatch.setattr(storage, '_storage', None)
+    monkeypatch.setattr(storage, 'IMAGE_STORAGE_BACKEND', 's3')
+    monkeypatch.setattr(storage.S3Storage.__init__, '__defaults__',
+                        ('no-such-bucket', '', s3.client.meta.endpoint_url, 'us-east-1', ''))
+    with pytest.raises(RuntimeError):
+        storage.get_storage()
+
+
+def test_get_storage_unknown_backend(monkeypatch):
+    monkeypatch.setattr(storage, '_storage', None)
+    monkeypatch.setattr(storage, 'IMAGE_STORAGE_BACKEND', 'ftp')
+    with pytest.raises(RuntimeError):
+        storage.get_storage()
+
+
+# ============= BLOB STORE =============
+
+def _store_depot_image(data, barcode='8690000000001'):
+    dest = os.path.join('static', 'uploads', 'admin', 'supermarket', 'Genel', barcode, 'product.png')
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    with depot_index.index_transaction() as conn:
+        content_hash = blob_store.write_depot_file(dest, data)
+        depot_index.index_image(dest, conn=conn, content_hash=content_hash)
+    return dest, content_hash
+
+
+def test_write_mirrors_blob(app_dir, remote):
+    dest, content_hash = _store_depot_image(b'mirrored bytes')
+    key = blob_store.blob_key(content_hash, '.png')
+    assert remote.get(key) == b'mirrored bytes'
+    response = requests.get(blob_store.blob_url(content_hash), timeout=10)
+    assert response.content == b'mirrored bytes'
+
+
+def test_ensure_local_blob_downloads_missing_blob(app_dir, remote):
+    dest, content_hash = _store_depot_image(b'only on the remote')
+    local = blob_store.blob_path(content_hash, '.png')
+    os.remove(local)
+    os.remove(dest)
+
+    path = blob_store.ensure_local_blob(content_hash)
+    assert path == local
+    with open(path, 'rb') as f:
+        assert f.read() == b'only on the remote'
+
+    image = depot_index.find_image_by_path(dest)
+    assert blob_store.local_image_path(image) == local
+
+
+def test_ensure_local_blob_missing_everywhere(app_dir, remote):
+    dest, content_hash = _store_depot_image(b'lost')
+    os.remove(blob_store.blob_path(content_hash, '.png'))
+    remote.delete(blob_store.blob_key(content_hash, '.png'))
+    assert blob_store.ensure_local_blob(content_hash) is None
+
+
+def test_sync_blobs_uploads_local_only_blobs(app_dir, s3, monkeypatch):
+    monkeypatch.setattr(storage, '_storage', storage.LocalStorage())
+    dest, content_hash = _store_depot_image(b'written before s3')
+    monkeypatch.setattr(storage, '_storage', s3)
+    assert s3.stat(blob_store.blob_key(content_hash, '.png')) is None
+
+    result = blob_store.sync_blobs()
+    assert result['uploaded'] == 1
+    assert s3.get(blob_store.blob_key(content_hash, '.png')) == b'written before s3'
+    assert blob_store.sync_blobs()['present'] == 1